@@ -0,0 +1,78 @@
+import asyncio
+import json
+import re
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_FIELD_PATTERN = r'"{}":\s*"?([^",\n}}]*)'
+
+def _field(prompt: str, name: str, default: str) -> str:
+    match = re.search(_FIELD_PATTERN.format(name), prompt)
+    return match.group(1).strip() if match else default
+
+
+class FakePlanLLM(BaseChatModel):
+    """
+    Modelo de chat local que responde con un plan técnico JSON válido tras una latencia
+    configurable: `latency` hasta el primer token y `tokens_per_second` para el resto
+    (los "tokens" son fragmentos de `chunk_size` caracteres).
+    """
+    latency: float = 1.0
+    tokens_per_second: float = 200.0
+    chunk_size: int = 16
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-plan"
+
+    def _plan_text(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        time_budget = float(_field(prompt, "time", "8") or 8)
+        plan = [{
+            "story_id": _field(prompt, "id", "STORY-BENCH"),
+            "story_title": _field(prompt, "title", "Historia"),
+            "ml_estimate_accepted": True,
+            "effort": float(_field(prompt, "effort", "5") or 5),
+            "time": time_budget,
+            "overall_complexity": "Medium",
+            "action_plan": {
+                "description": "Plan generado por el LLM falso de los benchmarks.",
+                "tasks": [
+                    {"task_name": f"{i}. Tarea {i}", "estimated_hours": round(time_budget / 4, 2),
+                     "details": "Implementar, probar y documentar el cambio descrito en la historia."}
+                    for i in range(1, 5)
+                ],
+            },
+            "key_considerations": ["Reutilizar los componentes existentes.", "Cubrir los casos de error."],
+            "risks_and_dependencies": {"dependencies": ["API interna"], "risks": ["Cambios de alcance."]},
+        }]
+        return json.dumps(plan, ensure_ascii=False)
+
+    def _chunks(self, text: str) -> List[str]:
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+    def _chunk_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = self._plan_text(messages)
+        time.sleep(self.latency + self._chunk_delay() * len(self._chunks(text)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = self._plan_text(messages)
+        await asyncio.sleep(self.latency + self._chunk_delay() * len(self._chunks(text)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._plan_text(messages)):
+            await asyncio.sleep(self._chunk_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
@@ -0,0 +1,272 @@
+"""
+Benchmark de extremo a extremo sin red: búsqueda, páginas y LLM se sustituyen por
+servidores y modelos locales (benchmarks/stubs.py, benchmarks/fake_llm.py), mientras
+que la extracción de características, la predicción, la investigación y el grafo
+completo de /generate_plan/ son el código real.
+
+    cd digital-twin
+    python -m benchmarks.run --requests 100 --concurrency 8 --output benchmarks/baselines/main.json
+    python -m benchmarks.run --compare benchmarks/baselines/main.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Las claves sólo tienen que existir: todas las peticiones van a los servidores locales.
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("GOOGLE_CX", "benchmark")
+# Los stubs son locales: sin ritmo por API key ni por host, se mide el código y no la espera.
+os.environ.setdefault("SEARCH_RATE_PER_SECOND", "0")
+os.environ.setdefault("HOST_RATE_PER_SECOND", "0")
+
+from config import MODEL_PATH, extract_features
+
+STAGES = ['extract_features', 'prediction', 'research', 'llm', 'graph']
+DATASET_PATH = 'model/stories_dataset.csv'
+TECH_STACK_FILE = 'model/tech_stack.json'
+KEYWORDS = [["react", "pdf"], ["nestjs", "s3"], ["mongodb"], ["jwt", "api"], ["notificación", "push"], []]
+
+def load_stories(n: int) -> List[dict]:
+    df = pd.read_csv(DATASET_PATH)
+    stories = []
+    for i in range(n):
+        row = df.iloc[i % len(df)]
+        # Se añade el número de vuelta al título para que las predicciones no se repitan.
+        lap = f" ({i // len(df)})" if i >= len(df) else ""
+        stories.append({"id": f"BENCH-{i}", "title": f"{row['title']}{lap}", "gherkin": row['gherkin'],
+                        "keywords": KEYWORDS[i % len(KEYWORDS)]})
+    return stories
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KiB y macOS en bytes.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def summarize(latencies: List[float], errors: int, wall_seconds: float) -> Dict[str, float]:
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / wall_seconds if wall_seconds > 0 else 0.0,
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+async def drive(items: list, concurrency: int, call: Callable[[dict], Awaitable]) -> Dict[str, float]:
+    """Lanza `call` sobre cada elemento con como máximo `concurrency` llamadas en curso."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(item):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(item)
+            except Exception as e:
+                errors += 1
+                logging.getLogger(__name__).warning(f"Error en el benchmark: {e}")
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in items))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+class StageTimer:
+    """Envuelve métodos de los servicios para medir cada etapa dentro del grafo."""
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+
+    def wrap_async(self, name: str, func):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        return timed
+
+    def wrap_sync(self, name: str, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        return timed
+
+async def run_benchmarks(args) -> dict:
+    from benchmarks.fake_llm import FakePlanLLM
+    from benchmarks.stubs import StubServers
+
+    stories = load_stories(args.requests)
+    results: Dict[str, Dict[str, float]] = {}
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    loop = asyncio.get_running_loop()
+
+    def make_prediction_service():
+        from prediction import PredictionService
+        # Sin caché: cada historia pasa por spaCy y el modelo.
+        return PredictionService(model_path=args.model, cache_size=0, cache_path=None)
+
+    def make_research_service(search_url: str):
+        from research import ResearchService
+        return ResearchService(tech_stack_file=TECH_STACK_FILE, cache_path=args.research_cache or None,
+                               search_url=search_url)
+
+    def make_llm():
+        from reasoner import LLMPlanGenerator
+        return LLMPlanGenerator(llm=FakePlanLLM(latency=args.llm_latency, tokens_per_second=args.llm_tps))
+
+    async with StubServers(search_latency=args.search_latency, page_latency=args.page_latency,
+                           js_ratio=args.js_ratio) as stubs:
+        if 'extract_features' in args.stages:
+            # Etapa síncrona y sin E/S: se mide en serie, una historia por llamada (como en el servicio).
+            async def featurize(story):
+                extract_features(pd.DataFrame([story]))
+            results['extract_features'] = await drive(stories, 1, featurize)
+
+        if 'prediction' in args.stages:
+            prediction_service = make_prediction_service()
+            results['prediction'] = await drive(
+                stories, args.concurrency,
+                lambda story: loop.run_in_executor(executor, prediction_service.predict, story)
+            )
+
+        if 'research' in args.stages:
+            research_service = make_research_service(stubs.search_url)
+            results['research'] = await drive(
+                stories, args.concurrency,
+                lambda story: research_service.conduct_research(story["title"], story["keywords"])
+            )
+            await research_service.close()
+
+        if 'llm' in args.stages:
+            llm = make_llm()
+            ml_estimate = {"effort": 5.0, "time": 8.0, "budget_hours": 8.0}
+            results['llm'] = await drive(
+                stories, args.concurrency,
+                lambda story: llm.agenerate_plan(story, ml_estimate, {"summary": ""})
+            )
+
+        if 'graph' in args.stages:
+            results.update(await run_graph_benchmark(args, stories, stubs, make_prediction_service,
+                                                     make_research_service, make_llm))
+
+        stub_requests = dict(stubs.requests)
+
+    executor.shutdown(wait=False)
+    return {
+        "name": args.name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "stages": results,
+        "stub_requests": stub_requests,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+async def run_graph_benchmark(args, stories, stubs, make_prediction_service, make_research_service, make_llm) -> dict:
+    """/generate_plan/ de extremo a extremo (FastAPI + LangGraph), con el tiempo de cada nodo."""
+    import httpx
+    import main
+    from startup import LazyService
+
+    timer = StageTimer()
+    prediction_service = make_prediction_service()
+    prediction_service.predict = timer.wrap_sync('graph.prediction', prediction_service.predict)
+    research_service = make_research_service(stubs.search_url)
+    research_service.conduct_research = timer.wrap_async('graph.research', research_service.conduct_research)
+    llm = make_llm()
+    llm.agenerate_plan = timer.wrap_async('graph.llm', llm.agenerate_plan)
+
+    main.prediction_service = LazyService("prediction", lambda: prediction_service)
+    main.research_service = LazyService("research", lambda: research_service)
+    main.llm_plan_generator = LazyService("llm", lambda: llm)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        async def call(story):
+            response = await client.post("/generate_plan/", json={"story_data": story})
+            response.raise_for_status()
+
+        start = time.perf_counter()
+        results = {'graph': await drive(stories, args.concurrency, call)}
+        wall = time.perf_counter() - start
+    await research_service.close()
+
+    for name, latencies in timer.latencies.items():
+        results[name] = summarize(latencies, 0, wall)
+    return results
+
+def compare(current: dict, baseline: dict, max_regression: float) -> bool:
+    """Imprime la variación frente a la línea base; devuelve False si algún p95 empeora demasiado."""
+    ok = True
+    print(f"{'etapa':<20}{'p50':>12}{'p95':>12}{'p99':>12}{'rps':>12}")
+    for stage, stats in current["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if base is None:
+            continue
+        deltas = [(stats[key] - base[key]) / base[key] if base[key] else 0.0
+                  for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')]
+        print(f"{stage:<20}" + "".join(f"{delta:>+12.1%}" for delta in deltas))
+        if deltas[1] > max_regression:
+            ok = False
+    return ok
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline de planificación.")
+    parser.add_argument('--name', default='local')
+    parser.add_argument('--stages', default=",".join(STAGES), type=lambda value: value.split(','),
+                        help=f"Etapas separadas por comas (por defecto: {','.join(STAGES)}).")
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--research-cache', default='', help="Ruta SQLite de la caché de investigación (vacío: sin caché).")
+    parser.add_argument('--llm-latency', type=float, default=1.0, help="Segundos hasta el primer token del LLM falso.")
+    parser.add_argument('--llm-tps', type=float, default=200.0, help="Fragmentos por segundo del LLM falso.")
+    parser.add_argument('--search-latency', type=float, default=0.1)
+    parser.add_argument('--page-latency', type=float, default=0.05)
+    parser.add_argument('--js-ratio', type=float, default=0.25, help="Fracción de resultados que requieren JavaScript.")
+    parser.add_argument('--output', help="Fichero JSON donde guardar los resultados (línea base).")
+    parser.add_argument('--compare', help="Línea base JSON con la que comparar.")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Empeoramiento máximo tolerado del p95 frente a la línea base (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run_benchmarks(args))
+
+    print(json.dumps(report["stages"], indent=2))
+    print(f"Peticiones a los stubs: {report['stub_requests']}; RSS pico: {report['peak_rss_mb']:.1f} MB")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
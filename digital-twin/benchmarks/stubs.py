@@ -0,0 +1,125 @@
+import asyncio
+import json
+import socket
+import zlib
+from collections import Counter
+from aiohttp import web
+
+# Frases con vocabulario técnico habitual en las historias, para que el resumen de la
+# investigación encuentre coincidencias igual que con documentación real.
+DOC_SENTENCES = [
+    "React renders the report view and NestJS exposes the REST endpoint that builds the PDF export.",
+    "MongoDB stores each sales record; an aggregation pipeline groups them by date range before exporting.",
+    "Para enviar una notificación push, el servicio publica un mensaje en la cola y el cliente móvil lo recibe.",
+    "La autenticación con JWT valida el token en cada petición al API antes de acceder a la base de datos.",
+    "Upload the avatar image to AWS S3 with a presigned URL and store only the object key in the profile.",
+    "Jest tests mock the payment gateway so checkout errors can be verified without calling Stripe.",
+    "TypeScript interfaces describe the DTOs shared by the React Native app and the backend services.",
+    "El dashboard muestra métricas en tiempo real mediante WebSockets y gráficos que se actualizan solos.",
+    "Error handling middleware maps validation failures to HTTP 400 responses with a readable message.",
+    "Para exportar a CSV o Excel se genera el fichero en segundo plano y se envía un enlace por correo.",
+]
+
+def docs_page(path: str, paragraphs: int = 12) -> str:
+    """Página de documentación determinista (según `path`) con navegación, scripts y contenido."""
+    offset = zlib.crc32(path.encode('utf-8'))
+    body = "\n".join(
+        f"<p>{DOC_SENTENCES[(offset + i) % len(DOC_SENTENCES)]} {DOC_SENTENCES[(offset + 3 * i + 1) % len(DOC_SENTENCES)]}</p>"
+        for i in range(paragraphs)
+    )
+    return (
+        "<html><head><title>Docs</title><style>p { margin: 0 }</style>"
+        "<script>window.analytics = {};</script></head><body>"
+        "<header><nav><a href='/'>Inicio</a> <a href='/docs'>Docs</a></nav></header>"
+        f"<main><h1>{path}</h1><h2>Guía</h2>{body}<pre><code>npm install @nestjs/core</code></pre></main>"
+        "<footer>© Docs</footer></body></html>"
+    )
+
+def js_shell_page(path: str) -> str:
+    """Página que sólo tiene contenido tras ejecutar JavaScript (como una SPA)."""
+    content = json.dumps(docs_page(path))
+    return (
+        "<html><head><title>App</title></head><body>"
+        "<noscript>You need to enable JavaScript to run this app.</noscript>"
+        '<div id="root"></div>'
+        f"<script>document.getElementById('root').innerHTML = {content};</script>"
+        "</body></html>"
+    )
+
+def _bind_local_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    return sock
+
+
+class StubServers:
+    """
+    Servidores HTTP locales que sustituyen a las dependencias externas de la investigación:
+    la API de Custom Search, un sitio de documentación estático y otro renderizado con JavaScript.
+    """
+    def __init__(self, search_latency: float = 0.0, page_latency: float = 0.0, js_ratio: float = 0.25):
+        self.search_latency = search_latency
+        self.page_latency = page_latency
+        # Fracción de los resultados de búsqueda que apuntan al sitio que requiere JavaScript.
+        self.js_ratio = js_ratio
+        self.requests: Counter = Counter()
+        self._runners: list[web.AppRunner] = []
+        self.search_url = self.static_url = self.js_url = None
+
+    async def _start_app(self, app: web.Application) -> str:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        sock = _bind_local_socket()
+        await web.SockSite(runner, sock).start()
+        self._runners.append(runner)
+        host, port = sock.getsockname()
+        return f"http://{host}:{port}"
+
+    async def start(self) -> 'StubServers':
+        search_app = web.Application()
+        search_app.router.add_get('/customsearch/v1', self._search)
+        static_app = web.Application()
+        static_app.router.add_get('/docs/{name}', self._static_page)
+        js_app = web.Application()
+        js_app.router.add_get('/docs/{name}', self._js_page)
+
+        self.search_url = await self._start_app(search_app) + '/customsearch/v1'
+        self.static_url = await self._start_app(static_app)
+        self.js_url = await self._start_app(js_app)
+        return self
+
+    async def close(self) -> None:
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners.clear()
+
+    async def __aenter__(self) -> 'StubServers':
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _search(self, request: web.Request) -> web.Response:
+        self.requests['search'] += 1
+        await asyncio.sleep(self.search_latency)
+        query = request.query.get('q', '')
+        num = int(request.query.get('num', '3'))
+        seed = zlib.crc32(query.lower().encode('utf-8'))
+        items = []
+        for i in range(num):
+            slug = f"{(seed + i) % 40}"
+            # Consultas distintas comparten páginas, como ocurre con la documentación real.
+            base = self.js_url if ((seed >> 8) + i) % 100 < self.js_ratio * 100 else self.static_url
+            items.append({'link': f"{base}/docs/{slug}", 'title': f"Docs {slug}"})
+        return web.json_response({'items': items})
+
+    async def _static_page(self, request: web.Request) -> web.Response:
+        self.requests['static'] += 1
+        await asyncio.sleep(self.page_latency)
+        return web.Response(text=docs_page(request.path), content_type='text/html')
+
+    async def _js_page(self, request: web.Request) -> web.Response:
+        self.requests['js'] += 1
+        await asyncio.sleep(self.page_latency)
+        return web.Response(text=js_shell_page(request.path), content_type='text/html')
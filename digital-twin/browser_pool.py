@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BrowserPool:
+    """
+    Chromium headless de larga vida con un pool acotado de contextos/páginas reutilizables.
+    El navegador se lanza en el primer uso y se mantiene abierto hasta `close()`; Playwright
+    sólo se importa entonces, de modo que la investigación funciona sin él si ninguna
+    página necesita renderizarse.
+    """
+    def __init__(self, max_pages: int = 3, navigation_timeout: float = 15.0, idle_timeout: float = 2.0):
+        self.max_pages = max(1, max_pages)
+        self.navigation_timeout = navigation_timeout
+        # Tiempo máximo esperando a que la red quede inactiva tras el DOMContentLoaded.
+        self.idle_timeout = idle_timeout
+
+        self._manager = None
+        self._playwright = None
+        self._browser = None
+        # Cada página en uso ocupa un hueco y sólo se crean páginas si no hay ninguna en reposo.
+        # Quien espera lo hace aquí: se despierta al liberarse un hueco aunque el navegador se reinicie.
+        self._slots = asyncio.Semaphore(self.max_pages)
+        self._idle_pages: list = []
+        # Excepción de Playwright por tiempo agotado; se conoce al importarlo.
+        self._timeout_error: type[Exception] = asyncio.TimeoutError
+        self._start_lock = asyncio.Lock()
+
+    async def _ensure_started(self) -> None:
+        if self._browser is not None and self._browser.is_connected():
+            return
+        async with self._start_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            if self._manager is None:
+                from playwright.async_api import async_playwright
+                from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+                from playwright_stealth import Stealth
+                self._manager = Stealth().use_async(async_playwright())
+                self._playwright = await self._manager.__aenter__()
+                self._timeout_error = PlaywrightTimeoutError
+            # Las páginas en reposo del navegador anterior murieron con él.
+            self._idle_pages.clear()
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            logger.info(f"[BrowserPool] Chromium iniciado (máximo {self.max_pages} páginas).")
+
+    async def _acquire_page(self):
+        await self._slots.acquire()
+        try:
+            await self._ensure_started()
+            while self._idle_pages:
+                page = self._idle_pages.pop()
+                if not page.is_closed():
+                    return page
+            context = await self._browser.new_context()
+            return await context.new_page()
+        except BaseException:
+            # También si se cancela la espera: el hueco no puede perderse.
+            self._slots.release()
+            raise
+
+    async def _release_page(self, page, healthy: bool) -> None:
+        try:
+            if healthy and not page.is_closed() and page.context.browser is self._browser:
+                self._idle_pages.append(page)
+                return
+            # Una página rota se descarta junto con su contexto para no contaminar el pool.
+            try:
+                await page.context.close()
+            except Exception:
+                pass
+        finally:
+            self._slots.release()
+
+    async def fetch_html(self, url: str) -> str:
+        """Navega a `url` con una página del pool y devuelve el HTML una vez renderizado."""
+        page = await self._acquire_page()
+        healthy = False
+        try:
+            await page.goto(url, wait_until="domcontentloaded", timeout=self.navigation_timeout * 1000)
+            await page.mouse.move(200, 300)
+            try:
+                # Espera por disponibilidad real en lugar de un `sleep` fijo.
+                await page.wait_for_load_state("networkidle", timeout=self.idle_timeout * 1000)
+            except self._timeout_error:
+                pass  # Páginas con conexiones persistentes nunca quedan inactivas.
+            html = await page.content()
+            healthy = True
+            return html
+        finally:
+            await self._release_page(page, healthy)
+
+    async def close(self) -> None:
+        self._idle_pages.clear()
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._manager is not None:
+            await self._manager.__aexit__(None, None, None)
+            self._manager = None
+            self._playwright = None
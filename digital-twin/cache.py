@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any
+
+from telemetry import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# Escrituras entre dos recuentos exactos del tamaño total: incorporan lo que escriban otros procesos.
+RECOUNT_EVERY_WRITES = 1000
+
+class DiskCache:
+    """
+    Caché clave→valor persistente en SQLite, con TTL por entrada y desalojo LRU
+    cuando el tamaño total supera `max_bytes`.
+    Los valores se guardan como JSON. Varios procesos (workers de uvicorn) pueden
+    compartir el mismo fichero: SQLite en modo WAL serializa las escrituras.
+    """
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, default_ttl: float | None = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._hits: dict[str, int] = defaultdict(int)
+        self._misses: dict[str, int] = defaultdict(int)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, expires_at REAL, last_access REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+        # Tamaño total llevado en cada escritura, sin recorrer la tabla.
+        self._total_bytes = self._count_bytes()
+        self._writes = 0
+
+    def _count_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, namespace: str, key: str, allow_expired: bool = False) -> Any | None:
+        """`allow_expired` devuelve también entradas caducadas (p. ej. cuando no queda cuota para refrescarlas)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None or (not allow_expired and row[1] is not None and row[1] <= now):
+                # Las entradas caducadas se conservan como respaldo hasta que el presupuesto las desaloje.
+                self._misses[namespace] += 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+            )
+            self._hits[namespace] += 1
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float | None = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode('utf-8')) + len(key)
+        if size > self.max_bytes:
+            logger.debug(f"[DiskCache] Entrada '{namespace}:{key}' excede el presupuesto; no se guarda.")
+            return
+        expires_at = now + ttl if ttl is not None else None
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                replaced = self._conn.execute(
+                    "SELECT size FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, size, expires_at, last_access)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (namespace, key, payload, size, expires_at, now)
+                )
+                total = self._total_bytes + size - (replaced[0] if replaced else 0)
+                self._writes += 1
+                if self._writes % RECOUNT_EVERY_WRITES == 0:
+                    total = self._count_bytes()
+                total = self._evict(now, total)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._total_bytes = total
+
+    def _evict(self, now: float, total: int) -> int:
+        """Desaloja hasta volver al presupuesto y devuelve el nuevo tamaño total."""
+        if total <= self.max_bytes:
+            return total
+        # Antes de borrar nada se confirma el total real (otros procesos también escriben y desalojan).
+        total = self._count_bytes()
+        if total <= self.max_bytes:
+            return total
+        # Se eliminan primero las entradas caducadas y después las menos usadas
+        # recientemente, hasta volver al presupuesto.
+        excess = total - self.max_bytes
+        victims = []
+        for rowid, size in self._conn.execute(
+            "SELECT rowid, size FROM entries"
+            " ORDER BY (expires_at IS NOT NULL AND expires_at <= ?) DESC, last_access", (now,)
+        ):
+            victims.append((rowid,))
+            excess -= size
+            total -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM entries WHERE rowid = ?", victims)
+        return total
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY namespace"
+            ).fetchall()
+            stored = {namespace: (count, size) for namespace, count, size in rows}
+            namespaces = set(stored) | set(self._hits) | set(self._misses)
+            return {
+                namespace: {
+                    "hits": self._hits[namespace],
+                    "misses": self._misses[namespace],
+                    "entries": stored.get(namespace, (0, 0))[0],
+                    "bytes": stored.get(namespace, (0, 0))[1],
+                }
+                for namespace in sorted(namespaces)
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._total_bytes = 0
+            self._hits.clear()
+            self._misses.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LRUCache:
+    """
+    Caché LRU en memoria, acotada por número de entradas y segura entre hilos.
+    Si recibe una `DiskCache`, las entradas también se persisten bajo `namespace`
+    y un fallo en memoria se resuelve desde disco antes de contarse como fallo.
+    Con `ttl` (segundos), las entradas caducan además por antigüedad.
+    """
+    def __init__(self, max_entries: int = 4096, disk: DiskCache | None = None, namespace: str = "lru",
+                 ttl: float | None = None):
+        self.max_entries = max_entries
+        self.disk = disk
+        self.namespace = namespace
+        self.ttl = ttl
+        # Clave → (instante de caducidad o None, valor).
+        self._entries: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache_lookup(self.namespace, True)
+                return entry[1]
+        value = self.disk.get(self.namespace, key) if self.disk is not None else None
+        with self._lock:
+            record_cache_lookup(self.namespace, value is not None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+        if self.disk is not None:
+            self.disk.set(self.namespace, key, value, ttl=self.ttl)
+
+    def _store(self, key: str, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 import re
+import numpy as np
 import pandas as pd
 
 # Carga las variables de entorno desde un archivo .env
@@ -8,6 +9,84 @@ load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GOOGLE_CX = os.getenv("GOOGLE_CX")
+# Endpoint de Custom Search; se sustituye por un servidor local en los benchmarks.
+GOOGLE_SEARCH_URL = os.getenv("GOOGLE_SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
+
+# Número máximo de búsquedas y descargas de páginas simultáneas en la investigación.
+RESEARCH_MAX_CONCURRENCY = int(os.getenv("RESEARCH_MAX_CONCURRENCY", "5"))
+# Páginas (contextos) simultáneas del navegador headless compartido.
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "3"))
+
+# Hilos del pool donde se ejecutan los nodos síncronos del grafo (predicción ML).
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Modelo de esfuerzo: un Pipeline de joblib o un directorio exportado con native_model.py.
+MODEL_PATH = os.getenv("MODEL_PATH", "model/effort_model.joblib")
+# Cada cuántos segundos comprueba cada worker si MODEL_PATH cambió para recargarlo (0 lo desactiva).
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "30"))
+# Procesos que usa spaCy (nlp.pipe) para lematizar lotes grandes de historias.
+PREDICTION_N_PROCESS = int(os.getenv("PREDICTION_N_PROCESS", "1"))
+# Caché LRU de lematizaciones y predicciones; con una ruta también se persiste en SQLite.
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "")
+
+# Calentamiento al arrancar: "off", "local" (sin llamadas externas) o "full"
+# (ejecuta una historia sintética por el grafo completo, incluidos búsqueda y LLM).
+WARMUP_MODE = os.getenv("WARMUP_MODE", "local")
+
+# Endpoint por lotes: historias procesadas por bloque y llamadas simultáneas al LLM.
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "16"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+# Plazo por defecto de /generate_plan/ (segundos), fracción del plazo reservada a la investigación
+# y tiempo mínimo para llamar al LLM; con menos se devuelve directamente el plan basado en la estimación ML.
+PLAN_TIMEOUT_SECONDS = float(os.getenv("PLAN_TIMEOUT_SECONDS", "60"))
+RESEARCH_BUDGET_FRACTION = float(os.getenv("RESEARCH_BUDGET_FRACTION", "0.4"))
+PLANNER_MIN_SECONDS = float(os.getenv("PLANNER_MIN_SECONDS", "2"))
+
+# Planes ya generados por /generate_plan/: número máximo y vigencia en segundos (0 desactiva la reutilización).
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "1024"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "600"))
+# Idempotency-Key ya vistas (clave → historia): número máximo y vigencia en segundos (0 desactiva el control).
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+# API de trabajos asíncronos (opcional): cola SQLite (vacía por defecto: API desactivada), workers por
+# proceso, concurrencia máxima por etapa ("research=4,planner=2"), plazo de cada trabajo,
+# espera máxima de un long-poll y tiempo que se conservan los trabajos terminados.
+JOBS_PATH = os.getenv("JOBS_PATH", "")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_STAGE_CONCURRENCY = os.getenv("JOB_STAGE_CONCURRENCY", "research=4,prediction=4,planner=2")
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", "30"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+
+# Índice de historias ya procesadas (similitud coseno sobre el TF-IDF del modelo). Es opcional:
+# vacío por defecto (desactivado). Con similitud >= SIMILARITY_REUSE_THRESHOLD se reutiliza la investigación
+# de la historia más parecida en lugar de buscar en la web; los planes de hasta SIMILARITY_TOP_K
+# historias con similitud >= SIMILARITY_SEED_THRESHOLD se dan al LLM como referencia.
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", "")
+SIMILARITY_INDEX_SIZE = int(os.getenv("SIMILARITY_INDEX_SIZE", "10000"))
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "3"))
+SIMILARITY_REUSE_THRESHOLD = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0.9"))
+SIMILARITY_SEED_THRESHOLD = float(os.getenv("SIMILARITY_SEED_THRESHOLD", "0.5"))
+
+# Caché persistente de la investigación. Una ruta vacía la desactiva.
+RESEARCH_CACHE_PATH = os.getenv("RESEARCH_CACHE_PATH", ".cache/research.sqlite")
+RESEARCH_CACHE_MAX_BYTES = int(os.getenv("RESEARCH_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+RESEARCH_CACHE_SEARCH_TTL = float(os.getenv("RESEARCH_CACHE_SEARCH_TTL", str(7 * 24 * 3600)))
+RESEARCH_CACHE_PAGE_TTL = float(os.getenv("RESEARCH_CACHE_PAGE_TTL", str(3 * 24 * 3600)))
+# Planificador de peticiones externas: ritmo de búsquedas por API key (la API de Custom
+# Search admite unas 100 consultas por minuto), cuota diaria (0 = sin límite), ritmo de
+# descargas por host y espera máxima antes de degradar. Un ritmo 0 desactiva el límite.
+SEARCH_RATE_PER_SECOND = float(os.getenv("SEARCH_RATE_PER_SECOND", "1.5"))
+SEARCH_BURST = float(os.getenv("SEARCH_BURST", "10"))
+SEARCH_DAILY_QUOTA = int(os.getenv("SEARCH_DAILY_QUOTA", "0"))
+HOST_RATE_PER_SECOND = float(os.getenv("HOST_RATE_PER_SECOND", "5"))
+HOST_BURST = float(os.getenv("HOST_BURST", "5"))
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "5"))
+# Bytes de texto que se conservan de cada página para el resumen (0 = sin límite).
+RESEARCH_MAX_PAGE_BYTES = int(os.getenv("RESEARCH_MAX_PAGE_BYTES", str(256 * 1024)))
 
 NUMERICAL_FEATURES = [
     'gherkin_steps', 'gherkin_length', 'num_scenarios', 'num_technical_terms',
@@ -20,6 +99,143 @@ NUMERICAL_FEATURES = [
 ]
 
 
+# --- Palabras clave de las características (compartidas por entrenamiento y servicio) ---
+# Regex mejoradas con \b; cada característica vale 1 si aparece alguna de sus palabras.
+KEYWORD_CATEGORIES = {
+    'has_frontend': r'\b(?:frontend|UI|interfaz|CSS|React|Angular|Vue|diseño|vista|pantalla)\b',
+    'has_backend': r'\b(?:backend|servidor|database|base de datos|bd|API|endpoint|SQL|servicios|microservicio|Java|NodeJS|NestJS|Python)\b',
+    'has_security': r'\b(?:seguridad|security|JWT|OAuth|token|autenticación|contraseña|encriptar|CSRF|XSS)\b',
+    'has_payment': r'\b(?:pago|payment|stripe|paypal|tarjeta de crédito|checkout|factura|compra)\b',
+    'has_crud': r'\b(?:crear|añadir|guardar|editar|actualizar|modificar|eliminar|borrar|ver|listar|obtener)\b',
+    'has_reporting': r'\b(?:reporte|dashboard|gráfico|exportar|CSV|PDF|Excel|analíticas|métricas)\b',
+    'has_integration': r'\b(?:api externa|third-party|integración|webhook|sincronizar|CRM|ERP)\b',
+    'has_notification': r'\b(?:notificación|email|correo|SMS|push|alerta|mensaje)\b',
+    'has_devops_mlops': r'\b(?:CI/CD|pipeline|deploy|despliegue|Kubernetes|Docker|monitor|observabilidad|modelo|ML|IA|DevOps)\b',
+    'has_accessibility': r'\b(?:accesibilidad|accessibility|WCAG|lector de pantalla|screen reader|ARIA)\b',
+    'has_mobile': r'\b(?:móvil|app|push|biometría|offline|geolocalización|cámara|gesto)\b',
+    'has_testing': r'\b(?:test|prueba|mock|verificar|validar|assertion|simula)\b',
+    'has_error_handling': r'\b(?:error|excepción|exception|fallo|failure|validar|manejo de error)\b',
+    'has_ui_interaction': r'\b(?:clic|seleccionar|navegar|click|select)\b',
+    'has_database_query': r'\b(?:query|select|sql|database|base de datos|bd)\b'
+}
+
+TECH_STACK_KEYWORDS = {
+    'tech_java': r'\b(?:java|spring|maven|gradle|JPA|hibernate)\b',
+    'tech_node': r'\b(?:node\.?js|nestjs|express|npm|yarn)\b',
+    'tech_python': r'\b(?:python|django|flask|fastapi|pip)\b',
+    'tech_frontend_framework': r'\b(?:react|angular|vue|svelte)\b',
+    'tech_database': r'\b(?:sql|mysql|postgres|mongodb|redis|base de datos|database)\b',
+    'tech_infra_cloud': r'\b(?:aws|azure|gcp|docker|kubernetes|terraform|S3)\b'
+}
+
+GHERKIN_STEP_KEYWORDS = ['given', 'when', 'then', 'and', 'dado', 'cuando', 'entonces', 'y']
+SCENARIO_KEYWORDS = ['scenario', 'escenario']
+CONDITION_KEYWORDS = ['if', 'when', 'si']
+
+# Columnas numéricas que genera `extract_features` (el subconjunto de NUMERICAL_FEATURES
+# con el que se entrenó `effort_model.joblib`).
+EXTRACTED_FEATURES = list(KEYWORD_CATEGORIES) + list(TECH_STACK_KEYWORDS) + \
+                     ['gherkin_steps', 'gherkin_length', 'num_scenarios', 'num_conditions']
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+def _keyword_variants(pattern: str) -> list[str]:
+    r"""Convierte `\b(?:a|b c|node\.?js)\b` en sus literales: ['a', 'b c', 'nodejs', 'node.js']."""
+    variants = []
+    for alternative in pattern[len(r'\b(?:'):-len(r')\b')].split('|'):
+        if r'\.?' in alternative:
+            variants += [alternative.replace(r'\.?', ''), alternative.replace(r'\.?', '.')]
+        else:
+            variants.append(re.sub(r'\\(.)', r'\1', alternative))
+    return [variant.lower() for variant in variants]
+
+class FeatureExtractor:
+    r"""
+    Extractor precompilado equivalente a `extract_features`. Como todas las palabras
+    clave van delimitadas por \b, basta con tokenizar el texto una vez (\w+) y buscar
+    cada token en un diccionario: las frases (p. ej. 'base de datos', 'CI/CD') se
+    comprueban como secuencias de tokens con el mismo separador literal.
+    """
+    def __init__(self, feature_order: list[str] = NUMERICAL_FEATURES):
+        self.feature_order = list(feature_order)
+        column = {name: i for i, name in enumerate(self.feature_order)}
+
+        # token -> columnas; primer token de una frase -> [(tokens, separadores, columnas)]
+        self._single: dict[str, set[int]] = {}
+        self._phrases: dict[str, list[tuple[list[str], list[str], set[int]]]] = {}
+        for feature_name, pattern in {**KEYWORD_CATEGORIES, **TECH_STACK_KEYWORDS}.items():
+            if feature_name not in column:
+                continue
+            for variant in _keyword_variants(pattern):
+                tokens = _WORD_PATTERN.findall(variant)
+                if len(tokens) == 1 and tokens[0] == variant:
+                    self._single.setdefault(variant, set()).add(column[feature_name])
+                else:
+                    separators = _WORD_PATTERN.split(variant)[1:-1]
+                    entry = next((e for e in self._phrases.get(tokens[0], []) if e[0] == tokens and e[1] == separators), None)
+                    if entry is None:
+                        entry = (tokens, separators, set())
+                        self._phrases.setdefault(tokens[0], []).append(entry)
+                    entry[2].add(column[feature_name])
+
+        self._counted = {
+            name: (column[name], set(words))
+            for name, words in (('gherkin_steps', GHERKIN_STEP_KEYWORDS),
+                                ('num_scenarios', SCENARIO_KEYWORDS),
+                                ('num_conditions', CONDITION_KEYWORDS))
+            if name in column
+        }
+        self._length_column = column.get('gherkin_length')
+
+    def transform(self, titles, gherkins) -> np.ndarray:
+        """Devuelve una matriz (n_historias, n_características) ordenada como `feature_order`."""
+        titles, gherkins = list(titles), list(gherkins)
+        features = np.zeros((len(titles), len(self.feature_order)), dtype=float)
+        for row, (title, gherkin) in enumerate(zip(titles, gherkins)):
+            self._fill_row(features[row], str(title), str(gherkin))
+        return features
+
+    def _fill_row(self, out: np.ndarray, title: str, gherkin: str) -> None:
+        full_text = title + " " + gherkin
+        gherkin_start = len(title) + 1
+        matches = list(_WORD_PATTERN.finditer(full_text))
+        tokens = [match.group().lower() for match in matches]
+
+        present: set[int] = set()
+        counted_words = {name: 0 for name in self._counted}
+        for i, token in enumerate(tokens):
+            columns = self._single.get(token)
+            if columns:
+                present |= columns
+            for phrase_tokens, separators, phrase_columns in self._phrases.get(token, ()):
+                end = i + len(phrase_tokens)
+                if end <= len(tokens) and tokens[i:end] == phrase_tokens and all(
+                    full_text[matches[j].end():matches[j + 1].start()] == separators[j - i]
+                    for j in range(i, end - 1)
+                ):
+                    present |= phrase_columns
+            if matches[i].start() >= gherkin_start:
+                for name, (_, words) in self._counted.items():
+                    if token in words:
+                        counted_words[name] += 1
+
+        for column in present:
+            out[column] = 1.0
+        for name, (column, _) in self._counted.items():
+            out[column] = counted_words[name]
+        if self._length_column is not None:
+            out[self._length_column] = len(gherkin)
+
+_default_extractor = None
+
+def extract_feature_matrix(titles, gherkins) -> np.ndarray:
+    """Características numéricas en un array NumPy ordenado como NUMERICAL_FEATURES."""
+    global _default_extractor
+    if _default_extractor is None:
+        _default_extractor = FeatureExtractor()
+    return _default_extractor.transform(titles, gherkins)
+
+
 # ---------------------------------------------------------------------------
 # La función `extract_features` es la misma, ya que el Pipeline la necesita
 # para crear las columnas numéricas iniciales antes de vectorizar y escalar.
@@ -31,51 +247,10 @@ def extract_features(df: pd.DataFrame) -> (pd.DataFrame):
     df_featured['title'] = df_featured['title'].astype(str).fillna('')
     df_featured['full_text'] = df_featured['title'] + " " + df_featured['gherkin']
 
-    # --- Características Basadas en Categorías (Regex mejoradas con \b) ---
-    keyword_categories = {
-        'has_frontend': r'\b(?:frontend|UI|interfaz|CSS|React|Angular|Vue|diseño|vista|pantalla)\b',
-        'has_backend': r'\b(?:backend|servidor|database|base de datos|bd|API|endpoint|SQL|servicios|microservicio|Java|NodeJS|NestJS|Python)\b',
-        'has_security': r'\b(?:seguridad|security|JWT|OAuth|token|autenticación|contraseña|encriptar|CSRF|XSS)\b',
-        'has_payment': r'\b(?:pago|payment|stripe|paypal|tarjeta de crédito|checkout|factura|compra)\b',
-        'has_crud': r'\b(?:crear|añadir|guardar|editar|actualizar|modificar|eliminar|borrar|ver|listar|obtener)\b',
-        'has_reporting': r'\b(?:reporte|dashboard|gráfico|exportar|CSV|PDF|Excel|analíticas|métricas)\b',
-        'has_integration': r'\b(?:api externa|third-party|integración|webhook|sincronizar|CRM|ERP)\b',
-        'has_notification': r'\b(?:notificación|email|correo|SMS|push|alerta|mensaje)\b',
-        'has_devops_mlops': r'\b(?:CI/CD|pipeline|deploy|despliegue|Kubernetes|Docker|monitor|observabilidad|modelo|ML|IA|DevOps)\b',
-        'has_accessibility': r'\b(?:accesibilidad|accessibility|WCAG|lector de pantalla|screen reader|ARIA)\b',
-        'has_mobile': r'\b(?:móvil|app|push|biometría|offline|geolocalización|cámara|gesto)\b',
-        'has_testing': r'\b(?:test|prueba|mock|verificar|validar|assertion|simula)\b',
-        'has_error_handling': r'\b(?:error|excepción|exception|fallo|failure|validar|manejo de error)\b',
-        'has_ui_interaction': r'\b(?:clic|seleccionar|navegar|click|select)\b',
-        'has_database_query': r'\b(?:query|select|sql|database|base de datos|bd)\b'
-    }
-    for feature_name, pattern in keyword_categories.items():
-        df_featured[feature_name] = df_featured['full_text'].str.contains(pattern, case=False, regex=True, na=False).astype(int)
-
-    tech_stack_keywords = {
-        'tech_java': r'\b(?:java|spring|maven|gradle|JPA|hibernate)\b',
-        'tech_node': r'\b(?:node\.?js|nestjs|express|npm|yarn)\b',
-        'tech_python': r'\b(?:python|django|flask|fastapi|pip)\b',
-        'tech_frontend_framework': r'\b(?:react|angular|vue|svelte)\b',
-        'tech_database': r'\b(?:sql|mysql|postgres|mongodb|redis|base de datos|database)\b',
-        'tech_infra_cloud': r'\b(?:aws|azure|gcp|docker|kubernetes|terraform|S3)\b'
-    }
-    for tech_name, pattern in tech_stack_keywords.items():
-        df_featured[tech_name] = df_featured['full_text'].str.contains(pattern, case=False, regex=True, na=False).astype(int)
-
-    # --- Características Cuantitativas ---
-    gherkin_keywords = [r'\bGiven\b', r'\bWhen\b', r'\bThen\b', r'\bAnd\b', r'\bDado\b', r'\bCuando\b', r'\bEntonces\b', r'\bY\b']
-    df_featured['gherkin_steps'] = df_featured['gherkin'].apply(lambda x: sum(len(re.findall(word, x, re.IGNORECASE)) for word in gherkin_keywords))
-    df_featured['gherkin_length'] = df_featured['gherkin'].str.len()
-    df_featured['num_scenarios'] = df_featured['gherkin'].str.count(r'\b(Scenario|Escenario)\b', re.IGNORECASE)
-    df_featured['num_conditions'] = df_featured['gherkin'].str.lower().str.count(r'\b(if|when|si)\b')
-
-    # Lista de todas las características numéricas creadas
-    numerical_features = list(keyword_categories.keys()) + \
-                         list(tech_stack_keywords.keys()) + \
-                         ['gherkin_steps', 'gherkin_length', 'num_scenarios', 'num_conditions']
-
-    for col in numerical_features:
-        df_featured[col] = pd.to_numeric(df_featured[col], errors='coerce').fillna(0).astype(float)
-
-    return df_featured
\ No newline at end of file
+    # Todas las características se calculan en una sola pasada por historia.
+    matrix = extract_feature_matrix(df_featured['title'], df_featured['gherkin'])
+    columns = [NUMERICAL_FEATURES.index(col) for col in EXTRACTED_FEATURES]
+    numeric = pd.DataFrame(matrix[:, columns], columns=EXTRACTED_FEATURES, index=df_featured.index)
+    df_featured = pd.concat([df_featured.drop(columns=EXTRACTED_FEATURES, errors='ignore'), numeric], axis=1)
+
+    return df_featured
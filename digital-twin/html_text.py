@@ -0,0 +1,207 @@
+import re
+from collections import Counter
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import List, Tuple
+
+# Subárboles sin contenido útil: se recorren sin guardar nada de ellos.
+SKIPPED_TAGS = frozenset(['script', 'style', 'nav', 'footer', 'header', 'aside'])
+# Elementos cuyo texto forma el contenido de la página.
+CONTENT_TAGS = frozenset(['p', 'h1', 'h2', 'h3', 'code', 'pre', 'li'])
+# Texto que no cuenta como contenido aunque esté dentro de un elemento de contenido
+# (plantillas y anotaciones ruby), igual que en BeautifulSoup.
+IGNORED_TEXT_TAGS = frozenset(['template', 'rt', 'rp'])
+# Elementos vacíos: se cierran en la misma etiqueta de apertura.
+VOID_TAGS = frozenset([
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image', 'img',
+    'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr',
+])
+# Caracteres de HTML que se pasan al parser en cada `feed`.
+FEED_CHUNK_CHARS = 64 * 1024
+
+_WHITESPACE = re.compile(r'\s+')
+_DECIMAL_REFERENCE = re.compile(r'^([0-9]+)(.*)')
+_HEX_REFERENCE = re.compile(r'^([0-9a-f]+)(.*)')
+
+def _numeric_reference(value: int) -> str:
+    """Carácter de una referencia numérica según el estándar HTML (0x80-0x9F se leen como Windows-1252)."""
+    if value == 0 or value > 0x10FFFF or 0xD800 <= value <= 0xDFFF:
+        return '\ufffd'
+    if 0x80 <= value <= 0x9F:
+        try:
+            return bytes([value]).decode('cp1252')
+        except UnicodeDecodeError:
+            pass
+    return chr(value)
+
+
+class _LimitReached(Exception):
+    """El texto ya fijado supera el tope: no hace falta seguir leyendo el HTML."""
+
+
+class TextExtractor(HTMLParser):
+    """
+    Extracción de texto en streaming sobre `html.parser`, sin construir el DOM: produce
+    el mismo texto que parsear con BeautifulSoup, eliminar los subárboles de SKIPPED_TAGS
+    y unir el texto de cada elemento de CONTENT_TAGS (en orden de apertura; un elemento
+    anidado en otro aporta su texto dos veces, como hacía `find_all`).
+
+    Sólo se guarda una pila con los nombres de los elementos abiertos y el texto de los
+    elementos de contenido. Con `max_chars` > 0 el análisis se detiene en cuanto el
+    principio del texto, que ya no puede cambiar, supera esa longitud.
+    """
+    def __init__(self, max_chars: int = 0):
+        # Las referencias se resuelven a mano para reproducir a BeautifulSoup (p. ej. "&foo;" -> "&foo").
+        super().__init__(convert_charrefs=False)
+        self.max_chars = max_chars
+        self.truncated = False
+        # Elementos abiertos: (nombre, índice de su bloque de texto o None).
+        self._stack: List[Tuple[str, int | None]] = []
+        self._open_names: Counter = Counter()
+        self._skip_depth = 0
+        self._ignore_depth = 0
+        # Texto (trozos ya normalizados) de cada elemento de contenido, en orden de apertura.
+        self._blocks: List[List[str]] = []
+        self._block_chars: List[int] = []
+        self._open_blocks: List[int] = []
+        self._pending: List[str] = []
+        # Elementos vacíos abiertos sin "/>" (multiconjunto): su cierre explícito posterior no corta el texto.
+        self._closed_voids: Counter = Counter()
+        # Bloques ya cerrados al principio de la salida y su longitud (trozos + separadores).
+        self._settled = 0
+        self._settled_chars = 0
+        self._result_blocks: int | None = None
+
+    def _flush(self, cdata: bool = False) -> None:
+        """Cierra el texto acumulado entre dos etiquetas y lo añade a los bloques abiertos."""
+        if not self._pending:
+            return
+        data = ''.join(self._pending)
+        self._pending = []
+        # Las secciones CDATA cuentan incluso dentro de IGNORED_TEXT_TAGS, como en BeautifulSoup.
+        if self._skip_depth or (self._ignore_depth and not cdata) or not self._open_blocks:
+            return
+        piece = _WHITESPACE.sub(' ', data).strip()
+        if not piece:
+            return
+        for block in self._open_blocks:
+            self._blocks[block].append(piece)
+            self._block_chars[block] += len(piece) + 1
+        self._check_limit()
+
+    def _check_limit(self) -> None:
+        if self.max_chars <= 0:
+            return
+        # Lo anterior al primer bloque abierto ya no cambia, y ese bloque sólo crece por el final.
+        first_open = self._open_blocks[0] if self._open_blocks else len(self._blocks)
+        while self._settled < first_open:
+            self._settled_chars += self._block_chars[self._settled]
+            self._settled += 1
+        fixed_chars = self._settled_chars + (self._block_chars[first_open] if self._open_blocks else 0) - 1
+        if fixed_chars > self.max_chars:
+            self._result_blocks = first_open + (1 if self._open_blocks else 0)
+            self.truncated = True
+            raise _LimitReached()
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        self._flush()
+        if tag in VOID_TAGS:
+            self._closed_voids[tag] += 1
+            return
+        block = None
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in IGNORED_TEXT_TAGS:
+            self._ignore_depth += 1
+        if tag in CONTENT_TAGS and not self._skip_depth:
+            block = len(self._blocks)
+            self._blocks.append([])
+            self._block_chars.append(0)
+            self._open_blocks.append(block)
+        self._stack.append((tag, block))
+        self._open_names[tag] += 1
+
+    def handle_startendtag(self, tag: str, attrs) -> None:
+        # "<tag/>" se abre y se cierra a la vez: no contiene texto.
+        self._flush()
+
+    def handle_endtag(self, tag: str) -> None:
+        if self._closed_voids[tag]:
+            self._closed_voids[tag] -= 1
+            return
+        self._flush()
+        # Un cierre sin apertura se ignora; si no, se cierra todo lo abierto desde esa apertura.
+        if not self._open_names[tag]:
+            return
+        while True:
+            name, block = self._stack.pop()
+            self._open_names[name] -= 1
+            if name in SKIPPED_TAGS:
+                self._skip_depth -= 1
+            elif name in IGNORED_TEXT_TAGS:
+                self._ignore_depth -= 1
+            if block is not None:
+                self._open_blocks.pop()
+            if name == tag:
+                break
+        self._check_limit()
+
+    def handle_data(self, data: str) -> None:
+        self._pending.append(data)
+
+    def handle_entityref(self, name: str) -> None:
+        self._pending.append(html5.get(f"{name};", f"&{name}"))
+
+    def handle_charref(self, name: str) -> None:
+        hexadecimal = name[:1] in ('x', 'X')
+        digits = name[1:] if hexadecimal else name
+        try:
+            self._pending.append(_numeric_reference(int(digits, 16 if hexadecimal else 10)))
+        except ValueError:
+            # "&#65abc": la referencia es "&#65" y el resto es texto normal.
+            match = (_HEX_REFERENCE if hexadecimal else _DECIMAL_REFERENCE).match(digits)
+            if match is None:
+                self._pending.append(digits)
+            else:
+                self._pending.append(_numeric_reference(int(match.group(1), 16 if hexadecimal else 10)) + match.group(2))
+
+    def unknown_decl(self, data: str) -> None:
+        # Las secciones CDATA son texto; el resto de declaraciones, no.
+        self._flush()
+        if data.upper().startswith('CDATA['):
+            self._pending.append(data[len('CDATA['):])
+            self._flush(cdata=True)
+
+    def handle_comment(self, data: str) -> None:
+        self._flush()
+
+    def handle_decl(self, decl: str) -> None:
+        self._flush()
+
+    def handle_pi(self, data: str) -> None:
+        self._flush()
+
+    def close(self) -> None:
+        super().close()
+        self._flush()
+
+    def text(self) -> str:
+        blocks = self._blocks if self._result_blocks is None else self._blocks[:self._result_blocks]
+        return ' '.join(piece for block in blocks for piece in block)
+
+
+def extract_text_from_html(html: str, max_bytes: int = 0) -> str:
+    """
+    Texto limpio de una página (ver TextExtractor). Con `max_bytes` > 0 deja de analizar
+    el HTML en cuanto tiene más de `max_bytes` bytes de texto: el resultado, recortado con
+    `cap_page_text`, es el mismo que si se hubiera extraído la página completa.
+    """
+    # Un carácter ocupa al menos un byte: superar `max_bytes` caracteres basta.
+    extractor = TextExtractor(max_chars=max_bytes)
+    try:
+        for start in range(0, len(html), FEED_CHUNK_CHARS):
+            extractor.feed(html[start:start + FEED_CHUNK_CHARS])
+        extractor.close()
+    except _LimitReached:
+        pass
+    return extractor.text()
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+from telemetry import JOB_QUEUE_DEPTH, JOB_RUN_SECONDS, JOB_WAIT_SECONDS, span
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED_STATUSES = (DONE, FAILED)
+# Cada cuánto busca un worker inactivo trabajos abandonados por otros procesos.
+RECOVERY_INTERVAL = 60.0
+
+def parse_stage_limits(spec: str) -> Dict[str, int]:
+    """Convierte "research=4,planner=2" en {"research": 4, "planner": 2}."""
+    limits = {}
+    for item in spec.split(','):
+        if item.strip():
+            stage, _, value = item.partition('=')
+            limits[stage.strip()] = int(value)
+    return limits
+
+
+class JobStore:
+    """
+    Cola de trabajos persistente en SQLite (modo WAL): los trabajos sobreviven a los
+    reinicios y varios procesos pueden compartir el mismo fichero. Tomar un trabajo es
+    atómico, así que cada uno lo ejecuta un único worker.
+    """
+    def __init__(self, path: str, lease_seconds: float = 600.0, max_attempts: int = 3,
+                 retention_seconds: float = 24 * 3600):
+        self.path = path
+        # Un trabajo "running" más antiguo que esto se considera abandonado (proceso caído).
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL,"
+            " result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)")
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def submit(self, payload: Any) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def claim(self) -> dict | None:
+        """Toma el trabajo en cola más antiguo y lo marca como "running"."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, now, row["id"])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._to_dict(row)
+        job.update(status=RUNNING, started_at=now, attempts=job["attempts"] + 1)
+        return job
+
+    def complete(self, job_id: str, result: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id)
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (FAILED, error, time.time(), job_id)
+            )
+
+    def release(self, job_id: str) -> None:
+        """Devuelve a la cola un trabajo interrumpido (p. ej. al apagar el worker)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE id = ? AND status = ?",
+                (QUEUED, job_id, RUNNING)
+            )
+
+    def recover(self) -> int:
+        """
+        Reencola los trabajos abandonados (su proceso cayó mientras los ejecutaba); los que
+        ya agotaron sus intentos se marcan como fallidos. Borra los terminados antiguos.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = now - self.lease_seconds
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?"
+                    " WHERE status = ? AND started_at < ? AND attempts >= ?",
+                    (FAILED, "El trabajo se interrumpió demasiadas veces.", now, RUNNING, stale, self.max_attempts)
+                )
+                requeued = self._conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?",
+                    (QUEUED, RUNNING, stale)
+                ).rowcount
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                    (DONE, FAILED, now - self.retention_seconds)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if requeued:
+            logger.warning(f"[Jobs] {requeued} trabajos abandonados vueltos a encolar.")
+        return requeued
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Límites de concurrencia por etapa del trabajo en curso (los fija el worker).
+_stage_limits: ContextVar[Dict[str, asyncio.Semaphore] | None] = ContextVar("job_stage_limits", default=None)
+
+@asynccontextmanager
+async def stage_slot(stage: str) -> AsyncIterator[None]:
+    """Ocupa un hueco de `stage` si se está ejecutando un trabajo con límite para esa etapa."""
+    semaphore = (_stage_limits.get() or {}).get(stage)
+    if semaphore is None:
+        yield
+        return
+    async with semaphore:
+        yield
+
+
+class JobQueue:
+    """
+    Pool de workers asíncronos que vacía la `JobStore`: cada worker toma un trabajo,
+    ejecuta `handler(payload)` y guarda el resultado o el error. `stage_limits` acota,
+    entre todos los workers, cuántos trabajos pueden estar a la vez en cada etapa.
+    Las operaciones sobre la `JobStore` (SQLite, bloqueantes) se hacen en hilos aparte
+    para no detener el event loop.
+    """
+    def __init__(self, store: JobStore, handler: Callable[[Any], Awaitable[Any]], workers: int = 4,
+                 stage_limits: Dict[str, int] | None = None, poll_interval: float = 1.0):
+        self.store = store
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.stage_limits = stage_limits or {}
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._running: set = set()
+        self._wakeup: asyncio.Event | None = None
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._last_recovery = 0.0
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.store.recover)
+        self._last_recovery = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in self.stage_limits.items()}
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self.refresh_metrics()
+        logger.info(f"[Jobs] {self.workers} workers iniciados (límites por etapa: {self.stage_limits or 'ninguno'}).")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Los trabajos interrumpidos vuelven a la cola para el próximo arranque.
+        for job_id in self._running:
+            await asyncio.to_thread(self.store.release, job_id)
+        self._running.clear()
+
+    async def submit(self, payload: Any) -> str:
+        job_id = await asyncio.to_thread(self.store.submit, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await self.refresh_metrics()
+        return job_id
+
+    async def get(self, job_id: str) -> dict | None:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def refresh_metrics(self) -> None:
+        counts = await asyncio.to_thread(self.store.counts)
+        for status, count in counts.items():
+            JOB_QUEUE_DEPTH.set(count, status=status)
+
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        """Long-poll: espera hasta `timeout` segundos a que el trabajo termine y devuelve su estado."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in FINISHED_STATUSES or remaining <= 0:
+                self._finished.pop(job_id, None)
+                return job
+            # El evento local avisa al instante; el sondeo cubre los trabajos de otros procesos.
+            event = self._finished.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _next_job(self) -> dict:
+        while True:
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.store.claim)
+            if job is not None:
+                return job
+            if time.monotonic() - self._last_recovery > RECOVERY_INTERVAL:
+                self._last_recovery = time.monotonic()
+                await asyncio.to_thread(self.store.recover)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self) -> None:
+        _stage_limits.set(self._semaphores)
+        while True:
+            job = await self._next_job()
+            self._running.add(job["id"])
+            JOB_WAIT_SECONDS.observe(job["started_at"] - job["created_at"])
+            await self.refresh_metrics()
+            start = time.perf_counter()
+            status = DONE
+            try:
+                with span("job", job_id=job["id"], attempt=job["attempts"]):
+                    result = await self.handler(job["payload"])
+                await asyncio.to_thread(self.store.complete, job["id"], result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                status = FAILED
+                logger.error(f"[Jobs] El trabajo {job['id']} falló: {e}")
+                await asyncio.to_thread(self.store.fail, job["id"], str(e))
+            self._running.discard(job["id"])
+            JOB_RUN_SECONDS.observe(time.perf_counter() - start, status=status)
+            await self.refresh_metrics()
+            event = self._finished.pop(job["id"], None)
+            if event is not None:
+                event.set()
@@ -1,31 +1,211 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import operator
+import time
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import TypedDict, Dict, Any, List
+from typing import Annotated, TypedDict, Dict, Any, List
 
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
 
+from cache import LRUCache
+from config import MODEL_PATH, CPU_WORKERS, BATCH_CHUNK_SIZE, BATCH_LLM_CONCURRENCY, WARMUP_MODE, MODEL_RELOAD_INTERVAL
+from config import PLAN_CACHE_SIZE, PLAN_CACHE_TTL, IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL, PLAN_TIMEOUT_SECONDS, RESEARCH_BUDGET_FRACTION, PLANNER_MIN_SECONDS
+from config import JOBS_PATH, JOB_WORKERS, JOB_STAGE_CONCURRENCY, JOB_TIMEOUT_SECONDS, JOB_MAX_WAIT_SECONDS, JOB_RETENTION_SECONDS
+from config import SIMILARITY_INDEX_PATH, SIMILARITY_INDEX_SIZE, SIMILARITY_TOP_K, SIMILARITY_REUSE_THRESHOLD, SIMILARITY_SEED_THRESHOLD
+from jobs import DONE, FAILED, JobQueue, JobStore, parse_stage_limits, stage_slot
 from prediction import PredictionService
-from reasoner import LLMPlanGenerator
+from reasoner import LLMPlanGenerator, build_fallback_plan
 from research import ResearchService
+from scheduler import SingleFlight
+from similarity import StoryIndex
+from startup import LazyService, StartupState
+from telemetry import REGISTRY, SCHEDULER_EVENTS, RequestContextMiddleware, record_cache_lookup, span
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
 # --- Definición de la estructura de la solicitud ---
 class PlanRequest(BaseModel):
     story_data: dict
+    # Plazo de la solicitud en segundos (por defecto PLAN_TIMEOUT_SECONDS).
+    timeout_seconds: float | None = None
+
+class BatchPlanRequest(BaseModel):
+    stories: List[dict]
+    # Plazo de cada bloque de historias en segundos (por defecto PLAN_TIMEOUT_SECONDS).
+    timeout_seconds: float | None = None
 
 # --- Inicialización de Servicios ---
-# Estos servicios encapsulan la lógica de cada paso del proceso.
-MODEL_PATH = 'model/effort_model.joblib'
+# Estos servicios encapsulan la lógica de cada paso del proceso. Se construyen de forma
+# perezosa: el arranque los precarga en paralelo y en segundo plano, y una solicitud que
+# llegue antes simplemente espera a que el servicio que necesita esté listo.
 TECH_STACK_FILE = 'model/tech_stack.json'
 
-try:
-    prediction_service = PredictionService(model_path=MODEL_PATH)
-    research_service = ResearchService(tech_stack_file=TECH_STACK_FILE)
-    llm_plan_generator = LLMPlanGenerator()
-except Exception as e:
-    raise RuntimeError(f"Error al inicializar los servicios: {e}")
+prediction_service = LazyService("prediction", lambda: PredictionService(model_path=MODEL_PATH))
+research_service = LazyService("research", lambda: ResearchService(tech_stack_file=TECH_STACK_FILE))
+llm_plan_generator = LazyService("llm", LLMPlanGenerator)
+startup_state = StartupState({
+    "prediction": prediction_service,
+    "research": research_service,
+    "llm": llm_plan_generator,
+})
+
+# Pool de hilos para los nodos síncronos y pesados en CPU (spaCy, sklearn),
+# de modo que no bloqueen el event loop que atiende al resto de solicitudes.
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="graph-cpu")
+
+async def run_in_worker(func, *args):
+    loop = asyncio.get_running_loop()
+    # Se copia el contexto para que los spans del hilo conserven el request ID.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(cpu_executor, functools.partial(context.run, func, *args))
+
+def predict_story(story_data: dict):
+    # La primera llamada puede cargar el modelo y spaCy: se hace siempre dentro del pool.
+    return prediction_service.get().predict(story_data)
+
+def predict_stories(stories: List[dict]):
+    return prediction_service.get().predict_batch(stories)
+
+# Índice de historias ya procesadas (se abre en el arranque si SIMILARITY_INDEX_PATH no está vacío).
+story_index: StoryIndex | None = None
+
+def find_similar_stories(index: StoryIndex, story_data: dict) -> List[Dict[str, Any]]:
+    vectors, model = prediction_service.get().story_vectors([story_data])
+    return index.search(model, vectors[0], k=SIMILARITY_TOP_K, min_score=SIMILARITY_SEED_THRESHOLD)
+
+def index_story(index: StoryIndex, content_key: str, story_data: dict,
+                research_findings: Dict[str, Any], technical_plan: List[Dict[str, Any]]) -> None:
+    vectors, model = prediction_service.get().story_vectors([story_data])
+    index.add(content_key, model, vectors[0], {
+        "story_id": story_data.get("id"),
+        "title": story_data.get("title", ""),
+        "research_findings": research_findings,
+        "technical_plan": technical_plan,
+    })
+
+async def lookup_similar_stories(story_data: dict) -> List[Dict[str, Any]]:
+    """Historias ya procesadas parecidas a `story_data` (vacío si el índice no está activo o falla)."""
+    index = story_index
+    if index is None:
+        return []
+    try:
+        with span("similarity.search") as attributes:
+            matches = await run_in_worker(find_similar_stories, index, story_data)
+            attributes["matches"] = len(matches)
+            attributes["best_score"] = matches[0]["score"] if matches else None
+    except Exception as e:
+        # El índice es una optimización: si falla, la historia se procesa desde cero.
+        logger.error(f"Error al buscar historias similares: {e}")
+        return []
+    return matches
+
+async def remember_story(content_key: str, story_data: dict, state: Dict[str, Any]) -> None:
+    """Guarda en el índice la investigación y el plan de una historia procesada sin degradar."""
+    index = story_index
+    if index is None or not state.get("technical_plan"):
+        return
+    try:
+        with span("similarity.add"):
+            await run_in_worker(index_story, index, content_key, story_data,
+                                state.get("research_findings") or {}, state["technical_plan"])
+    except Exception as e:
+        logger.error(f"Error al guardar la historia en el índice de similitud: {e}")
+
+# Escrituras en el índice pendientes: se guardan las referencias para que no se recojan a medias.
+index_writes: set = set()
+
+def remember_story_later(content_key: str, story_data: dict, state: Dict[str, Any]) -> None:
+    """Guarda la historia en el índice en segundo plano: la respuesta no espera a la escritura."""
+    if story_index is None:
+        return
+    task = asyncio.create_task(remember_story(content_key, story_data, state))
+    index_writes.add(task)
+    task.add_done_callback(index_writes.discard)
+
+async def wait_for_index_writes() -> None:
+    if index_writes:
+        await asyncio.gather(*index_writes, return_exceptions=True)
+
+def reference_plans(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Planes de las historias similares que se dan al LLM como referencia."""
+    return [
+        {"title": match["title"], "similarity": round(match["score"], 3), "technical_plan": match["technical_plan"]}
+        for match in state.get("similar_stories") or []
+    ]
+
+# Historia sintética usada para calentar todos los nodos antes de recibir tráfico.
+WARMUP_STORY = {
+    "id": "WARMUP",
+    "title": "Exportar reporte de ventas en PDF",
+    "gherkin": "Scenario: Exportar reporte\n  Given el usuario está autenticado\n  When pulsa exportar\n  Then descarga el PDF",
+    "keywords": ["reporte", "pdf"],
+}
+
+async def warmup_services() -> None:
+    if WARMUP_MODE == "full":
+        await graph_app.ainvoke({"story_data": WARMUP_STORY})
+        return
+    await asyncio.gather(
+        run_in_worker(prediction_service.get().warmup, WARMUP_STORY),
+        research_service.get().warmup(WARMUP_STORY["title"], WARMUP_STORY["keywords"])
+    )
+
+async def watch_model_file() -> None:
+    """Recarga el modelo en caliente cuando MODEL_PATH pasa a apuntar a otro fichero o artefacto."""
+    while True:
+        await asyncio.sleep(MODEL_RELOAD_INTERVAL)
+        if not prediction_service.loaded:
+            continue
+        try:
+            await run_in_worker(prediction_service.get().reload_if_changed)
+        except Exception as e:
+            # Un artefacto incompleto o corrupto no tumba el worker: se sigue con el modelo actual.
+            logger.error(f"Error al recargar el modelo: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El servidor acepta conexiones de inmediato (/healthz responde); /readyz indica
+    # cuándo han terminado la carga y el calentamiento.
+    startup_task = asyncio.create_task(
+        startup_state.start(warmup_services if WARMUP_MODE != "off" else None)
+    )
+    background_tasks = [startup_task]
+    if MODEL_RELOAD_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(watch_model_file()))
+    global job_queue, story_index
+    if JOBS_PATH:
+        job_queue = create_job_queue(JOBS_PATH)
+        await job_queue.start()
+    if SIMILARITY_INDEX_PATH:
+        story_index = StoryIndex(SIMILARITY_INDEX_PATH, max_entries=SIMILARITY_INDEX_SIZE)
+    yield
+    for task in background_tasks:
+        task.cancel()
+    if job_queue is not None:
+        await job_queue.stop()
+        job_queue.store.close()
+        job_queue = None
+    if story_index is not None:
+        # Las escrituras pendientes terminan antes de cerrar la conexión del índice.
+        await wait_for_index_writes()
+        story_index.close()
+        story_index = None
+    # Se liberan las conexiones HTTP compartidas del servicio de investigación.
+    if research_service.loaded:
+        await research_service.get().close()
+    cpu_executor.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestContextMiddleware)
 
 # --- Definición del Estado del Grafo LangGraph ---
 # El estado es un diccionario que se pasa entre los nodos del grafo.
@@ -34,78 +214,454 @@ class GraphState(TypedDict):
     research_findings: Dict[str, Any]
     ml_estimate: Dict[str, Any]
     technical_plan: List[Dict[str, Any]]
+    # Instante límite (reloj `time.monotonic`) y etapas que se degradaron para cumplirlo.
+    deadline: float
+    degraded: Annotated[List[str], operator.add]
+    # Historias ya procesadas parecidas a esta (ver StoryIndex), de más a menos similar.
+    similar_stories: List[Dict[str, Any]]
 
 # --- Definición de los Nodos del Grafo ---
 # Cada nodo es una función que opera sobre el estado del grafo.
 
+def build_ml_estimate(effort: float, time: float) -> Dict[str, Any]:
+    return {"effort": effort, "time": time, "budget_hours": time}
+
+def remaining_seconds(state: GraphState) -> float | None:
+    deadline = state.get('deadline')
+    return None if deadline is None else deadline - time.monotonic()
+
+# Margen tras el límite de la investigación antes de abandonarla (resumir lo ya descargado).
+RESEARCH_GRACE_SECONDS = 0.5
+
 async def run_research(state: GraphState) -> Dict[str, Any]:
-    """Nodo que ejecuta la investigación web basada en la historia de usuario."""
-    print("--- Ejecutando Investigación ---")
+    """
+    Nodo que ejecuta la investigación web basada en la historia de usuario. Dispone de
+    una fracción del plazo restante y, al agotarla, devuelve lo reunido hasta entonces.
+    Si una historia ya procesada es casi idéntica, reutiliza su investigación sin salir a la web.
+    """
     story_data = state['story_data']
-    findings = await research_service.conduct_research(
-        story_data.get("title", ""), 
-        story_data.get("keywords", [])
-    )
-    return {"research_findings": findings}
-
-def run_prediction(state: GraphState) -> Dict[str, Any]:
-    """Nodo que ejecuta el modelo de predicción de ML."""
-    print("--- Ejecutando Predicción ML ---")
-    effort, time = prediction_service.predict(state['story_data'])
-    ml_estimate = {"effort": effort, "time": time, "budget_hours": time}
-    return {"ml_estimate": ml_estimate}
-
-def generate_technical_plan(state: GraphState) -> Dict[str, Any]:
-    """Nodo que genera el plan técnico final usando el LLM."""
-    print("--- Generando Plan Técnico ---")
-    plan = llm_plan_generator.generate_plan(
-        state['story_data'],
-        state['ml_estimate'],
-        state['research_findings']
-    )
+    similar_stories = await lookup_similar_stories(story_data)
+    reusable = similar_stories and similar_stories[0]["score"] >= SIMILARITY_REUSE_THRESHOLD
+    record_cache_lookup("similar_research", hit=bool(reusable))
+    if reusable:
+        best = similar_stories[0]
+        findings = {**best["research_findings"], "reused_from": best["story_id"] or best["title"]}
+        return {"research_findings": findings, "similar_stories": similar_stories}
+
+    async with stage_slot("research"):
+        remaining = remaining_seconds(state)
+        budget = None if remaining is None else max(0.0, remaining * RESEARCH_BUDGET_FRACTION)
+        with span("research", budget_seconds=budget):
+            try:
+                findings = await asyncio.wait_for(
+                    research_service.get().conduct_research(
+                        story_data.get("title", ""),
+                        story_data.get("keywords", []),
+                        deadline=None if budget is None else time.monotonic() + budget
+                    ),
+                    timeout=None if budget is None else budget + RESEARCH_GRACE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                findings = {"summary": "La investigación no terminó a tiempo.", "partial": True}
+    if findings.get("partial"):
+        return {"research_findings": findings, "similar_stories": similar_stories, "degraded": ["research"]}
+    return {"research_findings": findings, "similar_stories": similar_stories}
+
+async def run_prediction(state: GraphState) -> Dict[str, Any]:
+    """Nodo que ejecuta el modelo de predicción de ML (en el pool de hilos)."""
+    async with stage_slot("prediction"):
+        with span("prediction"):
+            effort, time = await run_in_worker(predict_story, state['story_data'])
+    return {"ml_estimate": build_ml_estimate(effort, time)}
+
+async def generate_plan_until(story_data: dict, ml_estimate: dict, research_findings: dict, deadline: float | None,
+                              similar_plans: List[dict] | None = None) -> List[Dict[str, Any]] | None:
+    """Plan del LLM si llega antes de `deadline`; None si no queda tiempo suficiente o no responde a tiempo."""
+    remaining = None if deadline is None else deadline - time.monotonic()
+    if remaining is not None and remaining < PLANNER_MIN_SECONDS:
+        return None
+    try:
+        return await asyncio.wait_for(
+            llm_plan_generator.get().agenerate_plan(story_data, ml_estimate, research_findings, similar_plans=similar_plans),
+            timeout=remaining
+        )
+    except asyncio.TimeoutError:
+        logger.warning("El LLM no respondió dentro del plazo; se devuelve el plan basado en la estimación ML.")
+        return None
+
+async def generate_technical_plan(state: GraphState) -> Dict[str, Any]:
+    """
+    Nodo que genera el plan técnico final usando el LLM con el plazo que queda. Si no
+    queda tiempo suficiente o el LLM no responde a tiempo, devuelve el plan basado sólo
+    en la estimación ML.
+    """
+    async with stage_slot("planner"):
+        with span("planner", budget_seconds=remaining_seconds(state)) as attributes:
+            plan = await generate_plan_until(state['story_data'], state['ml_estimate'], state['research_findings'],
+                                             state.get('deadline'), similar_plans=reference_plans(state))
+            if plan is None:
+                attributes["fallback"] = True
+                return {"technical_plan": build_fallback_plan(state['story_data'], state['ml_estimate']),
+                        "degraded": ["planner"]}
     return {"technical_plan": plan}
 
 # --- Construcción del Grafo con LangGraph ---
 
-# Se define el grafo de estados.
-workflow = StateGraph(GraphState)
+def build_workflow(include_planner: bool = True) -> StateGraph:
+    """
+    Construye el grafo. Sin planificador, el grafo sólo reúne el contexto
+    (investigación y predicción); lo usa el endpoint de streaming, que invoca
+    al LLM por su cuenta para poder emitir el plan token a token.
+    """
+    # Se define el grafo de estados.
+    workflow = StateGraph(GraphState)
+
+    # Se añaden los nodos al grafo.
+    workflow.add_node("research", run_research)
+    workflow.add_node("prediction", run_prediction)
+
+    # Se definen las transiciones: la investigación y la predicción no dependen entre sí,
+    # así que se ejecutan en paralelo y el planificador espera a ambas.
+    workflow.add_edge(START, "research")
+    workflow.add_edge(START, "prediction")
+
+    if include_planner:
+        workflow.add_node("planner", generate_technical_plan)
+        workflow.add_edge(["research", "prediction"], "planner")
+        workflow.add_edge("planner", END)
+    else:
+        workflow.add_edge(["research", "prediction"], END)
+    return workflow
 
-# Se añaden los nodos al grafo.
-workflow.add_node("research", run_research) 
-workflow.add_node("prediction", run_prediction)
-workflow.add_node("planner", generate_technical_plan)
+# Se compilan los grafos en aplicaciones ejecutables.
+graph_app = build_workflow().compile()
+context_graph_app = build_workflow(include_planner=False).compile()
 
-# Se definen las transiciones (el orden de ejecución).
-workflow.set_entry_point("research")
-workflow.add_edge("research", "prediction")
-workflow.add_edge("prediction", "planner")
-workflow.add_edge("planner", END)
+# --- Endpoints de FastAPI ---
 
-# Se compila el grafo en una aplicación ejecutable.
-graph_app = workflow.compile()
+@app.get("/healthz")
+async def healthz():
+    """Liveness: el proceso responde, aunque los servicios sigan cargándose."""
+    return {"status": "ok"}
 
-# --- Endpoint de FastAPI ---
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 sólo cuando los servicios están cargados y calentados."""
+    status = startup_state.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato de texto de Prometheus (por proceso: cada worker de uvicorn expone las suyas)."""
+    if job_queue is not None:
+        # La profundidad de la cola se lee de SQLite: incluye los trabajos de todos los procesos.
+        await job_queue.refresh_metrics()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Planes ya generados (por contenido de la historia) y ejecuciones en curso.
+plan_cache = LRUCache(PLAN_CACHE_SIZE, namespace="plan", ttl=PLAN_CACHE_TTL)
+# Historia asociada a cada Idempotency-Key: aparte, para que los planes no desalojen las claves ni al revés.
+idempotency_cache = LRUCache(IDEMPOTENCY_CACHE_SIZE, namespace="idempotency", ttl=IDEMPOTENCY_TTL)
+plan_flight = SingleFlight()
+# Los trabajos tienen un plazo mucho mayor que las solicitudes HTTP, así que se coalescen aparte:
+# una solicitud no espera al plazo de un trabajo ni un trabajo guarda el plan degradado de una solicitud.
+job_flight = SingleFlight()
+
+def plan_content_key(story_data: dict) -> str:
+    """Clave de contenido: la misma historia produce la misma clave sin importar el orden de los campos."""
+    canonical = json.dumps(story_data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def request_deadline(timeout_seconds: float | None) -> float:
+    return time.monotonic() + (timeout_seconds if timeout_seconds is not None else PLAN_TIMEOUT_SECONDS)
+
+async def run_plan_graph(content_key: str, story_data: dict, deadline: float) -> tuple[List[Dict[str, Any]], List[str]]:
+    final_state = await graph_app.ainvoke({"story_data": story_data, "deadline": deadline})
+    plan = final_state.get("technical_plan")
+    degraded = final_state.get("degraded") or []
+    # Un plan degradado no se reutiliza: el siguiente intento puede obtener el completo.
+    if not degraded:
+        if PLAN_CACHE_TTL > 0:
+            plan_cache.set(content_key, plan)
+        remember_story_later(content_key, story_data, final_state)
+    return plan, degraded
+
+async def run_coalesced_plan(flight: SingleFlight, content_key: str, story_data: dict,
+                             deadline: float) -> tuple[List[Dict[str, Any]], List[str], bool]:
+    """
+    Ejecuta el grafo para la historia o se une a la ejecución idéntica en curso en `flight`.
+    Esa ejecución sigue el plazo de quien la lanzó, así que quien se une la espera como mucho
+    hasta su propio plazo y, si no termina, recibe el plan basado en la estimación ML.
+    Devuelve (plan, etapas degradadas, compartida).
+    """
+    timeout = max(0.0, deadline - time.monotonic()) if flight.running(content_key) else None
+    try:
+        (plan, degraded), shared = await asyncio.wait_for(
+            flight.do(content_key, lambda: run_plan_graph(content_key, story_data, deadline)), timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        logger.warning("La ejecución compartida no terminó dentro del plazo; se devuelve el plan basado en la estimación ML.")
+        effort, hours = await run_in_worker(predict_story, story_data)
+        return build_fallback_plan(story_data, build_ml_estimate(effort, hours)), ["planner"], True
+    return plan, degraded, shared
 
 @app.post("/generate_plan/")
-async def generate_plan_endpoint(request: PlanRequest):
+async def generate_plan_endpoint(request: PlanRequest, response: Response,
+                                 idempotency_key: str | None = Header(default=None, alias="Idempotency-Key")):
     """
     Endpoint que recibe una historia de usuario e invoca el grafo de LangGraph
     para orquestar la generación del plan técnico completo.
+
+    Las solicitudes idénticas simultáneas comparten una única ejecución del grafo, y un
+    plan generado se reutiliza durante `PLAN_CACHE_TTL` segundos, también para los
+    reintentos que envían la misma cabecera `Idempotency-Key`. La cabecera `X-Plan-Cache`
+    indica si el plan se generó (`miss`), se reutilizó (`hit`) o se compartió (`coalesced`).
+
+    La solicitud tiene un plazo (`timeout_seconds` o PLAN_TIMEOUT_SECONDS): la investigación
+    se corta al agotar su parte y, si el LLM no llega a tiempo, se devuelve el plan basado en
+    la estimación ML. `X-Plan-Degraded` enumera las etapas que se degradaron.
     """
-    initial_state = {"story_data": request.story_data}
-    
+    content_key = plan_content_key(request.story_data)
+    deadline = request_deadline(request.timeout_seconds)
+    if idempotency_key is not None and IDEMPOTENCY_TTL > 0:
+        previous_key = idempotency_cache.get(idempotency_key)
+        if previous_key is not None and previous_key != content_key:
+            raise HTTPException(status_code=409, detail="La Idempotency-Key ya se usó con otra historia de usuario.")
+        idempotency_cache.set(idempotency_key, content_key)
+
+    plan = plan_cache.get(content_key) if PLAN_CACHE_TTL > 0 else None
+    if plan is not None:
+        response.headers["X-Plan-Cache"] = "hit"
+        return plan
+
     try:
-        # Se invoca el grafo con el estado inicial.
-        # LangGraph se encarga de ejecutar los nodos en el orden definido.
-        final_state = await graph_app.ainvoke(initial_state)
-        
-        # Se devuelve el resultado final del grafo.
-        return final_state.get("technical_plan")
-        
+        # Se invoca el grafo con el estado inicial (o se espera a la ejecución idéntica en curso).
+        # LangGraph ejecuta en paralelo los nodos independientes y respeta las dependencias.
+        plan, degraded, shared = await run_coalesced_plan(plan_flight, content_key, request.story_data, deadline)
     except Exception as e:
         # Manejo de errores durante la ejecución del grafo.
         raise HTTPException(status_code=500, detail=f"Ocurrió un error inesperado en el grafo: {str(e)}")
 
+    if shared:
+        SCHEDULER_EVENTS.inc(kind="plan", event="coalesced")
+    response.headers["X-Plan-Cache"] = "coalesced" if shared else "miss"
+    if degraded:
+        response.headers["X-Plan-Degraded"] = ",".join(degraded)
+    # Se devuelve el resultado final del grafo.
+    return plan
+
+# --- API de trabajos asíncronos ---
+# Para solicitudes que superan el timeout del gateway: se encola la historia y se consulta
+# el estado (con long-poll) y el resultado. La cola vive en SQLite y sobrevive a reinicios.
+job_queue: JobQueue | None = None
+
+async def run_plan_job(payload: dict) -> Dict[str, Any]:
+    """Ejecuta un trabajo de la cola: mismo grafo y caché que /generate_plan/, coalesciendo sólo entre trabajos."""
+    story_data = payload["story_data"]
+    content_key = plan_content_key(story_data)
+    plan = plan_cache.get(content_key) if PLAN_CACHE_TTL > 0 else None
+    if plan is not None:
+        return {"technical_plan": plan, "degraded": []}
+    timeout_seconds = payload.get("timeout_seconds")
+    deadline = request_deadline(timeout_seconds if timeout_seconds is not None else JOB_TIMEOUT_SECONDS)
+    plan, degraded, _ = await run_coalesced_plan(job_flight, content_key, story_data, deadline)
+    return {"technical_plan": plan, "degraded": degraded}
+
+def create_job_queue(path: str) -> JobQueue:
+    # Un trabajo en curso durante más que su plazo (con margen) pertenece a un proceso caído.
+    store = JobStore(path, lease_seconds=JOB_TIMEOUT_SECONDS + 60, retention_seconds=JOB_RETENTION_SECONDS)
+    return JobQueue(store, run_plan_job, workers=JOB_WORKERS, stage_limits=parse_stage_limits(JOB_STAGE_CONCURRENCY))
+
+def get_job_queue() -> JobQueue:
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="La API de trabajos no está activa (JOBS_PATH vacío).")
+    return job_queue
+
+def job_status(job: dict) -> Dict[str, Any]:
+    return {key: job[key] for key in ("id", "status", "attempts", "created_at", "started_at", "finished_at", "error")}
+
+@app.post("/jobs", status_code=202)
+async def submit_job_endpoint(request: PlanRequest, response: Response):
+    """Encola la generación de un plan y devuelve el identificador del trabajo."""
+    queue = get_job_queue()
+    job_id = await queue.submit({"story_data": request.story_data, "timeout_seconds": request.timeout_seconds})
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return {"id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job_endpoint(job_id: str, wait: float = 0.0):
+    """Estado del trabajo. Con `wait` (segundos, hasta JOB_MAX_WAIT_SECONDS) espera a que termine (long-poll)."""
+    queue = get_job_queue()
+    job = await queue.wait(job_id, min(max(wait, 0.0), JOB_MAX_WAIT_SECONDS))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado.")
+    return job_status(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result_endpoint(job_id: str, response: Response):
+    """Plan técnico de un trabajo terminado (409 mientras siga en cola o en ejecución)."""
+    job = await get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado.")
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=f"Ocurrió un error inesperado en el grafo: {job['error']}")
+    if job["status"] != DONE:
+        raise HTTPException(status_code=409, detail=f"El trabajo todavía no ha terminado (estado: {job['status']}).")
+    if job["result"]["degraded"]:
+        response.headers["X-Plan-Degraded"] = ",".join(job["result"]["degraded"])
+    return job["result"]["technical_plan"]
+
+def format_sse(event: str, data: Any) -> str:
+    """Serializa un evento en formato Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Eventos de progreso emitidos al terminar cada nodo de contexto.
+PROGRESS_EVENTS = {"research": "research_done", "prediction": "ml_estimate_ready"}
+# Campos del estado que llegan al cliente en esos eventos; el resto es interno (p. ej. las
+# historias similares, con la investigación y los planes de otras historias).
+PROGRESS_FIELDS = ("research_findings", "ml_estimate", "degraded")
+
+@app.post("/generate_plan/stream")
+async def generate_plan_stream_endpoint(request: PlanRequest):
+    """
+    Variante en streaming (SSE) de /generate_plan/. Emite un evento por cada etapa
+    completada (`research_done`, `ml_estimate_ready`), luego el plan parcialmente
+    parseado a medida que el LLM lo genera (`plan_partial`) y por último `plan`.
+
+    Respeta el mismo plazo que /generate_plan/: si el LLM no termina a tiempo, `plan` es
+    el plan basado en la estimación ML y antes se emite `degraded` con las etapas degradadas.
+    """
+    async def event_stream():
+        deadline = request_deadline(request.timeout_seconds)
+        state: Dict[str, Any] = {"story_data": request.story_data, "deadline": deadline}
+        try:
+            async for update in context_graph_app.astream(state, stream_mode="updates"):
+                for node, values in update.items():
+                    state.update(values)
+                    progress = {key: values[key] for key in PROGRESS_FIELDS if key in values}
+                    yield format_sse(PROGRESS_EVENTS.get(node, node), progress)
+
+            plan = None
+            remaining = deadline - time.monotonic()
+            with span("planner", streaming=True, budget_seconds=remaining) as attributes:
+                if remaining >= PLANNER_MIN_SECONDS:
+                    partial_plans = llm_plan_generator.get().astream_plan(
+                        state['story_data'],
+                        state['ml_estimate'],
+                        state['research_findings'],
+                        similar_plans=reference_plans(state)
+                    )
+                    try:
+                        while True:
+                            # Cada fragmento se espera sólo hasta el plazo: un LLM atascado no cuelga la respuesta.
+                            partial_plan = await asyncio.wait_for(
+                                anext(partial_plans), timeout=max(0.0, deadline - time.monotonic())
+                            )
+                            plan = partial_plan
+                            yield format_sse("plan_partial", partial_plan)
+                    except StopAsyncIteration:
+                        pass
+                    except asyncio.TimeoutError:
+                        logger.warning("El LLM no terminó dentro del plazo; se devuelve el plan basado en la estimación ML.")
+                        plan = None
+                    finally:
+                        await partial_plans.aclose()
+                if plan is None:
+                    attributes["fallback"] = True
+                    plan = build_fallback_plan(state['story_data'], state['ml_estimate'])
+                    state["degraded"] = (state.get("degraded") or []) + ["planner"]
+            if state.get("degraded"):
+                yield format_sse("degraded", state["degraded"])
+            yield format_sse("plan", plan)
+            if not state.get("degraded"):
+                remember_story_later(plan_content_key(request.story_data), request.story_data,
+                                     dict(state, technical_plan=plan))
+        except Exception as e:
+            # Los encabezados ya se enviaron: el error se comunica como un evento más.
+            yield format_sse("error", {"detail": f"Ocurrió un error inesperado en el grafo: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Límite de llamadas simultáneas al LLM desde el endpoint por lotes.
+batch_llm_semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+async def plan_batch_story(index: int, story_data: dict, ml_estimate: dict, research_findings: dict,
+                           deadline: float) -> Dict[str, Any]:
+    result = {"index": index, "story_id": story_data.get("id")}
+    degraded = ["research"] if research_findings.get("partial") else []
+    try:
+        async with batch_llm_semaphore:
+            plan = await generate_plan_until(story_data, ml_estimate, research_findings, deadline)
+        if plan is None:
+            plan = build_fallback_plan(story_data, ml_estimate)
+            degraded.append("planner")
+        result["technical_plan"] = plan
+    except Exception as e:
+        result["error"] = f"Error al generar el plan: {str(e)}"
+    if degraded:
+        result["degraded"] = degraded
+    return result
+
+async def research_batch_until(stories: List[dict], deadline: float) -> List[dict]:
+    """Investigación de un bloque con la misma fracción del plazo que run_research."""
+    budget = max(0.0, (deadline - time.monotonic()) * RESEARCH_BUDGET_FRACTION)
+    try:
+        return await asyncio.wait_for(
+            research_service.get().conduct_research_batch(
+                [(story.get("title", ""), story.get("keywords", [])) for story in stories],
+                deadline=time.monotonic() + budget
+            ),
+            timeout=budget + RESEARCH_GRACE_SECONDS
+        )
+    except asyncio.TimeoutError:
+        return [{"summary": "La investigación no terminó a tiempo.", "partial": True} for _ in stories]
+
+@app.post("/generate_plan/batch")
+async def generate_plan_batch_endpoint(request: BatchPlanRequest):
+    """
+    Genera planes para una lista de historias y los devuelve como NDJSON, una línea
+    por historia en cuanto su plan está listo (el campo `index` indica su posición).
+    Las historias se procesan por bloques: predicción vectorizada del bloque completo,
+    investigación con consultas deduplicadas y llamadas al LLM con concurrencia limitada.
+
+    Cada bloque tiene el plazo de una solicitud (`timeout_seconds` o PLAN_TIMEOUT_SECONDS),
+    repartido como en /generate_plan/; las líneas con etapas degradadas llevan `degraded`.
+    """
+    stories = request.stories
+
+    async def ndjson_stream():
+        for start in range(0, len(stories), BATCH_CHUNK_SIZE):
+            chunk = stories[start:start + BATCH_CHUNK_SIZE]
+            deadline = request_deadline(request.timeout_seconds)
+            try:
+                estimates, findings = await asyncio.gather(
+                    run_in_worker(predict_stories, chunk),
+                    research_batch_until(chunk, deadline)
+                )
+            except Exception as e:
+                for offset, story in enumerate(chunk):
+                    line = {"index": start + offset, "story_id": story.get("id"), "error": f"Ocurrió un error inesperado en el lote: {str(e)}"}
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+                continue
+
+            tasks = [
+                asyncio.create_task(plan_batch_story(start + offset, story, build_ml_estimate(*estimate), story_findings, deadline))
+                for offset, (story, estimate, story_findings) in enumerate(zip(chunk, estimates, findings))
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+            finally:
+                # Si el cliente se desconecta no se siguen consumiendo llamadas al LLM.
+                for task in tasks:
+                    task.cancel()
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
 # --- Ejecución de la aplicación ---
 
 if __name__ == "__main__":
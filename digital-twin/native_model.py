@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+
+# Arrays del artefacto: un fichero .npy por array, sin pickle.
+ARRAY_NAMES = [
+    'vocab_terms', 'vocab_columns', 'idf', 'scaler_mean', 'scaler_scale',
+    'tree_feature', 'tree_threshold', 'tree_left', 'tree_right', 'tree_value',
+    'tree_roots', 'tree_weights', 'tree_outputs', 'init_values',
+]
+
+# ---------------------------------------------------------------------------
+# Exportación: Pipeline de sklearn -> arrays planos
+
+def _export_tfidf(vectorizer) -> tuple[dict, dict]:
+    unsupported = (
+        vectorizer.analyzer != 'word' or tuple(vectorizer.ngram_range) != (1, 1)
+        or vectorizer.tokenizer is not None or vectorizer.preprocessor is not None
+        or vectorizer.stop_words is not None or vectorizer.strip_accents is not None
+        or vectorizer.norm not in ('l2', None)
+    )
+    if unsupported:
+        raise ValueError("Sólo se soporta TfidfVectorizer con analyzer='word', ngram_range=(1, 1) y sin preprocesado propio.")
+
+    terms = sorted(vectorizer.vocabulary_)
+    arrays = {
+        'vocab_terms': np.array(terms, dtype=str),
+        'vocab_columns': np.array([vectorizer.vocabulary_[term] for term in terms], dtype=np.int32),
+        'idf': np.asarray(vectorizer.idf_, dtype=np.float64) if vectorizer.use_idf else np.ones(len(terms)),
+    }
+    meta = {
+        'token_pattern': vectorizer.token_pattern,
+        'lowercase': bool(vectorizer.lowercase),
+        'binary': bool(vectorizer.binary),
+        'sublinear_tf': bool(vectorizer.sublinear_tf),
+        'norm': vectorizer.norm,
+        'n_features': len(terms),
+    }
+    return meta, arrays
+
+def _export_scaler(scaler) -> dict:
+    n_features = scaler.n_features_in_
+    return {
+        'scaler_mean': np.asarray(scaler.mean_ if scaler.with_mean else np.zeros(n_features), dtype=np.float64),
+        'scaler_scale': np.asarray(scaler.scale_ if scaler.with_std else np.ones(n_features), dtype=np.float64),
+    }
+
+def _export_trees(multi_output_model) -> tuple[dict, dict]:
+    features, thresholds, lefts, rights, values = [], [], [], [], []
+    roots, weights, outputs, init_values = [], [], [], []
+    offset, max_depth = 0, 0
+
+    for output, booster in enumerate(multi_output_model.estimators_):
+        if booster.init_ == 'zero':
+            init_values.append(0.0)
+        elif type(booster.init_).__name__ == 'DummyRegressor':
+            init_values.append(float(np.ravel(booster.init_.constant_)[0]))
+        else:
+            raise ValueError(f"Estimador inicial no soportado: {booster.init_!r}")
+
+        for stage in booster.estimators_[:, 0]:
+            tree = stage.tree_
+            node_ids = np.arange(tree.node_count, dtype=np.int32) + offset
+            is_leaf = tree.children_left == -1
+            # Las hojas apuntan a sí mismas, así el recorrido vectorizado puede dar
+            # siempre `max_depth` pasos sin ramas especiales.
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold).astype(np.float64))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset).astype(np.int32))
+            values.append(tree.value[:, 0, 0].astype(np.float64))
+            roots.append(offset)
+            weights.append(booster.learning_rate)
+            outputs.append(output)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        'tree_feature': np.concatenate(features), 'tree_threshold': np.concatenate(thresholds),
+        'tree_left': np.concatenate(lefts), 'tree_right': np.concatenate(rights),
+        'tree_value': np.concatenate(values),
+        'tree_roots': np.array(roots, dtype=np.int32), 'tree_weights': np.array(weights, dtype=np.float64),
+        'tree_outputs': np.array(outputs, dtype=np.int32), 'init_values': np.array(init_values, dtype=np.float64),
+    }
+    meta = {'max_depth': int(max_depth), 'n_outputs': len(init_values), 'n_trees': len(roots)}
+    return meta, arrays
+
+def export_pipeline(pipeline, path: str) -> None:
+    """
+    Compila un Pipeline(ColumnTransformer(TfidfVectorizer, StandardScaler),
+    MultiOutputRegressor(GradientBoostingRegressor)) ya entrenado a un directorio
+    con `meta.json` y un .npy por array.
+    """
+    preprocessor = pipeline.named_steps['preprocessor']
+    model = pipeline.named_steps['model']
+
+    meta = {'format_version': FORMAT_VERSION, 'blocks': []}
+    arrays = {}
+    for name, transformer, columns in preprocessor.transformers_:
+        kind = type(transformer).__name__
+        if transformer == 'drop':
+            continue
+        if kind == 'TfidfVectorizer':
+            tfidf_meta, tfidf_arrays = _export_tfidf(transformer)
+            meta['blocks'].append('text')
+            meta['text_column'] = columns
+            meta['tfidf'] = tfidf_meta
+            arrays.update(tfidf_arrays)
+        elif kind == 'StandardScaler':
+            meta['blocks'].append('numeric')
+            meta['numeric_columns'] = list(columns)
+            arrays.update(_export_scaler(transformer))
+        else:
+            raise ValueError(f"Transformador no soportado en '{name}': {kind}")
+    if sorted(meta['blocks']) != ['numeric', 'text']:
+        raise ValueError("El preprocesador debe tener exactamente un bloque de texto y uno numérico.")
+
+    tree_meta, tree_arrays = _export_trees(model)
+    meta['trees'] = tree_meta
+    arrays.update(tree_arrays)
+
+    os.makedirs(path, exist_ok=True)
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(path, f"{name}.npy"), arrays[name], allow_pickle=False)
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+def publish_artifact(artifact_path: str, link_path: str) -> None:
+    """
+    Apunta `link_path` (un symlink) a `artifact_path` de forma atómica: se crea un symlink
+    temporal y se renombra encima del actual con `os.replace`. Los workers que sirven desde
+    `link_path` ven el modelo anterior o el nuevo, nunca un directorio a medio escribir.
+    Los artefactos anteriores no se borran: los procesos que aún los tengan proyectados
+    siguen funcionando hasta recargar.
+    """
+    link_dir = os.path.dirname(os.path.abspath(link_path))
+    target = os.path.relpath(os.path.abspath(artifact_path), link_dir)
+    tmp_link = f"{link_path}.tmp-{os.getpid()}"
+    os.symlink(target, tmp_link)
+    try:
+        os.replace(tmp_link, link_path)
+    except OSError:
+        os.remove(tmp_link)
+        raise
+
+# ---------------------------------------------------------------------------
+# Evaluación: NumPy puro, sin sklearn ni pickle
+
+class NativeEffortModel:
+    """Evaluador vectorizado de un artefacto generado por `export_pipeline`."""
+    def __init__(self, meta: dict, arrays: dict):
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Versión de artefacto no soportada: {meta.get('format_version')}")
+        self.meta = meta
+        self.text_column = meta['text_column']
+        self.numeric_columns = meta['numeric_columns']
+        self._token_pattern = re.compile(meta['tfidf']['token_pattern'])
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str | None = 'r') -> 'NativeEffortModel':
+        """
+        Con `mmap_mode='r'` los arrays se proyectan en memoria en lugar de copiarse: todos los
+        workers del host comparten las mismas páginas (de sólo lectura) de la caché del sistema.
+        """
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+            for name in ARRAY_NAMES
+        }
+        return cls(meta, arrays)
+
+    def _tfidf(self, texts: list[str]) -> np.ndarray:
+        tfidf = self.meta['tfidf']
+        counts = np.zeros((len(texts), tfidf['n_features']))
+        rows, tokens = [], []
+        for row, text in enumerate(texts):
+            doc_tokens = self._token_pattern.findall(text.lower() if tfidf['lowercase'] else text)
+            tokens.extend(doc_tokens)
+            rows.extend([row] * len(doc_tokens))
+
+        if tokens and len(self.vocab_terms):
+            tokens = np.array(tokens, dtype=str)
+            positions = np.minimum(np.searchsorted(self.vocab_terms, tokens), len(self.vocab_terms) - 1)
+            found = self.vocab_terms[positions] == tokens
+            np.add.at(counts, (np.array(rows)[found], self.vocab_columns[positions[found]]), 1.0)
+
+        if tfidf['binary']:
+            counts = (counts > 0).astype(float)
+        if tfidf['sublinear_tf']:
+            present = counts > 0
+            counts[present] = np.log(counts[present]) + 1.0
+        counts *= self.idf
+        if tfidf['norm'] == 'l2':
+            norms = np.sqrt((counts ** 2).sum(axis=1, keepdims=True))
+            np.divide(counts, norms, out=counts, where=norms > 0)
+        return counts
+
+    def text_vectors(self, texts: list[str]) -> np.ndarray:
+        """Sólo el bloque TF-IDF: las mismas filas que daría el TfidfVectorizer ajustado."""
+        return self._tfidf(list(texts))
+
+    def transform(self, texts: list[str], numeric: np.ndarray) -> np.ndarray:
+        """Matriz de entrada de los árboles, idéntica a la salida del ColumnTransformer."""
+        blocks = {
+            'text': self._tfidf(list(texts)),
+            'numeric': (np.asarray(numeric, dtype=np.float64) - self.scaler_mean) / self.scaler_scale,
+        }
+        return np.hstack([blocks[name] for name in self.meta['blocks']])
+
+    def predict_arrays(self, texts: list[str], numeric: np.ndarray) -> np.ndarray:
+        # sklearn evalúa los árboles sobre float32; se replica para obtener los mismos cortes.
+        X = self.transform(texts, numeric).astype(np.float32)
+        n_samples = X.shape[0]
+        sample_index = np.arange(n_samples)[:, None]
+        nodes = np.broadcast_to(self.tree_roots, (n_samples, len(self.tree_roots))).copy()
+        for _ in range(self.meta['trees']['max_depth']):
+            go_left = X[sample_index, self.tree_feature[nodes]] <= self.tree_threshold[nodes]
+            nodes = np.where(go_left, self.tree_left[nodes], self.tree_right[nodes])
+
+        contributions = self.tree_value[nodes] * self.tree_weights
+        predictions = np.tile(self.init_values, (n_samples, 1))
+        for output in range(len(self.init_values)):
+            predictions[:, output] += contributions[:, self.tree_outputs == output].sum(axis=1)
+        return predictions
+
+    def predict(self, df: pd.DataFrame) -> np.ndarray:
+        """Misma interfaz que `Pipeline.predict`: recibe el DataFrame con las columnas de entrada."""
+        texts = df[self.text_column].astype(str).tolist()
+        numeric = df[self.numeric_columns].to_numpy(dtype=np.float64)
+        return self.predict_arrays(texts, numeric)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Exporta effort_model.joblib al formato nativo basado en arrays.")
+    parser.add_argument('model', help="Ruta del Pipeline serializado con joblib.")
+    parser.add_argument('output', help="Directorio de salida del artefacto nativo.")
+    parser.add_argument('--publish', metavar='LINK',
+                        help="Symlink que se apunta atómicamente al nuevo artefacto (p. ej. el MODEL_PATH en uso).")
+    args = parser.parse_args()
+
+    import joblib
+    export_pipeline(joblib.load(args.model), args.output)
+    print(f"Artefacto nativo escrito en '{args.output}'.")
+    if args.publish:
+        publish_artifact(args.output, args.publish)
+        print(f"'{args.publish}' apunta ahora a '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
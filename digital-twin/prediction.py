@@ -1,38 +1,218 @@
 import os
+import hashlib
 import logging
-import joblib
+import threading
+import numpy as np
 import pandas as pd
 import spacy
+from cache import DiskCache, LRUCache
 from config import extract_features
-from config import NUMERICAL_FEATURES
+from native_model import META_FILE, NativeEffortModel
+from telemetry import span
+from config import NUMERICAL_FEATURES, PREDICTION_N_PROCESS, PREDICTION_CACHE_SIZE, PREDICTION_CACHE_PATH
 
 logger = logging.getLogger(__name__)
 
+SPACY_MODEL = 'es_core_news_sm'
+# Only lemma_, is_stop and is_punct are used: the dependency parser and NER are not needed.
+# The morphologizer and attribute_ruler stay because the rule-based lemmatizer relies on POS tags.
+SPACY_EXCLUDED_COMPONENTS = ['parser', 'ner', 'senter']
+
+def file_fingerprint(path: str) -> str:
+    """SHA-256 of a file, or of every file in a directory (native model artifacts)."""
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path))
+    else:
+        files = [path]
+    digest = hashlib.sha256()
+    for file_path in files:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def load_model(model_path: str):
+    """
+    Loads the effort model. A directory is a native artifact (see native_model.py) and is
+    evaluated with NumPy only, its arrays memory-mapped so every worker process on the host
+    shares one read-only copy; any other path is a joblib-pickled sklearn Pipeline.
+    """
+    if os.path.isdir(model_path):
+        return NativeEffortModel.load(model_path, mmap_mode='r')
+    import joblib
+    return joblib.load(model_path)
+
+def model_signature(model_path: str) -> tuple:
+    """Cheap identity of the file (or artifact) behind model_path; changes when it is swapped."""
+    resolved = os.path.realpath(model_path)
+    stat_path = os.path.join(resolved, META_FILE) if os.path.isdir(resolved) else resolved
+    stat = os.stat(stat_path)
+    return resolved, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def load_spacy_model():
+    try:
+        return spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDED_COMPONENTS)
+    except OSError as e:
+        # Downloading at runtime made cold starts slow and failed without network access;
+        # the model is installed with the other dependencies instead.
+        raise RuntimeError(
+            f"spaCy model '{SPACY_MODEL}' is not installed. "
+            f"Run 'python -m spacy download {SPACY_MODEL}' when building the environment."
+        ) from e
+
+def _case_folded(text) -> str:
+    """
+    Lowercased text for the prediction key: spaCy and the keyword features already ignore
+    case, so both spellings get the same estimate. Whitespace is kept as is because it
+    changes the features (gherkin_length, multi-word terms). Text whose length changes
+    when lowercased (e.g. 'İ') is left untouched, since its character offsets would differ.
+    """
+    text = str(text)
+    lowered = text.lower()
+    return lowered if len(lowered) == len(text) else text
+
+def lemmatize_docs(nlp, texts, batch_size: int = 64, n_process: int = 1) -> list[str]:
+    """Lowercased lemmas without stop words or punctuation: the text the TF-IDF is fit on."""
+    docs = nlp.pipe((text.lower() for text in texts), batch_size=batch_size, n_process=n_process)
+    return [" ".join(token.lemma_ for token in doc if not token.is_stop and not token.is_punct) for doc in docs]
+
+def tfidf_vectors(pipeline, texts: list[str]) -> np.ndarray:
+    """
+    Rows of the model's fitted TF-IDF for already lemmatized texts, L2-normalized so that a
+    dot product is the cosine similarity. Works for sklearn Pipelines and native artifacts.
+    """
+    if isinstance(pipeline, NativeEffortModel):
+        vectors = pipeline.text_vectors(texts)
+    else:
+        vectors = _pipeline_vectorizer(pipeline).transform(texts).toarray()
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+def _pipeline_vectorizer(pipeline):
+    for _, transformer, _ in pipeline.named_steps['preprocessor'].transformers_:
+        if type(transformer).__name__ == 'TfidfVectorizer':
+            return transformer
+    raise ValueError("The model pipeline has no TfidfVectorizer.")
+
 class PredictionService:
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, n_process: int = PREDICTION_N_PROCESS,
+                 cache_size: int = PREDICTION_CACHE_SIZE, cache_path: str | None = PREDICTION_CACHE_PATH):
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model pipeline file not found at: {model_path}")
-        self.pipeline = joblib.load(model_path)
-        try:
-            self.nlp = spacy.load('es_core_news_sm')
-        except OSError:
-            logger.info("Downloading 'es_core_news_sm' spacy model.")
-            os.system("python -m spacy download es_core_news_sm")
-            self.nlp = spacy.load('es_core_news_sm')
+        self.model_path = model_path
+        self._reload_lock = threading.Lock()
+        # (pipeline, fingerprint, signature) is swapped as a single reference, so concurrent
+        # predictions never pair one model with another model's cache keys.
+        self._model = self._load_model_state()
+        self.n_process = n_process
+        self.nlp = load_spacy_model()
+
+        disk_cache = DiskCache(cache_path) if cache_path else None
+        self.lemma_cache = LRUCache(cache_size, disk=disk_cache, namespace="lemma")
+        self.prediction_cache = LRUCache(cache_size, disk=disk_cache, namespace="prediction")
         logger.info("[PredictionService] Prediction pipeline loaded successfully.")
 
+    def _load_model_state(self) -> tuple:
+        signature = model_signature(self.model_path)
+        # Cache keys include the model fingerprint, so a new model file invalidates them.
+        return load_model(self.model_path), file_fingerprint(self.model_path), signature
+
+    @property
+    def pipeline(self):
+        return self._model[0]
+
+    @property
+    def model_fingerprint(self) -> str:
+        return self._model[1]
+
+    def reload_if_changed(self) -> bool:
+        """
+        Swaps in a new model when the file (or the symlink) at model_path changed. In-flight
+        predictions keep using the model they started with.
+        """
+        with self._reload_lock:
+            if model_signature(self.model_path) == self._model[2]:
+                return False
+            self._model = self._load_model_state()
+        logger.info(f"[PredictionService] Model reloaded from {os.path.realpath(self.model_path)}.")
+        return True
+
+    def _lemma_key(self, text: str) -> str:
+        spacy_version = f"{self.nlp.meta.get('name')}-{self.nlp.meta.get('version')}"
+        return hashlib.sha256(f"{spacy_version}\x1f{text}".encode('utf-8')).hexdigest()
+
+    def _prediction_key(self, story_data: dict, fingerprint: str) -> str:
+        # Only the fields that feed the model are part of the key; edits to any other
+        # field (id, keywords, ...) hit the cache, and so do case-only edits (see _case_folded).
+        title, gherkin = (_case_folded(story_data.get(field, '')) for field in ('title', 'gherkin'))
+        content = f"{fingerprint}\x1f{title}\x1f{gherkin}"
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def cache_stats(self) -> dict:
+        return {"lemmas": self.lemma_cache.stats(), "predictions": self.prediction_cache.stats()}
+
+    def warmup(self, story_data: dict) -> tuple[float, float]:
+        """Runs a story through features, spaCy and the model without touching the caches."""
+        return self._predict_uncached([story_data], self.pipeline)[0]
+
+    def lemmatize_texts(self, texts: list[str], batch_size: int = 64) -> list[str]:
+        """Lemmatizes many texts in one nlp.pipe pass (optionally across processes)."""
+        lowered = [text.lower() for text in texts]
+        keys = [self._lemma_key(text) for text in lowered]
+        lemmas = [self.lemma_cache.get(key) for key in keys]
+        missing = [i for i, lemma in enumerate(lemmas) if lemma is None]
+        if not missing:
+            return lemmas
+
+        # Multiprocessing only pays off for large batches; small ones stay in-process.
+        n_process = self.n_process if len(missing) >= batch_size else 1
+        computed = lemmatize_docs(self.nlp, [lowered[i] for i in missing], batch_size, n_process)
+        for i, lemma in zip(missing, computed):
+            lemmas[i] = lemma
+            self.lemma_cache.set(keys[i], lemma)
+        return lemmas
+
     def lemmatize_text(self, text: str) -> str:
-        doc = self.nlp(text.lower())
-        return " ".join([token.lemma_ for token in doc if not token.is_stop and not token.is_punct])
+        return self.lemmatize_texts([text])[0]
+
+    def story_vectors(self, stories: list[dict]) -> tuple[np.ndarray, str]:
+        """
+        TF-IDF vectors of the stories (see tfidf_vectors) and the fingerprint of the model
+        that produced them: vectors from different models are not comparable.
+        """
+        pipeline, fingerprint, _ = self._model
+        df_featured = extract_features(pd.DataFrame(stories))
+        return tfidf_vectors(pipeline, self.lemmatize_texts(df_featured['full_text'].tolist())), fingerprint
 
     def predict(self, story_data: dict) -> tuple[float, float]:
-        single_story_df = pd.DataFrame([story_data])
-        df_featured = extract_features(single_story_df)
-        df_featured['full_text_lemmatized'] = df_featured['full_text'].apply(self.lemmatize_text)
-        
-        # Reorder columns to match model's expectations
-        df_featured = df_featured.reindex(columns=NUMERICAL_FEATURES, fill_value=0)
-        
-        prediction = self.pipeline.predict(df_featured)
-        effort, time = prediction[0]
-        return effort, time
+        return self.predict_batch([story_data])[0]
+
+    def predict_batch(self, stories: list[dict]) -> list[tuple[float, float]]:
+        """Predicts (effort, time) for several stories; cache misses share a single model call."""
+        pipeline, fingerprint, _ = self._model
+        keys = [self._prediction_key(story, fingerprint) for story in stories]
+        estimates = [self.prediction_cache.get(key) for key in keys]
+        missing = [i for i, estimate in enumerate(estimates) if estimate is None]
+        if missing:
+            computed = self._predict_uncached([stories[i] for i in missing], pipeline)
+            for i, estimate in zip(missing, computed):
+                estimates[i] = estimate
+                self.prediction_cache.set(keys[i], estimate)
+        return [tuple(estimate) for estimate in estimates]
+
+    def _predict_uncached(self, stories: list[dict], pipeline) -> list[tuple[float, float]]:
+        if not stories:
+            return []
+        with span("prediction.features", stories=len(stories)):
+            df_featured = extract_features(pd.DataFrame(stories))
+        with span("prediction.lemmatize", stories=len(stories)):
+            df_featured['full_text_lemmatized'] = self.lemmatize_texts(df_featured['full_text'].tolist())
+
+        # Reorder columns to match model's expectations (the TF-IDF input must be kept)
+        df_featured = df_featured.reindex(columns=NUMERICAL_FEATURES + ['full_text_lemmatized'], fill_value=0)
+
+        with span("prediction.model", stories=len(stories)):
+            predictions = pipeline.predict(df_featured)
+        return [(float(effort), float(time)) for effort, time in predictions]
@@ -2,13 +2,16 @@ import logging
 import json
 import os
 from dotenv import load_dotenv
-from typing import List, Literal
+from typing import Any, AsyncIterator, List, Literal
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.pydantic_v1 import BaseModel, Field
 
+from telemetry import LLM_TOKENS
+
 # Cargar variables de entorno desde .env
 load_dotenv()
 
@@ -41,11 +44,17 @@ class TechnicalPlan(BaseModel):
     key_considerations: List[str] = Field(description="Puntos clave a tener en cuenta durante la implementación.")
     risks_and_dependencies: RisksAndDependencies
 
-def build_prompt_text(story_data: str, ml_estimate: str, research_findings: str) -> str:
+def build_prompt_text(story_data: str, ml_estimate: str, research_findings: str, similar_plans: str | None = None) -> str:
     """
     Genera el texto del prompt para el modelo.
     Los detalles de la estructura JSON serán añadidos por el parser de LangChain.
+    `similar_plans` son los planes de historias parecidas ya resueltas, si las hay.
     """
+    references = "" if not similar_plans else f"""
+**Planes de Historias Similares (Referencia):**
+Planes ya generados para historias parecidas. Úsalos como punto de partida, pero ajústalos a esta historia y a su presupuesto.
+{similar_plans}
+"""
     return f"""
 Actúa como un Tech Lead experto en ingeniería de software.
 Tu misión es crear un **plan técnico realizable y concreto** a partir de una historia de usuario,
@@ -60,7 +69,7 @@ respetando un presupuesto fijo de horas proveniente del modelo de estimación de
 
 **Investigación Adicional (Contexto):**
 {research_findings}
-
+{references}
 ---
 
 ### Instrucciones
@@ -73,10 +82,73 @@ respetando un presupuesto fijo de horas proveniente del modelo de estimación de
 6.  **Genera** la respuesta JSON con un único plan técnico dentro de una lista.
 """
 
+# Desglose genérico del presupuesto de horas para el plan de respaldo (sin LLM).
+FALLBACK_TASKS = [
+    ("Análisis y diseño técnico", 0.2, "Revisar la historia y sus criterios de aceptación y definir el diseño de la solución."),
+    ("Implementación", 0.5, "Desarrollar la funcionalidad descrita en los escenarios Gherkin."),
+    ("Pruebas", 0.2, "Cubrir los escenarios de aceptación y los casos de error con pruebas automatizadas."),
+    ("Revisión y despliegue", 0.1, "Revisión de código, documentación y despliegue del cambio."),
+]
+
+def build_fallback_plan(story_data: dict, ml_estimate: dict) -> List[dict]:
+    """
+    Plan técnico mínimo construido sólo a partir de la estimación ML, con la misma
+    estructura que `TechnicalPlan`. Se devuelve cuando el LLM no puede responder dentro
+    del plazo de la solicitud.
+    """
+    effort = float(ml_estimate.get("effort", 0.0))
+    budget_hours = float(ml_estimate.get("budget_hours", ml_estimate.get("time", 0.0)))
+    complexity = "Low" if effort <= 3 else "Medium" if effort <= 8 else "High"
+    return [{
+        "story_id": str(story_data.get("id") or "STORY-FALLBACK"),
+        "story_title": story_data.get("title", ""),
+        "ml_estimate_accepted": True,
+        "effort": effort,
+        "time": float(ml_estimate.get("time", budget_hours)),
+        "overall_complexity": complexity,
+        "action_plan": {
+            "description": "Plan generado a partir de la estimación ML, sin análisis del LLM (no respondió a tiempo).",
+            "tasks": [
+                {"task_name": f"{i}. {name}", "estimated_hours": round(budget_hours * share, 2), "details": details}
+                for i, (name, share, details) in enumerate(FALLBACK_TASKS, start=1)
+            ],
+        },
+        "key_considerations": ["Plan provisional: conviene regenerarlo para obtener un desglose técnico detallado."],
+        "risks_and_dependencies": {"dependencies": [], "risks": ["El desglose no tiene en cuenta los detalles técnicos de la historia."]},
+    }]
+
+def _token_usage(response) -> tuple[int, int]:
+    """(tokens de prompt, tokens de completion) de un LLMResult, según lo informe el proveedor."""
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not (prompt_tokens or completion_tokens):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Acumula en `digital_twin_llm_tokens_total` los tokens de cada llamada al LLM."""
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        prompt_tokens, completion_tokens = _token_usage(response)
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, kind="completion")
+
+
 class LLMPlanGenerator:
-    def __init__(self):
+    def __init__(self, llm: Any = None):
+        """`llm` permite inyectar otro modelo de chat de LangChain (p. ej. el LLM falso de los benchmarks)."""
         api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
+        if llm is None and not api_key:
             raise ValueError("La variable de entorno GOOGLE_API_KEY no está configurada.")
         
         # El parser se instancia con el modelo Pydantic que define la estructura de salida.
@@ -90,27 +162,62 @@ class LLMPlanGenerator:
         )
         
         # Se configura el LLM. `temperature=0.2` para un equilibrio entre creatividad y consistencia.
-        self.llm = ChatGoogleGenerativeAI(model="gemini-pro", google_api_key=api_key, temperature=0.2)
+        self.llm = llm or ChatGoogleGenerativeAI(model="gemini-pro", google_api_key=api_key, temperature=0.2)
         
         # Se construye la cadena de LangChain.
         self.chain = prompt_template | self.llm | self.parser
+        self.run_config = {"callbacks": [TokenUsageCallback()]}
         logger.info("LLMPlanGenerator inicializado con LangChain, Gemini-Pro y JsonOutputParser.")
 
-    def generate_plan(self, story_data: dict, ml_estimate: dict, research_findings: dict) -> List[dict]:
-        """
-        Genera un plan de implementación técnico detallado utilizando el LLM con LangChain.
-        """
-        prompt = build_prompt_text(
+    def _build_prompt(self, story_data: dict, ml_estimate: dict, research_findings: dict,
+                      similar_plans: List[dict] | None = None) -> str:
+        return build_prompt_text(
             story_data=json.dumps(story_data, indent=2, ensure_ascii=False),
             ml_estimate=json.dumps(ml_estimate, indent=2),
-            research_findings=json.dumps(research_findings, indent=2, ensure_ascii=False)
+            research_findings=json.dumps(research_findings, indent=2, ensure_ascii=False),
+            similar_plans=json.dumps(similar_plans, indent=2, ensure_ascii=False) if similar_plans else None
         )
+
+    def generate_plan(self, story_data: dict, ml_estimate: dict, research_findings: dict,
+                      similar_plans: List[dict] | None = None) -> List[dict]:
+        """
+        Genera un plan de implementación técnico detallado utilizando el LLM con LangChain.
+        """
+        prompt = self._build_prompt(story_data, ml_estimate, research_findings, similar_plans)
         
         try:
             # Se invoca la cadena con el prompt. El parser se encarga de devolver un dict/list.
-            technical_plan = self.chain.invoke({"prompt": prompt})
+            technical_plan = self.chain.invoke({"prompt": prompt}, config=self.run_config)
             return technical_plan
         except Exception as e:
             logger.error(f"Error inesperado al generar el plan con LangChain: {e}")
             # Aquí podrías añadir lógica de reintentos o manejo de errores más específico.
             raise
+
+    async def agenerate_plan(self, story_data: dict, ml_estimate: dict, research_findings: dict,
+                             similar_plans: List[dict] | None = None) -> List[dict]:
+        """
+        Versión asíncrona de `generate_plan`: no bloquea el event loop durante la llamada a Gemini.
+        """
+        prompt = self._build_prompt(story_data, ml_estimate, research_findings, similar_plans)
+
+        try:
+            return await self.chain.ainvoke({"prompt": prompt}, config=self.run_config)
+        except Exception as e:
+            logger.error(f"Error inesperado al generar el plan con LangChain: {e}")
+            raise
+
+    async def astream_plan(self, story_data: dict, ml_estimate: dict, research_findings: dict,
+                           similar_plans: List[dict] | None = None) -> AsyncIterator[Any]:
+        """
+        Genera el plan en streaming. `JsonOutputParser` emite el JSON parcialmente
+        parseado a medida que llegan los tokens; cada elemento es el estado acumulado.
+        """
+        prompt = self._build_prompt(story_data, ml_estimate, research_findings, similar_plans)
+
+        try:
+            async for partial_plan in self.chain.astream({"prompt": prompt}, config=self.run_config):
+                yield partial_plan
+        except Exception as e:
+            logger.error(f"Error inesperado al generar el plan en streaming con LangChain: {e}")
+            raise
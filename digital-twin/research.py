@@ -5,29 +5,89 @@ import re
 import logging
 import ssl
 import socket
+import time
 import certifi
-from typing import List, Set, Dict
-from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
-from playwright_stealth import Stealth
+from typing import List, Set, Dict, Tuple
 
-from config import GOOGLE_API_KEY, GOOGLE_CX
+from browser_pool import BrowserPool
+from cache import DiskCache
+from html_text import extract_text_from_html
+from scheduler import QuotaExhausted, RequestScheduler
+from summarizer import StreamingSummarizer, cap_page_text
+from telemetry import FETCH_FAILURES, record_cache_lookup, span
+from config import GOOGLE_API_KEY, GOOGLE_CX, GOOGLE_SEARCH_URL, RESEARCH_MAX_CONCURRENCY, BROWSER_POOL_SIZE
+from config import RESEARCH_CACHE_PATH, RESEARCH_CACHE_MAX_BYTES, RESEARCH_CACHE_SEARCH_TTL, RESEARCH_CACHE_PAGE_TTL
+from config import RESEARCH_MAX_PAGE_BYTES
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Indicios de que una página es un "shell" que sólo muestra contenido tras ejecutar JavaScript.
+_JS_REQUIRED_PATTERN = re.compile(
+    r'<noscript[^>]*>[^<]*javascript|<div id="(?:root|app|__next)"></div>',
+    re.IGNORECASE
+)
+
 class ResearchService:
-    def __init__(self, tech_stack_file: str = 'model/tech_stack.json'):
+    def __init__(self, tech_stack_file: str = 'model/tech_stack.json', max_concurrency: int = RESEARCH_MAX_CONCURRENCY,
+                 browser_pool_size: int = BROWSER_POOL_SIZE, cache_path: str | None = RESEARCH_CACHE_PATH,
+                 search_url: str = GOOGLE_SEARCH_URL, scheduler: RequestScheduler | None = None):
         if not GOOGLE_API_KEY or not GOOGLE_CX:
             raise ValueError("GOOGLE_API_KEY y GOOGLE_CX deben estar configuradas en las variables de entorno.")
         
         self.google_api_key = GOOGLE_API_KEY
         self.google_cx = GOOGLE_CX
+        self.search_url = search_url
         self.request_timeout = 15
         self.max_results_per_query = [3, 1]
         self.max_sentences_summary = 4
-        self.search_delay = 0.5
+        # Tope de texto por página: acota la memoria, la caché y el coste del resumen.
+        self.max_page_bytes = RESEARCH_MAX_PAGE_BYTES
+        self.max_concurrency = max(1, max_concurrency)
+        # Por debajo de este número de caracteres se asume que la página necesita JavaScript.
+        self.min_static_text_length = 500
         self.tech_stack = self._load_tech_stack(tech_stack_file)
+        # Caché persistente de búsquedas (consulta→enlaces) y páginas (URL→texto limpio).
+        self.cache = DiskCache(cache_path, max_bytes=RESEARCH_CACHE_MAX_BYTES) if cache_path else None
+        self.search_cache_ttl = RESEARCH_CACHE_SEARCH_TTL
+        self.page_cache_ttl = RESEARCH_CACHE_PAGE_TTL
+
+        # Límite global de búsquedas y descargas simultáneas para todo el servicio.
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # Ritmo por API key y por host, cuota y coalescencia de peticiones idénticas entre solicitudes.
+        self.scheduler = scheduler or RequestScheduler()
+        # Sesión HTTP compartida (pool de conexiones) durante la vida del servicio.
+        self._session: aiohttp.ClientSession | None = None
+        self._session_loop: asyncio.AbstractEventLoop | None = None
+        # Navegador persistente, sólo para páginas que requieren renderizado.
+        self.browser_pool = BrowserPool(max_pages=browser_pool_size, navigation_timeout=self.request_timeout)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            ssl_context = ssl.create_default_context(cafile=certifi.where())
+            connector = aiohttp.TCPConnector(ssl=ssl_context, limit=self.max_concurrency * 2, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        """Cierra la sesión HTTP, el navegador y la caché. Se invoca al apagar la aplicación."""
+        await self.browser_pool.close()
+        if self.cache is not None:
+            logger.info(f"Estadísticas de la caché de investigación: {self.cache.stats()}")
+            self.cache.close()
+            self.cache = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    async def warmup(self, title: str, keywords: List[str]) -> None:
+        """Prepara la sesión HTTP y la planificación de consultas sin hacer peticiones externas."""
+        await self._get_session()
+        for query, _ in self._plan_searches(title, keywords):
+            self._summarize_text(query, keywords)
 
     def _load_tech_stack(self, stack_file: str) -> List[str]:
         try:
@@ -56,89 +116,253 @@ class ResearchService:
 
         return sorted(list(generated_queries), key=len, reverse=True)
 
-    async def _get_content_from_url(self, url: str) -> str | None:
-        try:
-            with  Stealth().use_sync(sync_playwright()) as p:
-                browser = await p.chromium.launch(headless=True)
-                page = await browser.new_page()
+    async def _fetch_static_html(self, url: str) -> str | None:
+        """Camino rápido: descarga el HTML con una petición HTTP simple, sin navegador (None si no es HTML)."""
+        session = await self._get_session()
+        headers = {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36'}
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=self.request_timeout)) as response:
+            # Un error HTTP (404, 500, 403...) se propaga: renderizar la página no lo arregla.
+            response.raise_for_status()
+            if 'html' not in response.headers.get('Content-Type', ''):
+                return None
+            return await response.text(errors='replace')
+
+    def _needs_javascript(self, html: str, text: str) -> bool:
+        return len(text) < self.min_static_text_length or bool(_JS_REQUIRED_PATTERN.search(html))
 
-                await page.goto(url, wait_until="domcontentloaded")
-                await page.mouse.move(200, 300)
-                await asyncio.sleep(2) # Espera para cualquier renderizado dinámico
+    async def _get_content_from_url(self, url: str) -> str | None:
+        with span("research.fetch_page", url=url) as attributes:
+            try:
+                try:
+                    html = await self._fetch_static_html(url)
+                except aiohttp.ClientResponseError as e:
+                    logger.info(f"{url} respondió {e.status}; se descarta sin abrir el navegador.")
+                    FETCH_FAILURES.inc(kind="page")
+                    attributes["http_status"] = e.status
+                    attributes["failed"] = True
+                    return None
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.info(f"Descarga HTTP simple falló para {url} ({e}); se usará el navegador.")
+                    html = None
 
-                html = await page.content()
-                await browser.close()
+                if html is not None:
+                    # El análisis es CPU pura: se hace en un hilo para no bloquear el event loop.
+                    text = await asyncio.to_thread(extract_text_from_html, html, self.max_page_bytes)
+                    if not self._needs_javascript(html, text):
+                        attributes["method"] = "static"
+                        return cap_page_text(text, self.max_page_bytes)
 
-                soup = BeautifulSoup(html, 'html.parser')
-                for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
-                    tag.decompose()
+                attributes["method"] = "browser"
+                html = await self.browser_pool.fetch_html(url)
+                text = await asyncio.to_thread(extract_text_from_html, html, self.max_page_bytes)
+                return cap_page_text(text, self.max_page_bytes)
+            except Exception as e:
+                logger.warning(f"Error al obtener contenido de {url}: {e}")
+                FETCH_FAILURES.inc(kind="page")
+                attributes["failed"] = True
+                return None
 
-                elements = soup.find_all(['p', 'h1', 'h2', 'h3', 'code', 'pre', 'li'])
-                full_text = ' '.join([e.get_text(separator=' ', strip=True) for e in elements])
-                return re.sub(r'\s+', ' ', full_text).strip()
-        except Exception as e:
-            logger.warning(f"Error al obtener contenido de {url}: {e}")
-            return None
+    def _new_summarizer(self, keywords: List[str]) -> StreamingSummarizer:
+        return StreamingSummarizer(keywords, max_sentences=self.max_sentences_summary, max_page_bytes=self.max_page_bytes)
 
     def _summarize_text(self, text: str, keywords: List[str]) -> str:
-        sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|?)\s', text)
-        all_keywords = set(keywords)
-        scored_sentences = {}
-
-        for i, sentence in enumerate(sentences):
-            if len(sentence) > 10:
-                score = sum(1 for keyword in all_keywords if keyword.lower() in sentence.lower())
-                if score > 0:
-                    scored_sentences[i] = (score, sentence)
-
-        if not scored_sentences:
-            return "No se encontraron frases relevantes para las palabras clave proporcionadas."
-        
-        best_sentences = sorted(scored_sentences.values(), key=lambda x: x[0], reverse=True)
-        return ' '.join(s[1] for s in best_sentences[:self.max_sentences_summary])
+        summarizer = self._new_summarizer(keywords)
+        summarizer.add_page(text)
+        return summarizer.summary()
+
+    @staticmethod
+    def _search_cache_key(query: str, num_results: int) -> str:
+        return f"{num_results}|{' '.join(query.lower().split())}"
 
     async def _search_with_google_api(self, query: str, num_results: int) -> List[str]:
-        url = "https://www.googleapis.com/customsearch/v1"
         params = {'key': self.google_api_key, 'cx': self.google_cx, 'q': query, 'num': num_results}
-        
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
 
-        try:
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.get(url, params=params, timeout=self.request_timeout) as response:
+        with span("research.search", query=query) as attributes:
+            try:
+                session = await self._get_session()
+                async with session.get(self.search_url, params=params, timeout=aiohttp.ClientTimeout(total=self.request_timeout)) as response:
+                    attributes["http_status"] = response.status
+                    if response.status == 429:
+                        retry_after = response.headers.get('Retry-After', '')
+                        self.scheduler.mark_quota_exhausted(self.google_api_key, float(retry_after) if retry_after.isdigit() else 60.0)
+                        FETCH_FAILURES.inc(kind="search")
+                        raise QuotaExhausted("La API de búsqueda respondió 429.")
                     if response.status == 200:
                         data = await response.json()
-                        return [item['link'] for item in data.get('items', [])]
+                        links = [item['link'] for item in data.get('items', [])]
+                        if self.cache is not None:
+                            await asyncio.to_thread(self.cache.set, "search", self._search_cache_key(query, num_results),
+                                                    links, ttl=self.search_cache_ttl)
+                        return links
                     else:
                         logger.error(f"Error en la API de Google ({response.status}): {await response.text()}")
+                        FETCH_FAILURES.inc(kind="search")
                         return []
-        except Exception as e:
-            logger.error(f"Error de conexión durante la búsqueda: {e}")
-            return []
+            except QuotaExhausted:
+                raise
+            except Exception as e:
+                logger.error(f"Error de conexión durante la búsqueda: {e}")
+                FETCH_FAILURES.inc(kind="search")
+                return []
 
-    async def conduct_research(self, title: str, keywords: List[str]) -> dict:
-        smart_queries = self._generate_technical_queries(title, keywords)
-        logger.info(f"Consultas técnicas generadas: {smart_queries}")
+    async def _search(self, query: str, num_results: int) -> List[str]:
+        cache_key = self._search_cache_key(query, num_results)
+        if self.cache is not None:
+            # SQLite es E/S bloqueante: la caché se consulta fuera del event loop.
+            links = await asyncio.to_thread(self.cache.get, "search", cache_key)
+            record_cache_lookup("research_search", links is not None)
+            if links is not None:
+                return links
 
-        all_content = ""
-        processed_urls = set()
+        async def search() -> List[str]:
+            async with self._semaphore:
+                return await self._search_with_google_api(query, num_results)
 
-        for i, query in enumerate(smart_queries[:3]): # Limitar a 3 consultas para eficiencia
-            num_results = self.max_results_per_query[0 if i == 0 else 1]
-            search_results = await self._search_with_google_api(query, num_results)
+        try:
+            return await self.scheduler.search(self.google_api_key, cache_key, search)
+        except QuotaExhausted as e:
+            # Sin cuota se degrada a los enlaces caducados de la caché o a ninguno, sin fallar.
+            logger.warning(f"Búsqueda '{query}' omitida: {e}")
+            if self.cache is None:
+                return []
+            return await asyncio.to_thread(self.cache.get, "search", cache_key, allow_expired=True) or []
 
-            for url in search_results:
-                if url not in processed_urls:
-                    processed_urls.add(url)
-                    content = await self._get_content_from_url(url)
-                    if content:
-                        all_content += content + " "
-                    await asyncio.sleep(self.search_delay)
+    async def _get_page_text(self, url: str) -> str | None:
+        if self.cache is not None:
+            text = await asyncio.to_thread(self.cache.get, "page", url)
+            record_cache_lookup("research_page", text is not None)
+            if text is not None:
+                return text
 
-        if not all_content:
-            summary = "No se pudo encontrar contenido relevante en la web."
-        else:
-            summary = self._summarize_text(all_content, keywords)
-        
-        return {"summary": summary}
+        async def download() -> str | None:
+            async with self._semaphore:
+                text = await self._get_content_from_url(url)
+            if text and self.cache is not None:
+                await asyncio.to_thread(self.cache.set, "page", url, text, ttl=self.page_cache_ttl)
+            return text
+
+        try:
+            return await self.scheduler.fetch_page(url, download)
+        except QuotaExhausted as e:
+            logger.warning(f"Página {url} omitida: {e}")
+            if self.cache is None:
+                return None
+            return await asyncio.to_thread(self.cache.get, "page", url, allow_expired=True)
+
+    def _plan_searches(self, title: str, keywords: List[str]) -> List[Tuple[str, int]]:
+        """Consultas (y número de resultados) para una historia; limitadas a 3 por eficiencia."""
+        smart_queries = self._generate_technical_queries(title, keywords)[:3]
+        return [(query, self.max_results_per_query[0 if i == 0 else 1]) for i, query in enumerate(smart_queries)]
+
+    @staticmethod
+    async def _run_until(coroutines: list, deadline: float | None) -> Tuple[list, bool]:
+        """
+        Ejecuta las corrutinas en paralelo hasta `deadline` (reloj `time.monotonic`).
+        Devuelve sus resultados (la excepción si fallaron, None si no terminaron a tiempo)
+        y si se alcanzó el límite; las que siguen en curso se cancelan.
+        """
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        if not tasks:
+            return [], False
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        for task in pending:
+            task.cancel()
+        results = [
+            None if task in pending else (task.exception() or task.result())
+            for task in tasks
+        ]
+        return results, bool(pending)
+
+    async def _search_all(self, searches: Dict[str, int], deadline: float | None = None) -> Tuple[Dict[str, List[str]], bool]:
+        """Lanza todas las búsquedas a la vez; las que fallan o no terminan a tiempo devuelven una lista vacía."""
+        queries = list(searches)
+        results, timed_out = await self._run_until(
+            [self._search(query, searches[query]) for query in queries], deadline
+        )
+        links_by_query: Dict[str, List[str]] = {}
+        for query, result in zip(queries, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"La búsqueda '{query}' falló: {result}")
+                result = []
+            links_by_query[query] = result or []
+        return links_by_query, timed_out
+
+    async def _fetch_and_summarize(self, urls: List[str], readers: Dict[str, List[Tuple[int, int]]],
+                                   summarizers: List[StreamingSummarizer], deadline: float | None = None) -> Tuple[List[bool], bool]:
+        """
+        Descarga todas las páginas en paralelo y pasa cada una, en cuanto llega, a los
+        resúmenes de las historias que la usan (`readers`: URL → [(historia, orden de la página)]).
+        Las que fallan o no llegan antes de `deadline` se descartan (resultado parcial).
+        Devuelve qué historias recibieron contenido y si se alcanzó el límite.
+        """
+        has_content = [False] * len(summarizers)
+
+        async def fetch_and_feed(url: str) -> None:
+            try:
+                text = await self._get_page_text(url)
+            except Exception as e:
+                logger.warning(f"Error al obtener contenido de {url}: {e}")
+                return
+            if not text:
+                return
+            with span("research.summarize", url=url, chars=len(text)):
+                for story_index, page_index in readers[url]:
+                    summarizers[story_index].add_page(text, page_index)
+                    has_content[story_index] = True
+
+        _, timed_out = await self._run_until([fetch_and_feed(url) for url in urls], deadline)
+        return has_content, timed_out
+
+    async def conduct_research_batch(self, stories: List[Tuple[str, List[str]]], deadline: float | None = None) -> List[dict]:
+        """
+        Investiga varias historias (título, keywords) a la vez. Las consultas y URLs
+        que comparten las historias se buscan y descargan una sola vez.
+        Con `deadline` (reloj `time.monotonic`), la investigación se detiene al alcanzarlo
+        y resume lo reunido hasta entonces; esos resultados se marcan con `partial`.
+        """
+        plans = [self._plan_searches(title, keywords) for title, keywords in stories]
+        searches: Dict[str, int] = {}
+        for plan in plans:
+            logger.info(f"Consultas técnicas generadas: {[query for query, _ in plan]}")
+            for query, num_results in plan:
+                searches[query] = max(searches.get(query, 0), num_results)
+
+        with span("research.search_all", queries=len(searches)):
+            links_by_query, search_timed_out = await self._search_all(searches, deadline)
+
+        # URLs únicas por historia, en orden de consulta.
+        urls_per_story = [
+            list(dict.fromkeys(link for query, num_results in plan for link in links_by_query[query][:num_results]))
+            for plan in plans
+        ]
+        readers: Dict[str, List[Tuple[int, int]]] = {}
+        for story_index, urls in enumerate(urls_per_story):
+            for page_index, url in enumerate(urls):
+                readers.setdefault(url, []).append((story_index, page_index))
+
+        # Cada página se resume en cuanto llega y no se conserva: sólo quedan las mejores frases.
+        summarizers = [self._new_summarizer(keywords) for _, keywords in stories]
+        with span("research.fetch_all", urls=len(readers)):
+            has_content, fetch_timed_out = await self._fetch_and_summarize(list(readers), readers, summarizers, deadline)
+
+        partial = search_timed_out or fetch_timed_out
+        if partial:
+            logger.warning("La investigación alcanzó su límite de tiempo; se usa el contenido reunido hasta ahora.")
+        findings = []
+        for summarizer, story_has_content in zip(summarizers, has_content):
+            if not story_has_content:
+                summary = "No se pudo encontrar contenido relevante en la web."
+            else:
+                summary = summarizer.summary()
+            findings.append({"summary": summary, "partial": True} if partial else {"summary": summary})
+        return findings
+
+    async def conduct_research(self, title: str, keywords: List[str], deadline: float | None = None) -> dict:
+        findings = await self.conduct_research_batch([(title, keywords)], deadline)
+        return findings[0]
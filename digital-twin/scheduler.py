@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from urllib.parse import urlsplit
+
+from config import SEARCH_RATE_PER_SECOND, SEARCH_BURST, SEARCH_DAILY_QUOTA
+from config import HOST_RATE_PER_SECOND, HOST_BURST, SCHEDULER_MAX_WAIT
+from telemetry import SCHEDULER_EVENTS
+
+logger = logging.getLogger(__name__)
+
+class QuotaExhausted(Exception):
+    """No queda cuota (o no hay token disponible a tiempo) para lanzar la petición."""
+
+
+class TokenBucket:
+    """
+    Token bucket con reserva: cada llamada descuenta un token aunque el saldo quede
+    negativo y espera lo justo hasta que ese token se haya repuesto, de modo que las
+    peticiones se espacian al ritmo `rate` en orden de llegada, sin sondeos ni sleeps fijos.
+    Un `rate` <= 0 desactiva el límite.
+    """
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait: float = float('inf')) -> float | None:
+        """Reserva un token y devuelve los segundos que hay que esperar, o None si serían más de `max_wait`."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        wait = max(0.0, (1.0 - self._tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self._tokens -= 1.0
+        return wait
+
+    async def acquire(self, max_wait: float = float('inf')) -> bool:
+        wait = self.reserve(max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+
+class SingleFlight:
+    """
+    Coalescencia de peticiones: las llamadas concurrentes con la misma clave comparten
+    una única tarea en curso. Si quien la lanzó se cancela, la tarea sigue para el resto;
+    cuando se cancela el último que la espera, se cancela también la tarea.
+    """
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        # Llamadas que esperan cada tarea en curso.
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Evita el aviso de "excepción nunca recuperada" si ya nadie espera la tarea.
+            task.exception()
+
+    def running(self, key: Hashable) -> bool:
+        """Indica si una llamada con `key` se uniría ahora a una tarea en curso."""
+        task = self._in_flight.get(key)
+        return task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop()
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Devuelve (resultado, compartido): `compartido` indica que se reutilizó una tarea en curso."""
+        shared = self.running(key)
+        if shared:
+            task = self._in_flight[key]
+        else:
+            task = asyncio.get_running_loop().create_task(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        finally:
+            waiters = self._waiters.pop(task) - 1
+            if waiters:
+                self._waiters[task] = waiters
+            elif not task.done():
+                # Nadie espera ya el resultado: se cancela para que no retenga su hueco ni su token.
+                task.cancel()
+
+
+class RequestScheduler:
+    """
+    Planificador compartido de las peticiones externas de la investigación:
+    - búsquedas: token bucket por API key, cuota diaria opcional y pausa tras un 429;
+    - páginas: token bucket por host;
+    - ambas: coalescencia de consultas y URLs idénticas en curso.
+    Si una petición no puede salir en `max_wait` segundos se lanza `QuotaExhausted`
+    para que el llamador degrade (caché caducada o investigación vacía) en lugar de fallar.
+    """
+    def __init__(self, search_rate: float = SEARCH_RATE_PER_SECOND, search_burst: float = SEARCH_BURST,
+                 daily_quota: int = SEARCH_DAILY_QUOTA, host_rate: float = HOST_RATE_PER_SECOND,
+                 host_burst: float = HOST_BURST, max_wait: float = SCHEDULER_MAX_WAIT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.search_rate = search_rate
+        self.search_burst = search_burst
+        self.daily_quota = daily_quota
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.max_wait = max_wait
+        self._clock = clock
+        self._search_buckets: Dict[str, TokenBucket] = {}
+        self._host_buckets: Dict[str, TokenBucket] = {}
+        # Por API key: (día UTC, consultas lanzadas ese día).
+        self._daily_usage: Dict[str, Tuple[str, int]] = {}
+        self._blocked_until: Dict[str, float] = {}
+        self._single_flight = SingleFlight()
+
+    def _bucket(self, buckets: Dict[str, TokenBucket], key: str, rate: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst, clock=self._clock)
+        return bucket
+
+    def quota_remaining(self, api_key: str) -> int | None:
+        """Consultas que quedan hoy para `api_key` (None si no hay cuota diaria configurada)."""
+        if self.daily_quota <= 0:
+            return None
+        day, used = self._daily_usage.get(api_key, ("", 0))
+        return self.daily_quota - (used if day == time.strftime("%Y-%m-%d", time.gmtime()) else 0)
+
+    def _consume_quota(self, api_key: str) -> None:
+        today = time.strftime("%Y-%m-%d", time.gmtime())
+        day, used = self._daily_usage.get(api_key, (today, 0))
+        self._daily_usage[api_key] = (today, used + 1 if day == today else 1)
+
+    def mark_quota_exhausted(self, api_key: str, retry_after: float = 60.0) -> None:
+        """La API respondió que no queda cuota (429): no se envían búsquedas durante `retry_after` segundos."""
+        self._blocked_until[api_key] = self._clock() + retry_after
+        logger.warning(f"[Scheduler] Cuota de búsqueda agotada; se pausa durante {retry_after:.0f} s.")
+
+    async def _run_search(self, api_key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if self._clock() < self._blocked_until.get(api_key, 0.0):
+            raise QuotaExhausted("La API de búsqueda ha indicado que no queda cuota.")
+        remaining = self.quota_remaining(api_key)
+        if remaining is not None and remaining <= 0:
+            raise QuotaExhausted("Se ha alcanzado la cuota diaria de búsquedas.")
+        bucket = self._bucket(self._search_buckets, api_key, self.search_rate, self.search_burst)
+        if not await bucket.acquire(self.max_wait):
+            raise QuotaExhausted("No hay capacidad de búsqueda disponible a tiempo.")
+        self._consume_quota(api_key)
+        return await fetch()
+
+    async def _run_fetch(self, host: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        bucket = self._bucket(self._host_buckets, host, self.host_rate, self.host_burst)
+        if not await bucket.acquire(self.max_wait):
+            raise QuotaExhausted(f"El host {host} está saturado.")
+        return await fetch()
+
+    async def _coalesce(self, kind: str, key: Hashable, run: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result, shared = await self._single_flight.do((kind, key), run)
+        except QuotaExhausted:
+            SCHEDULER_EVENTS.inc(kind=kind, event="degraded")
+            raise
+        if shared:
+            SCHEDULER_EVENTS.inc(kind=kind, event="coalesced")
+        return result
+
+    async def search(self, api_key: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta `fetch` (una búsqueda identificada por `key`) respetando el ritmo y la cuota de `api_key`."""
+        return await self._coalesce("search", (api_key, key), lambda: self._run_search(api_key, fetch))
+
+    async def fetch_page(self, url: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta `fetch` (la descarga de `url`) respetando el ritmo de su host."""
+        host = urlsplit(url).netloc.lower()
+        return await self._coalesce("page", url, lambda: self._run_fetch(host, fetch))
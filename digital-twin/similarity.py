@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class StoryIndex:
+    """
+    Índice vectorial de las historias ya procesadas: guarda, por historia, su vector TF-IDF
+    (el del modelo de esfuerzo, normalizado) junto con su investigación y su plan final.
+
+    - Búsqueda top-k: un producto matriz-vector sobre la matriz en memoria (similitud coseno).
+    - Inserción incremental: una fila en SQLite y otra en la matriz, sin reconstruir nada.
+    - Persistencia: el fichero SQLite (modo WAL) se comparte entre procesos; cada búsqueda
+      incorpora antes las filas que otros procesos hayan añadido desde la anterior y, si
+      faltan filas (otro proceso borró o desalojó historias), recarga la matriz entera.
+
+    Sólo son comparables los vectores del mismo TfidfVectorizer: cada fila lleva la huella
+    del modelo que la generó y la matriz en memoria contiene únicamente las del modelo activo.
+    """
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._model: str | None = None
+        self._reset()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stories ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, entry TEXT NOT NULL,"
+            " updated_at REAL NOT NULL, PRIMARY KEY (model, key))"
+        )
+
+    def _reset(self) -> None:
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._size = 0
+        self._keys: List[str] = []
+        self._entries: List[dict] = []
+        self._rows: Dict[str, int] = {}
+        # Última fila de SQLite ya incorporada a la matriz.
+        self._last_rowid = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _put(self, key: str, vector: np.ndarray, entry: dict) -> None:
+        row = self._rows.get(key)
+        if row is None:
+            if self._size == len(self._vectors):
+                # La matriz crece al doble: las inserciones cuestan O(1) amortizado.
+                grown = np.zeros((max(16, 2 * self._size), len(vector)), dtype=np.float32)
+                if self._size:
+                    grown[:self._size] = self._vectors[:self._size]
+                self._vectors = grown
+            row = self._rows[key] = self._size
+            self._keys.append(key)
+            self._entries.append(entry)
+            self._size += 1
+        self._vectors[row] = vector
+        self._entries[row] = entry
+
+    def _load(self, model: str) -> None:
+        rows = self._conn.execute(
+            "SELECT rowid, key, vector, entry FROM stories WHERE rowid > ? AND model = ? ORDER BY rowid",
+            (self._last_rowid, model)
+        ).fetchall()
+        for rowid, key, vector, entry in rows:
+            self._put(key, np.frombuffer(vector, dtype=np.float32), json.loads(entry))
+            self._last_rowid = rowid
+
+    def _sync(self, model: str) -> None:
+        """Carga el modelo `model` (si cambió) y las filas añadidas desde la última sincronización."""
+        if model != self._model:
+            self._reset()
+            self._model = model
+        self._load(model)
+        # Las filas nuevas no reflejan los borrados: si el número de filas no cuadra, se recarga todo.
+        stored = self._conn.execute("SELECT COUNT(*) FROM stories WHERE model = ?", (model,)).fetchone()[0]
+        if stored != self._size:
+            self._reset()
+            self._load(model)
+
+    def _evict(self, model: str) -> None:
+        """Al superar `max_entries` se borra el 10 % más antiguo y se recarga la matriz."""
+        excess = self._size - self.max_entries
+        if self.max_entries <= 0 or excess <= 0:
+            return
+        excess += self.max_entries // 10
+        self._conn.execute(
+            "DELETE FROM stories WHERE model = ? AND key IN ("
+            " SELECT key FROM stories WHERE model = ? ORDER BY updated_at, rowid LIMIT ?)",
+            (model, model, excess)
+        )
+        self._model = None
+        self._sync(model)
+        logger.info(f"[StoryIndex] {excess} historias antiguas eliminadas del índice.")
+
+    def add(self, key: str, model: str, vector: np.ndarray, entry: Dict[str, Any]) -> None:
+        """Inserta (o reemplaza) la historia `key`. `vector` debe venir normalizado (norma L2 = 1)."""
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._sync(model)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stories (model, key, vector, entry, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (model, key, vector.tobytes(), json.dumps(entry, ensure_ascii=False), time.time())
+            )
+            self._sync(model)
+            self._evict(model)
+
+    def search(self, model: str, vector: np.ndarray, k: int = 3, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Las `k` historias más parecidas a `vector` con similitud >= `min_score`, de mayor a
+        menor. Cada resultado es la entrada guardada más `key` y `score` (similitud coseno).
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._sync(model)
+            if self._size == 0 or k <= 0:
+                return []
+            scores = self._vectors[:self._size] @ vector
+            if k < self._size:
+                candidates = np.argpartition(-scores, k)[:k]
+            else:
+                candidates = np.arange(self._size)
+            best = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [
+                {**self._entries[row], "key": self._keys[row], "score": float(scores[row])}
+                for row in best if scores[row] >= min_score
+            ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
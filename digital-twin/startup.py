@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+class LazyService:
+    """
+    Construye un servicio en su primer uso (o al precargarlo durante el arranque)
+    y registra cuánto tardó. La construcción está protegida por un lock, así que
+    varias solicitudes concurrentes comparten una única instancia.
+    """
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self.load_seconds: float | None = None
+        self.load_error: str | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    try:
+                        instance = self._factory()
+                    except Exception as e:
+                        self.load_error = str(e)
+                        logger.error(f"[Startup] Error al inicializar '{self.name}': {e}")
+                        raise
+                    self.load_seconds = time.perf_counter() - start
+                    self.load_error = None
+                    self._instance = instance
+                    logger.info(f"[Startup] '{self.name}' inicializado en {self.load_seconds:.2f}s.")
+        return self._instance
+
+    def status(self) -> Dict[str, Any]:
+        return {"loaded": self.loaded, "load_seconds": self.load_seconds, "error": self.load_error}
+
+
+class StartupState:
+    """Progreso del arranque en segundo plano, consultado por /readyz."""
+    def __init__(self, services: Dict[str, LazyService]):
+        self.services = services
+        self.warmup_seconds: float | None = None
+        self.warmup_error: str | None = None
+        self.total_seconds: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.total_seconds is not None and self.warmup_error is None and all(
+            service.loaded for service in self.services.values()
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "services": {name: service.status() for name, service in self.services.items()},
+            "warmup": {"seconds": self.warmup_seconds, "error": self.warmup_error},
+            "total_seconds": self.total_seconds,
+        }
+
+    async def start(self, warmup: Callable[[], Any] | None = None) -> None:
+        """Inicializa todos los servicios a la vez (en hilos) y después ejecuta el calentamiento."""
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(asyncio.to_thread(service.get) for service in self.services.values()),
+            return_exceptions=True
+        )
+        if any(isinstance(result, Exception) for result in results):
+            return
+
+        if warmup is not None:
+            warmup_start = time.perf_counter()
+            try:
+                await warmup()
+            except Exception as e:
+                self.warmup_error = str(e)
+                logger.error(f"[Startup] Error en el calentamiento: {e}")
+                return
+            self.warmup_seconds = time.perf_counter() - warmup_start
+
+        self.total_seconds = time.perf_counter() - start
+        breakdown = ", ".join(f"{name} {service.load_seconds:.2f}s" for name, service in self.services.items())
+        warmup_text = f", calentamiento {self.warmup_seconds:.2f}s" if self.warmup_seconds is not None else ""
+        logger.info(f"[Startup] Servicio listo en {self.total_seconds:.2f}s ({breakdown}{warmup_text}).")
@@ -0,0 +1,97 @@
+import heapq
+import re
+from typing import Dict, List, Tuple
+
+# Fin de frase: '.', '?' o '!' seguido de espacio (las abreviaturas tipo "p. ej." se aceptan como corte).
+_SENTENCE_END = re.compile(r'(?<=[.?!])\s+')
+
+# Parámetros de BM25: saturación de la frecuencia (k1) y normalización por longitud (b).
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Longitud media de frase (en palabras) usada en la normalización: el resumen es
+# incremental y no conoce de antemano la longitud media de todo el corpus.
+AVG_SENTENCE_WORDS = 20.0
+MIN_SENTENCE_CHARS = 10
+
+NO_RELEVANT_SENTENCES = "No se encontraron frases relevantes para las palabras clave proporcionadas."
+
+def truncate_utf8(text: str, max_bytes: int) -> str:
+    """Recorta `text` a como mucho `max_bytes` bytes en UTF-8 sin partir caracteres."""
+    if max_bytes <= 0 or len(text) * 4 <= max_bytes:
+        return text
+    head = text[:max_bytes]
+    encoded = head.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return head
+    return encoded[:max_bytes].decode('utf-8', errors='ignore')
+
+def cap_page_text(text: str, max_bytes: int) -> str:
+    """Aplica el tope de bytes por página y descarta la frase que haya quedado cortada."""
+    capped = truncate_utf8(text, max_bytes)
+    if len(capped) == len(text):
+        return text
+    last_end = None
+    for last_end in _SENTENCE_END.finditer(capped):
+        pass
+    return capped[:last_end.start()] if last_end else capped
+
+def compile_keyword_matcher(keywords: List[str]) -> re.Pattern | None:
+    """Una sola expresión (sin distinguir mayúsculas) que encuentra cualquiera de las keywords."""
+    terms = sorted({keyword.lower() for keyword in keywords if keyword.strip()}, key=len, reverse=True)
+    if not terms:
+        return None
+    return re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+
+
+class StreamingSummarizer:
+    """
+    Resumen extractivo incremental: recibe las páginas a medida que llegan y conserva
+    sólo las `max_sentences` frases mejor puntuadas en un heap de tamaño fijo, de modo
+    que la memoria y el coste no dependen del tamaño total del contenido descargado.
+
+    La puntuación es de estilo BM25 sobre las keywords: cada keyword presente aporta su
+    frecuencia saturada y normalizada por la longitud de la frase.
+    """
+    def __init__(self, keywords: List[str], max_sentences: int = 4, max_page_bytes: int = 0):
+        self.max_sentences = max_sentences
+        self.max_page_bytes = max_page_bytes
+        self._matcher = compile_keyword_matcher(keywords)
+        # Heap mínimo de (puntuación, -página, -posición, frase): la raíz es la peor frase retenida.
+        self._heap: List[Tuple[float, int, int, str]] = []
+        self._retained: set = set()
+
+    def _score(self, sentence: str) -> float:
+        term_frequencies: Dict[str, int] = {}
+        for match in self._matcher.finditer(sentence):
+            term = match.group(0).lower()
+            term_frequencies[term] = term_frequencies.get(term, 0) + 1
+        if not term_frequencies:
+            return 0.0
+        length_norm = 1 - BM25_B + BM25_B * (sentence.count(' ') + 1) / AVG_SENTENCE_WORDS
+        return sum(tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm) for tf in term_frequencies.values())
+
+    def add_page(self, text: str, page_index: int = 0) -> None:
+        """Puntúa las frases de una página. `page_index` desempata a favor de las páginas anteriores."""
+        if self._matcher is None or self.max_sentences <= 0 or not text:
+            return
+        text = cap_page_text(text, self.max_page_bytes)
+        for position, sentence in enumerate(_SENTENCE_END.split(text)):
+            if len(sentence) <= MIN_SENTENCE_CHARS or sentence in self._retained:
+                continue
+            score = self._score(sentence)
+            if score <= 0:
+                continue
+            entry = (score, -page_index, -position, sentence)
+            if len(self._heap) < self.max_sentences:
+                heapq.heappush(self._heap, entry)
+            elif entry > self._heap[0]:
+                self._retained.discard(heapq.heapreplace(self._heap, entry)[3])
+            else:
+                continue
+            self._retained.add(sentence)
+
+    def summary(self) -> str:
+        if not self._heap:
+            return NO_RELEVANT_SENTENCES
+        best = sorted(self._heap, reverse=True)
+        return ' '.join(entry[3] for entry in best)
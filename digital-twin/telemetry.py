@@ -0,0 +1,227 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Sequence, Tuple
+
+logger = logging.getLogger("telemetry")
+
+# Identificador de la solicitud en curso; lo comparten todos los spans que genera.
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: Dict[str, str] | None = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in (extra or {}).items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por serie: recuentos por bucket (no acumulados), suma y número de observaciones.
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class MetricsRegistry:
+    """Registro mínimo de métricas con exportación en el formato de texto de Prometheus."""
+    def __init__(self):
+        self._metrics: Dict[str, Counter | Gauge | Histogram] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._metrics.setdefault(name, Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    "digital_twin_span_seconds", "Duración de cada etapa del pipeline.", ["span", "status"])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "digital_twin_http_request_seconds", "Duración de las solicitudes HTTP.", ["method", "path", "status"])
+CACHE_REQUESTS = REGISTRY.counter(
+    "digital_twin_cache_requests_total", "Consultas a las cachés, por resultado (hit/miss).", ["cache", "result"])
+FETCH_FAILURES = REGISTRY.counter(
+    "digital_twin_fetch_failures_total", "Búsquedas o descargas de páginas fallidas.", ["kind"])
+SCHEDULER_EVENTS = REGISTRY.counter(
+    "digital_twin_scheduler_events_total", "Peticiones coalescidas con otra idéntica en curso o degradadas por falta de cuota.",
+    ["kind", "event"])
+JOB_QUEUE_DEPTH = REGISTRY.gauge(
+    "digital_twin_job_queue_depth", "Trabajos de la cola persistente por estado.", ["status"])
+JOB_WAIT_SECONDS = REGISTRY.histogram(
+    "digital_twin_job_wait_seconds", "Tiempo que un trabajo espera en la cola hasta que un worker lo toma.")
+JOB_RUN_SECONDS = REGISTRY.histogram(
+    "digital_twin_job_run_seconds", "Duración de la ejecución de cada trabajo.", ["status"])
+LLM_TOKENS = REGISTRY.counter(
+    "digital_twin_llm_tokens_total", "Tokens consumidos por el LLM (prompt o completion).", ["kind"])
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[dict]:
+    """
+    Mide un bloque de código: alimenta `digital_twin_span_seconds` y emite una línea de
+    log JSON con el request ID actual. El diccionario devuelto admite atributos extra.
+    """
+    fields = dict(attributes)
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        SPAN_SECONDS.observe(duration, span=name, status=status)
+        logger.info(json.dumps({
+            "span": name,
+            "request_id": request_id_var.get(),
+            "duration_ms": round(duration * 1000, 3),
+            "status": status,
+            **fields,
+        }, ensure_ascii=False, default=str))
+
+
+class RequestContextMiddleware:
+    """
+    Middleware ASGI: asigna un request ID (o respeta el de `X-Request-ID`), lo devuelve
+    en la respuesta y mide la duración completa, incluido el cuerpo en streaming.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or new_request_id()
+        token = request_id_var.set(request_id)
+        status = {"code": 500}
+        start = time.perf_counter()
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            # Se usa la plantilla de la ruta (no la URL concreta) para acotar la cardinalidad.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"],
+                                         path=route, status=str(status["code"]))
+            request_id_var.reset(token)
@@ -0,0 +1,59 @@
+import json
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from benchmarks.stubs import StubServers
+from benchmarks.run import summarize
+
+# --- Tests del arnés de benchmarks (servidores locales, sin red externa) ---
+
+@pytest.mark.asyncio
+async def test_stub_search_points_to_static_and_js_docs_sites():
+    async with StubServers(js_ratio=0.5) as stubs, aiohttp.ClientSession() as session:
+        async with session.get(stubs.search_url, params={"q": "exportar reporte react", "num": 3}) as response:
+            links = [item["link"] for item in (await response.json())["items"]]
+        pages = {}
+        for link in links:
+            async with session.get(link) as response:
+                pages[link] = await response.text()
+
+    assert len(links) == 3
+    assert all(link.startswith((stubs.static_url, stubs.js_url)) for link in links)
+    for link, html in pages.items():
+        if link.startswith(stubs.js_url):
+            # Las páginas del sitio JS son un "shell" vacío hasta ejecutar el script.
+            assert '<div id="root"></div>' in html
+        else:
+            assert html.count("<p>") >= 10
+    assert stubs.requests["search"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fake_llm_returns_a_parseable_plan_in_one_call_and_streaming():
+    pytest.importorskip("langchain_core")
+    from benchmarks.fake_llm import FakePlanLLM
+
+    llm = FakePlanLLM(latency=0, tokens_per_second=0)
+    prompt = '{"id": "STORY-7", "title": "Exportar reporte"}\n{"effort": 3.0, "time": 12.0}'
+    message = await llm.ainvoke(prompt)
+    streamed = "".join([chunk.content async for chunk in llm.astream(prompt)])
+
+    plan = json.loads(message.content)
+    assert streamed == message.content
+    assert plan[0]["story_id"] == "STORY-7"
+    assert plan[0]["time"] == 12.0
+    assert sum(task["estimated_hours"] for task in plan[0]["action_plan"]["tasks"]) <= 12.0
+
+
+def test_summarize_reports_percentiles_and_throughput():
+    stats = summarize([0.001 * n for n in range(1, 101)], errors=2, wall_seconds=2.0)
+
+    assert stats["count"] == 100 and stats["errors"] == 2
+    assert stats["throughput_rps"] == 50.0
+    assert stats["p50_ms"] == pytest.approx(50.5)
+    assert stats["p99_ms"] == pytest.approx(99.01)
+    assert stats["peak_rss_mb"] > 0
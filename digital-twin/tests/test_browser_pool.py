@@ -0,0 +1,137 @@
+import asyncio
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from browser_pool import BrowserPool
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.closed = False
+        self.visits = []
+        self.mouse = self
+
+    def is_closed(self):
+        return self.closed
+
+    async def goto(self, url, **kwargs):
+        self.visits.append(url)
+        await self.context.browser.navigate(url)
+
+    async def move(self, x, y):
+        pass
+
+    async def wait_for_load_state(self, state, **kwargs):
+        pass
+
+    async def content(self):
+        return f"<p>{self.visits[-1]}</p>"
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.pages = []
+
+    async def new_page(self):
+        page = FakePage(self)
+        self.pages.append(page)
+        return page
+
+    async def close(self):
+        for page in self.pages:
+            page.closed = True
+
+
+class FakeBrowser:
+    """Navegador en memoria: `navigate` puede bloquearse o fallar para simular caídas."""
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+        self.blocked = None
+        self.context_delay = 0.0
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self):
+        await asyncio.sleep(self.context_delay)
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def navigate(self, url):
+        if self.blocked is not None:
+            await self.blocked.wait()
+        if not self.connected:
+            raise RuntimeError("Target closed")
+
+    async def close(self):
+        self.connected = False
+
+
+class FakeChromium:
+    def __init__(self):
+        self.launched = []
+
+    async def launch(self, headless=True):
+        browser = FakeBrowser()
+        self.launched.append(browser)
+        return browser
+
+
+def started_pool(max_pages):
+    """Pool con un navegador falso ya «lanzado»: no necesita Playwright."""
+    pool = BrowserPool(max_pages=max_pages)
+    pool._manager = object()
+    pool._playwright = type("FakePlaywright", (), {"chromium": FakeChromium()})()
+    pool._browser = FakeBrowser()
+    return pool
+
+# --- Tests del pool de páginas del navegador ---
+
+@pytest.mark.asyncio
+async def test_pages_are_reused_up_to_max_pages():
+    pool = started_pool(max_pages=2)
+    html = await asyncio.gather(*(pool.fetch_html(f"https://docs.dev/{i}") for i in range(6)))
+
+    assert html == [f"<p>https://docs.dev/{i}</p>" for i in range(6)]
+    assert len(pool._browser.contexts) == 2
+    assert sum(len(page.visits) for context in pool._browser.contexts for page in context.pages) == 6
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_after_the_browser_restarts():
+    pool = started_pool(max_pages=1)
+    old_browser = pool._browser
+    old_browser.blocked = asyncio.Event()
+
+    first = asyncio.create_task(pool.fetch_html("https://docs.dev/a"))
+    await asyncio.sleep(0.01)
+    waiting = asyncio.create_task(pool.fetch_html("https://docs.dev/b"))
+    await asyncio.sleep(0.01)
+    # El navegador se cae con una página en uso y otra petición esperando hueco.
+    old_browser.connected = False
+    old_browser.blocked.set()
+
+    with pytest.raises(RuntimeError):
+        await first
+    assert await asyncio.wait_for(waiting, timeout=1) == "<p>https://docs.dev/b</p>"
+    assert pool._browser is pool._playwright.chromium.launched[0]
+    assert pool._idle_pages[0].context.browser is pool._browser
+
+
+@pytest.mark.asyncio
+async def test_cancelled_acquire_does_not_leak_a_slot():
+    pool = started_pool(max_pages=1)
+    pool._browser.context_delay = 10
+    opening = asyncio.create_task(pool.fetch_html("https://docs.dev/lenta"))
+    await asyncio.sleep(0.01)
+    opening.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await opening
+
+    pool._browser.context_delay = 0
+    assert await asyncio.wait_for(pool.fetch_html("https://docs.dev/a"), timeout=1) == "<p>https://docs.dev/a</p>"
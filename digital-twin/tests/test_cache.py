@@ -0,0 +1,150 @@
+import threading
+import time
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cache import DiskCache, LRUCache
+
+# --- Tests de la caché persistente (sin red) ---
+
+def test_disk_cache_roundtrip_and_persistence(tmp_path):
+    path = str(tmp_path / "research.sqlite")
+    cache = DiskCache(path)
+    cache.set("search", "react nestjs", ["https://a.dev", "https://b.dev"])
+    assert cache.get("search", "react nestjs") == ["https://a.dev", "https://b.dev"]
+    cache.close()
+
+    # Un nuevo proceso/worker ve las mismas entradas.
+    reopened = DiskCache(path)
+    assert reopened.get("search", "react nestjs") == ["https://a.dev", "https://b.dev"]
+    assert reopened.get("page", "https://a.dev") is None
+
+
+def test_disk_cache_ttl_expires_entries(tmp_path):
+    cache = DiskCache(str(tmp_path / "c.sqlite"))
+    cache.set("page", "https://a.dev", "texto", ttl=0.05)
+    assert cache.get("page", "https://a.dev") == "texto"
+    time.sleep(0.1)
+    assert cache.get("page", "https://a.dev") is None
+    # Caducada, pero se conserva como respaldo (p. ej. sin cuota para refrescarla).
+    assert cache.get("page", "https://a.dev", allow_expired=True) == "texto"
+
+
+def test_disk_cache_evicts_least_recently_used_under_byte_budget(tmp_path):
+    cache = DiskCache(str(tmp_path / "c.sqlite"), max_bytes=350)
+    for name in ("a", "b", "c"):
+        cache.set("page", name, "x" * 100)
+    cache.get("page", "a")  # "a" pasa a ser la más reciente; "b" es la víctima.
+    cache.set("page", "d", "x" * 100)
+
+    assert cache.get("page", "b") is None
+    assert cache.get("page", "a") is not None
+    assert cache.get("page", "d") is not None
+    assert cache.stats()["page"]["bytes"] <= 350
+
+
+def test_disk_cache_tracks_total_size_without_scanning_on_every_set(tmp_path):
+    cache = DiskCache(str(tmp_path / "c.sqlite"), max_bytes=1000)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+    for i in range(8):
+        cache.set("page", f"k{i}", "x" * 50)
+    cache.set("page", "k0", "x" * 10)  # reemplazo: resta el tamaño anterior
+
+    assert not any("SUM(size)" in statement for statement in statements)
+    # Tamaño = JSON del valor (con comillas) + clave.
+    assert cache._total_bytes == cache._count_bytes() == 7 * (52 + 2) + (12 + 2)
+
+
+def test_disk_cache_budget_counts_entries_written_by_other_connections(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    first, second = DiskCache(path, max_bytes=350), DiskCache(path, max_bytes=350)
+    for name in ("a", "b", "c"):
+        second.set("page", name, "x" * 100)
+    # `first` no vio esas escrituras, pero recuenta el total real antes de desalojar.
+    for name in ("d", "e", "f", "g"):
+        first.set("page", name, "x" * 100)
+
+    assert first._count_bytes() <= 350
+    assert first.get("page", "g") is not None
+
+
+def test_disk_cache_counts_hits_and_misses(tmp_path):
+    cache = DiskCache(str(tmp_path / "c.sqlite"))
+    cache.set("search", "q", [])
+    cache.get("search", "q")
+    cache.get("search", "q")
+    cache.get("search", "otra")
+    assert cache.stats()["search"] == {"hits": 2, "misses": 1, "entries": 1, "bytes": len("[]") + 1}
+
+
+def test_disk_cache_is_safe_across_threads_and_connections(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    caches = [DiskCache(path), DiskCache(path)]
+
+    def writer(worker: int):
+        cache = caches[worker % 2]
+        for i in range(50):
+            cache.set("page", f"{worker}-{i}", f"contenido {i}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert caches[0].stats()["page"]["entries"] == 200
+
+
+def test_lru_cache_evicts_oldest_and_falls_back_to_disk(tmp_path):
+    disk = DiskCache(str(tmp_path / "c.sqlite"))
+    cache = LRUCache(max_entries=2, disk=disk, namespace="lemma")
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+
+    assert len(cache._entries) == 2 and "a" not in cache._entries
+    assert cache.get("a") == "A"  # recuperada desde disco
+    assert LRUCache(max_entries=2).get("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 0, "entries": 2, "hit_rate": 1.0}
+
+
+@pytest.mark.asyncio
+async def test_research_reuses_cached_search_and_pages(tmp_path, monkeypatch):
+    import research
+    monkeypatch.setattr(research, "GOOGLE_API_KEY", "test")
+    monkeypatch.setattr(research, "GOOGLE_CX", "test")
+
+    service = research.ResearchService(tech_stack_file="missing.json", cache_path=str(tmp_path / "r.sqlite"))
+    calls = {"search": 0, "page": 0}
+
+    async def fake_search(query, num_results):
+        calls["search"] += 1
+        service.cache.set("search", service._search_cache_key(query, num_results), ["https://docs.dev/react"])
+        return ["https://docs.dev/react"]
+
+    async def fake_page(url):
+        calls["page"] += 1
+        return "React permite exportar reportes. Otra frase sin relación."
+
+    monkeypatch.setattr(service, "_search_with_google_api", fake_search)
+    monkeypatch.setattr(service, "_get_content_from_url", fake_page)
+
+    first = await service.conduct_research("Exportar reportes", ["react"])
+    calls_after_first = dict(calls)
+    second = await service.conduct_research("Exportar reportes", ["react"])
+    await service.close()
+
+    assert first == second
+    assert calls_after_first["page"] == 1
+    assert calls == calls_after_first
+
+
+def test_lru_cache_entries_expire_after_ttl():
+    cache = LRUCache(max_entries=2, namespace="plan", ttl=0.05)
+    cache.set("a", {"plan": 1})
+    assert cache.get("a") == {"plan": 1}
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
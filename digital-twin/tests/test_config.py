@@ -0,0 +1,70 @@
+import re
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pd = pytest.importorskip("pandas")
+np = pytest.importorskip("numpy")
+
+from config import (extract_features, extract_feature_matrix, EXTRACTED_FEATURES, NUMERICAL_FEATURES,
+                    KEYWORD_CATEGORIES, TECH_STACK_KEYWORDS)
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), '..', 'model', 'stories_dataset.csv')
+
+# --- Implementación de referencia ---
+# Versión original de `extract_features` (una pasada regex por característica),
+# conservada para comprobar que el extractor de una sola pasada es equivalente.
+
+def reference_extract_features(df: pd.DataFrame) -> pd.DataFrame:
+    df_featured = df.copy()
+
+    df_featured['gherkin'] = df_featured['gherkin'].astype(str).fillna('')
+    df_featured['title'] = df_featured['title'].astype(str).fillna('')
+    df_featured['full_text'] = df_featured['title'] + " " + df_featured['gherkin']
+
+    for feature_name, pattern in {**KEYWORD_CATEGORIES, **TECH_STACK_KEYWORDS}.items():
+        df_featured[feature_name] = df_featured['full_text'].str.contains(pattern, case=False, regex=True, na=False).astype(int)
+
+    gherkin_keywords = [r'\bGiven\b', r'\bWhen\b', r'\bThen\b', r'\bAnd\b', r'\bDado\b', r'\bCuando\b', r'\bEntonces\b', r'\bY\b']
+    df_featured['gherkin_steps'] = df_featured['gherkin'].apply(lambda x: sum(len(re.findall(word, x, re.IGNORECASE)) for word in gherkin_keywords))
+    df_featured['gherkin_length'] = df_featured['gherkin'].str.len()
+    df_featured['num_scenarios'] = df_featured['gherkin'].str.count(r'\b(Scenario|Escenario)\b', re.IGNORECASE)
+    df_featured['num_conditions'] = df_featured['gherkin'].str.lower().str.count(r'\b(if|when|si)\b')
+
+    for col in EXTRACTED_FEATURES:
+        df_featured[col] = pd.to_numeric(df_featured[col], errors='coerce').fillna(0).astype(float)
+    return df_featured
+
+EDGE_CASES = pd.DataFrame([
+    {"title": "Migrar a Node.js y NodeJS", "gherkin": "Given CI/CD con Docker\nWhen falla el deploy\nThen se notifica por SMS"},
+    {"title": "Base  de datos", "gherkin": "Scenario: la base de datos responde\nY el api externa sincroniza\nAnd SI hay error"},
+    {"title": "Pantalla", "gherkin": "Escenario: lector de pantalla, screen reader y third-party\nDado un modelo ML\nCuando selecciono\nEntonces veo"},
+    {"title": "interfaces", "gherkin": "apps, tokens, APIs y selects no son palabras clave; manejo de errores tampoco"},
+    {"title": float('nan'), "gherkin": None},
+    {"title": "", "gherkin": ""},
+    {"title": "Pago con tarjeta de crédito", "gherkin": "When WHEN when if IF Si sí nodejs node.js node-js"},
+])
+
+# --- Tests ---
+
+@pytest.mark.parametrize("stories", [
+    pytest.param(lambda: pd.read_csv(DATASET_PATH), id="dataset"),
+    pytest.param(lambda: EDGE_CASES, id="edge-cases"),
+])
+def test_extract_features_matches_reference_implementation(stories):
+    df = stories()
+    expected = reference_extract_features(df)
+    actual = extract_features(df)
+
+    pd.testing.assert_frame_equal(actual[EXTRACTED_FEATURES], expected[EXTRACTED_FEATURES])
+    pd.testing.assert_series_equal(actual['full_text'], expected['full_text'])
+
+
+def test_extract_feature_matrix_is_ordered_like_numerical_features():
+    expected = reference_extract_features(EDGE_CASES)
+    matrix = extract_feature_matrix(expected['title'], expected['gherkin'])
+    expected = expected.reindex(columns=NUMERICAL_FEATURES, fill_value=0)
+
+    assert matrix.shape == (len(EDGE_CASES), len(NUMERICAL_FEATURES))
+    np.testing.assert_array_equal(matrix, expected.to_numpy(dtype=float))
@@ -0,0 +1,76 @@
+import glob
+import re
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+bs4 = pytest.importorskip("bs4")
+
+import html_text
+from html_text import extract_text_from_html
+from summarizer import cap_page_text
+
+PAGES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'fixtures', 'pages', '*.html')))
+
+def read_page(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+def reference_text(html):
+    """La extracción anterior con BeautifulSoup: el extractor en streaming debe dar el mismo texto."""
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
+        tag.decompose()
+    elements = soup.find_all(['p', 'h1', 'h2', 'h3', 'code', 'pre', 'li'])
+    full_text = ' '.join([e.get_text(separator=' ', strip=True) for e in elements])
+    return re.sub(r'\s+', ' ', full_text).strip()
+
+# --- Paridad con BeautifulSoup sobre páginas guardadas ---
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_extraction_matches_beautifulsoup(path):
+    html = read_page(path)
+    assert extract_text_from_html(html) == reference_text(html)
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_extraction_does_not_depend_on_chunk_boundaries(path, monkeypatch):
+    # Trozos diminutos: etiquetas, entidades y texto quedan partidos entre dos `feed`.
+    monkeypatch.setattr(html_text, "FEED_CHUNK_CHARS", 7)
+    html = read_page(path)
+    assert extract_text_from_html(html) == reference_text(html)
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+@pytest.mark.parametrize("max_bytes", [40, 150, 600])
+def test_capped_extraction_gives_the_same_capped_text(path, max_bytes):
+    html = read_page(path)
+    expected = cap_page_text(reference_text(html), max_bytes)
+    assert cap_page_text(extract_text_from_html(html, max_bytes), max_bytes) == expected
+
+
+def test_extraction_stops_reading_once_the_cap_is_reached():
+    html = "<html><body>" + "<p>Una frase de relleno sobre exportar reportes.</p>" * 20000 + "</body></html>"
+    extractor = html_text.TextExtractor(max_chars=1000)
+    fed = 0
+    with pytest.raises(html_text._LimitReached):
+        for start in range(0, len(html), 1024):
+            fed += 1
+            extractor.feed(html[start:start + 1024])
+    assert extractor.truncated
+    assert fed * 1024 < len(html) // 100
+    assert 1000 < len(extractor.text()) < 1100
+
+
+def test_unclosed_void_tags_are_counted_per_tag():
+    # Miles de elementos vacíos sin cerrar (y cierres sueltos) ocupan una entrada por etiqueta,
+    # no una por elemento: cada cierre es O(1) y la extracción sigue siendo lineal.
+    blocks = 2000
+    html = "<html><body>" + "<p>Texto <br>con <img src='a.png'>imagen</p><hr><input>" * blocks + "</br></img></body></html>"
+    extractor = html_text.TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+
+    assert extractor._closed_voids == {"br": blocks - 1, "img": blocks - 1, "hr": blocks, "input": blocks}
+    assert extractor.text() == reference_text(html)
@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from jobs import JobQueue, JobStore, parse_stage_limits, stage_slot
+
+# --- Tests de la cola de trabajos persistente ---
+
+def test_jobs_survive_a_restart_and_are_claimed_once(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    store = JobStore(path)
+    first = store.submit({"story_data": {"id": "A"}})
+    second = store.submit({"story_data": {"id": "B"}})
+    store.close()
+
+    reopened = JobStore(path)
+    claimed = reopened.claim()
+    assert claimed["id"] == first and claimed["status"] == "running" and claimed["attempts"] == 1
+    assert claimed["payload"] == {"story_data": {"id": "A"}}
+    assert reopened.claim()["id"] == second
+    assert reopened.claim() is None
+
+    reopened.complete(first, {"technical_plan": []})
+    assert reopened.get(first)["result"] == {"technical_plan": []}
+    assert reopened.counts() == {"queued": 0, "running": 1, "done": 1, "failed": 0}
+
+
+def test_abandoned_jobs_are_requeued_until_attempts_run_out(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"), lease_seconds=0, max_attempts=2)
+    job_id = store.submit({})
+
+    store.claim()
+    assert store.recover() == 1
+    assert store.get(job_id)["status"] == "queued"
+
+    store.claim()
+    store.recover()
+    job = store.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2
+
+
+@pytest.mark.asyncio
+async def test_queue_drains_jobs_with_per_stage_limits_and_long_poll(tmp_path):
+    running = peak = 0
+
+    async def handler(payload):
+        nonlocal running, peak
+        async with stage_slot("planner"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+        if payload.get("fail"):
+            raise ValueError("fallo en el grafo")
+        return {"story": payload["id"]}
+
+    queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite")), handler, workers=4,
+                     stage_limits={"planner": 2}, poll_interval=0.05)
+    await queue.start()
+    try:
+        job_ids = [await queue.submit({"id": n}) for n in range(6)]
+        failing = await queue.submit({"id": 6, "fail": True})
+        jobs = [await queue.wait(job_id, timeout=5) for job_id in job_ids + [failing]]
+    finally:
+        await queue.stop()
+
+    assert [job["status"] for job in jobs] == ["done"] * 6 + ["failed"]
+    assert [job["result"] for job in jobs[:6]] == [{"story": n} for n in range(6)]
+    assert jobs[-1]["error"] == "fallo en el grafo"
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_stopping_the_queue_returns_running_jobs_to_the_queue(tmp_path):
+    async def handler(payload):
+        await asyncio.sleep(10)
+
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    queue = JobQueue(store, handler, workers=1, poll_interval=0.05)
+    await queue.start()
+    job_id = await queue.submit({})
+    await asyncio.sleep(0.1)
+    assert store.get(job_id)["status"] == "running"
+    await queue.stop()
+
+    assert store.get(job_id)["status"] == "queued"
+
+
+@pytest.mark.asyncio
+async def test_queue_runs_store_operations_off_the_event_loop(tmp_path, monkeypatch):
+    import threading
+    async def handler(payload):
+        return payload
+
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    threads = {}
+    for name in ("submit", "get", "claim", "complete", "counts", "recover"):
+        method = getattr(store, name)
+
+        def recording(*args, name=name, method=method):
+            threads.setdefault(name, set()).add(threading.current_thread())
+            return method(*args)
+
+        monkeypatch.setattr(store, name, recording)
+    queue = JobQueue(store, handler, workers=1, poll_interval=0.05)
+    await queue.start()
+    try:
+        job = await queue.wait(await queue.submit({"id": 1}), timeout=5)
+    finally:
+        await queue.stop()
+
+    assert job["status"] == "done"
+    assert set(threads) == {"submit", "get", "claim", "complete", "counts", "recover"}
+    assert all(threading.main_thread() not in used for used in threads.values())
+
+
+def test_parse_stage_limits():
+    assert parse_stage_limits("research=4, planner=2") == {"research": 4, "planner": 2}
+    assert parse_stage_limits("") == {}
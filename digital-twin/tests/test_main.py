@@ -1,4 +1,7 @@
+import asyncio
+import json
 import pytest
+import time
 from httpx import AsyncClient
 from unittest.mock import patch, MagicMock, AsyncMock
 import sys
@@ -11,26 +14,44 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 mock_prediction_service = MagicMock()
 mock_prediction_service.predict.return_value = (5.0, 8.0) # (effort, time)
 
+mock_prediction_service.predict_batch.side_effect = lambda stories: [(5.0, 8.0) for _ in stories]
+
 mock_research_service = AsyncMock()
 mock_research_service.conduct_research.return_value = {"summary": "Investigación sobre WebSockets y notificaciones en tiempo real."}
+mock_research_service.conduct_research_batch.side_effect = lambda stories, deadline=None: [
+    mock_research_service.conduct_research.return_value for _ in stories
+]
 
 mock_llm_plan_generator = MagicMock()
-mock_llm_plan_generator.generate_plan.return_value = [
+mock_llm_plan_generator.agenerate_plan = AsyncMock(return_value=[
     {
         "story_id": "STORY-006",
         "story_title": "Notificación en tiempo real al recibir mensaje",
         "technical_plan": "..."
     }
-]
+])
+
+async def fake_astream_plan(story_data, ml_estimate, research_findings, similar_plans=None):
+    # Simula el JSON parcialmente parseado que emite JsonOutputParser en streaming.
+    yield [{"story_id": "STORY-006"}]
+    yield mock_llm_plan_generator.agenerate_plan.return_value
+
+mock_llm_plan_generator.astream_plan = fake_astream_plan
+
+# `config` (y con él pandas/numpy) se importa antes de aplicar los mocks: `patch.dict`
+# restaura sys.modules al salir y las extensiones C no se pueden volver a cargar.
+import config
 
 # Aplicamos los mocks a nivel de módulo para que se usen en lugar de los reales.
 # Esto se hace ANTES de importar 'app' para que la app se inicialice con los mocks.
 with patch.dict(sys.modules, {
     'prediction': MagicMock(PredictionService=lambda **kwargs: mock_prediction_service),
     'research': MagicMock(ResearchService=lambda **kwargs: mock_research_service),
-    'reasoner': MagicMock(LLMPlanGenerator=lambda **kwargs: mock_llm_plan_generator),
+    'reasoner': MagicMock(LLMPlanGenerator=lambda **kwargs: mock_llm_plan_generator,
+                          build_fallback_plan=lambda story_data, ml_estimate: [{"story_id": story_data.get("id"), "fallback": True}]),
 }):
-    from main import app # La importación de la app se hace después de aplicar los mocks
+    import main as main_module
+    from main import app, graph_app, startup_state, warmup_services, REGISTRY, plan_cache, idempotency_cache # La importación de la app se hace después de aplicar los mocks
 
 # --- Datos de Prueba ---
 
@@ -47,6 +68,15 @@ STORY_DATA_INPUT = {
     )
 }
 
+@pytest.fixture(autouse=True)
+def clear_plan_cache():
+    # Cada test genera sus planes desde cero: sin planes reutilizados de otro test.
+    plan_cache.clear()
+    idempotency_cache.clear()
+    yield
+    plan_cache.clear()
+    idempotency_cache.clear()
+
 # --- Test Asíncrono con pytest ---
 
 @pytest.mark.asyncio
@@ -67,11 +97,448 @@ async def test_generate_plan_endpoint():
     
     # 2. Verificar que el contenido de la respuesta es el esperado (el plan del mock).
     response_data = response.json()
-    expected_plan = mock_llm_plan_generator.generate_plan.return_value
+    expected_plan = mock_llm_plan_generator.agenerate_plan.return_value
     assert response_data == expected_plan, "El plan devuelto no coincide con el mock."
     
     # 3. Verificar que los servicios fueron llamados correctamente.
     # El grafo de LangGraph llama a los métodos de los servicios.
     mock_research_service.conduct_research.assert_called_once()
     mock_prediction_service.predict.assert_called_once_with(STORY_DATA_INPUT)
-    mock_llm_plan_generator.generate_plan.assert_called_once()
+    mock_llm_plan_generator.agenerate_plan.assert_called_once()
+
+
+def test_research_and_prediction_run_in_parallel():
+    """
+    La investigación y la predicción parten ambas del inicio del grafo
+    y el planificador espera a las dos.
+    """
+    edges = {(edge.source, edge.target) for edge in graph_app.get_graph().edges}
+
+    assert ("__start__", "research") in edges
+    assert ("__start__", "prediction") in edges
+    assert ("research", "planner") in edges
+    assert ("prediction", "planner") in edges
+    assert ("research", "prediction") not in edges
+
+
+def parse_sse(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_generate_plan_stream_endpoint():
+    """
+    El endpoint SSE emite primero el progreso de cada etapa y después el plan
+    parcial y final generado en streaming.
+    """
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/generate_plan/stream", json={"story_data": STORY_DATA_INPUT})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert set(names[:2]) == {"research_done", "ml_estimate_ready"}
+    assert names[2:] == ["plan_partial", "plan_partial", "plan"]
+    assert dict(events)["ml_estimate_ready"] == {"ml_estimate": {"effort": 5.0, "time": 8.0, "budget_hours": 8.0}}
+    assert events[-1][1] == mock_llm_plan_generator.agenerate_plan.return_value
+
+
+
+@pytest.mark.asyncio
+async def test_generate_plan_batch_endpoint_streams_ndjson():
+    """
+    El endpoint por lotes predice todo el bloque de una vez, investiga el bloque
+    completo y devuelve una línea NDJSON por historia.
+    """
+    stories = [dict(STORY_DATA_INPUT, id=f"STORY-{n}") for n in range(3)]
+    mock_prediction_service.predict_batch.reset_mock()
+    mock_research_service.conduct_research_batch.reset_mock()
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/generate_plan/batch", json={"stories": stories})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    for line in lines:
+        assert line["story_id"] == f"STORY-{line['index']}"
+        assert line["technical_plan"] == mock_llm_plan_generator.agenerate_plan.return_value
+
+    mock_prediction_service.predict_batch.assert_called_once_with(stories)
+    mock_research_service.conduct_research_batch.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_readiness_waits_for_startup_while_liveness_answers():
+    """
+    /healthz responde desde el primer momento; /readyz devuelve 503 hasta que los
+    servicios se han cargado y calentado, y después informa de los tiempos de arranque.
+    """
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        assert (await client.get("/healthz")).json() == {"status": "ok"}
+        assert (await client.get("/readyz")).status_code == 503
+
+        await startup_state.start(warmup_services)
+        response = await client.get("/readyz")
+
+    assert response.status_code == 200
+    status = response.json()
+    assert set(status["services"]) == {"prediction", "research", "llm"}
+    assert all(service["loaded"] for service in status["services"].values())
+    assert status["warmup"]["seconds"] is not None
+    mock_prediction_service.warmup.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_metrics_expose_node_latencies_and_request_id():
+    """
+    Tras una solicitud, /metrics incluye el histograma de cada nodo del grafo y el de
+    la ruta HTTP; el request ID recibido se devuelve en la respuesta.
+    """
+    REGISTRY.clear()
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT},
+                                     headers={"X-Request-ID": "req-123"})
+        metrics = await client.get("/metrics")
+
+    assert response.headers["x-request-id"] == "req-123"
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    for node in ("research", "prediction", "planner"):
+        assert f'digital_twin_span_seconds_count{{span="{node}",status="ok"}} 1' in metrics.text
+    assert 'digital_twin_http_request_seconds_count{method="POST",path="/generate_plan/",status="200"} 1' in metrics.text
+
+
+@pytest.mark.asyncio
+async def test_duplicate_requests_share_one_graph_run_and_reuse_the_plan():
+    """
+    Las solicitudes idénticas simultáneas comparten una ejecución del grafo y una
+    repetición posterior (con los campos en otro orden) reutiliza el plan generado.
+    """
+    mock_llm_plan_generator.agenerate_plan.reset_mock()
+    original_side_effect = mock_llm_plan_generator.agenerate_plan.side_effect
+
+    async def slow_plan(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return mock_llm_plan_generator.agenerate_plan.return_value
+
+    mock_llm_plan_generator.agenerate_plan.side_effect = slow_plan
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            responses = await asyncio.gather(*(
+                client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT}) for _ in range(3)
+            ))
+            reordered = dict(reversed(list(STORY_DATA_INPUT.items())))
+            repeated = await client.post("/generate_plan/", json={"story_data": reordered})
+    finally:
+        mock_llm_plan_generator.agenerate_plan.side_effect = original_side_effect
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert sorted(response.headers["x-plan-cache"] for response in responses) == ["coalesced", "coalesced", "miss"]
+    assert repeated.headers["x-plan-cache"] == "hit"
+    assert repeated.json() == mock_llm_plan_generator.agenerate_plan.return_value
+    mock_llm_plan_generator.agenerate_plan.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_is_bound_to_one_story():
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        first = await client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT},
+                                  headers={"Idempotency-Key": "retry-1"})
+        retry = await client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT},
+                                  headers={"Idempotency-Key": "retry-1"})
+        conflict = await client.post("/generate_plan/", json={"story_data": dict(STORY_DATA_INPUT, id="OTRA")},
+                                     headers={"Idempotency-Key": "retry-1"})
+
+    assert first.headers["x-plan-cache"] == "miss"
+    assert retry.headers["x-plan-cache"] == "hit"
+    assert conflict.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_idempotency_keys_survive_plan_cache_eviction(monkeypatch):
+    # Con espacio para un solo plan, la clave debe seguir ligada a su historia al desalojarse el plan.
+    monkeypatch.setattr(plan_cache, "max_entries", 1)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        await client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT}, headers={"Idempotency-Key": "retry-2"})
+        await client.post("/generate_plan/", json={"story_data": dict(STORY_DATA_INPUT, id="OTRA")})
+        conflict = await client.post("/generate_plan/", json={"story_data": dict(STORY_DATA_INPUT, id="TERCERA")},
+                                     headers={"Idempotency-Key": "retry-2"})
+
+    assert plan_cache.stats()["entries"] == 1
+    assert idempotency_cache.get("retry-2") == main_module.plan_content_key(STORY_DATA_INPUT)
+    assert conflict.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_deadline_cuts_research_and_falls_back_to_the_ml_plan(monkeypatch):
+    """
+    Con una investigación y un LLM que no terminan a tiempo, la respuesta llega dentro
+    del plazo con el plan basado en la estimación ML y las etapas degradadas indicadas.
+    """
+    async def stalled(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(main_module, "PLANNER_MIN_SECONDS", 0.1)
+    monkeypatch.setattr(mock_research_service.conduct_research, "side_effect", stalled)
+    monkeypatch.setattr(mock_llm_plan_generator.agenerate_plan, "side_effect", stalled)
+
+    start = asyncio.get_running_loop().time()
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT, "timeout_seconds": 1.0})
+    elapsed = asyncio.get_running_loop().time() - start
+
+    assert response.status_code == 200
+    assert elapsed < 1.5
+    assert response.json() == [{"story_id": "STORY-006", "fallback": True}]
+    assert response.headers["x-plan-degraded"] == "research,planner"
+    # El plan degradado no se guarda para reutilizarlo.
+    assert plan_cache.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_coalesced_request_keeps_its_own_deadline(monkeypatch):
+    """
+    Una solicitud que se une a una ejecución lanzada con un plazo más largo no espera más
+    que el suyo: recibe el plan basado en la estimación ML, y la ejecución sigue para la primera.
+    """
+    async def slow_plan(*args, **kwargs):
+        await asyncio.sleep(1.0)
+        return [{"story_id": "STORY-006", "llm": True}]
+
+    monkeypatch.setattr(main_module, "PLANNER_MIN_SECONDS", 0.1)
+    monkeypatch.setattr(mock_llm_plan_generator.agenerate_plan, "side_effect", slow_plan)
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        first = asyncio.create_task(client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT, "timeout_seconds": 10}))
+        await asyncio.sleep(0.1)
+        start = asyncio.get_running_loop().time()
+        second = await client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT, "timeout_seconds": 0.3})
+        elapsed = asyncio.get_running_loop().time() - start
+        first = await first
+
+    assert elapsed < 0.6
+    assert second.json() == [{"story_id": "STORY-006", "fallback": True}]
+    assert second.headers["x-plan-degraded"] == "planner"
+    assert first.json() == [{"story_id": "STORY-006", "llm": True}]
+    assert "x-plan-degraded" not in first.headers
+
+
+@pytest.mark.asyncio
+async def test_stream_falls_back_to_the_ml_plan_when_the_llm_stalls(monkeypatch):
+    async def stalled_stream(*args, **kwargs):
+        yield [{"story_id": "STORY-006"}]
+        await asyncio.sleep(10)
+        yield []
+
+    monkeypatch.setattr(main_module, "PLANNER_MIN_SECONDS", 0.1)
+    monkeypatch.setattr(mock_llm_plan_generator, "astream_plan", stalled_stream)
+
+    start = asyncio.get_running_loop().time()
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/generate_plan/stream", json={"story_data": STORY_DATA_INPUT, "timeout_seconds": 0.5})
+    elapsed = asyncio.get_running_loop().time() - start
+
+    events = parse_sse(response.text)
+    assert elapsed < 1.0
+    assert [name for name, _ in events][2:] == ["plan_partial", "degraded", "plan"]
+    assert dict(events)["degraded"] == ["planner"]
+    assert events[-1][1] == [{"story_id": "STORY-006", "fallback": True}]
+
+
+@pytest.mark.asyncio
+async def test_batch_chunks_have_a_deadline_for_research_and_the_llm(monkeypatch):
+    async def stalled(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(main_module, "PLANNER_MIN_SECONDS", 0.1)
+    monkeypatch.setattr(mock_llm_plan_generator.agenerate_plan, "side_effect", stalled)
+    mock_research_service.conduct_research_batch.reset_mock()
+    stories = [dict(STORY_DATA_INPUT, id=f"STORY-{n}") for n in range(2)]
+
+    start = asyncio.get_running_loop().time()
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/generate_plan/batch", json={"stories": stories, "timeout_seconds": 0.5})
+    elapsed = asyncio.get_running_loop().time() - start
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert elapsed < 1.0
+    assert all(line["degraded"] == ["planner"] and line["technical_plan"][0]["fallback"] for line in lines)
+    assert mock_research_service.conduct_research_batch.call_args.kwargs["deadline"] is not None
+
+
+@pytest.mark.asyncio
+async def test_jobs_and_requests_do_not_share_graph_runs(tmp_path, monkeypatch):
+    """
+    Un trabajo (plazo largo) y una solicitud HTTP (plazo corto) con la misma historia no
+    comparten la ejecución: la solicitud no espera al trabajo ni el trabajo guarda su plan degradado.
+    """
+    async def slow_plan(*args, **kwargs):
+        await asyncio.sleep(0.5)
+        return [{"story_id": "STORY-006", "llm": True}]
+
+    monkeypatch.setattr(main_module, "PLANNER_MIN_SECONDS", 0.1)
+    monkeypatch.setattr(mock_llm_plan_generator.agenerate_plan, "side_effect", slow_plan)
+    queue = main_module.create_job_queue(str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(main_module, "job_queue", queue)
+    await queue.start()
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            job_id = (await client.post("/jobs", json={"story_data": STORY_DATA_INPUT})).json()["id"]
+            await asyncio.sleep(0.1)
+            start = asyncio.get_running_loop().time()
+            response = await client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT, "timeout_seconds": 0.2})
+            elapsed = asyncio.get_running_loop().time() - start
+            await client.get(f"/jobs/{job_id}", params={"wait": 5})
+            result = await client.get(f"/jobs/{job_id}/result")
+    finally:
+        await queue.stop()
+        queue.store.close()
+
+    assert elapsed < 0.5
+    assert response.headers["x-plan-cache"] == "miss"
+    assert response.headers["x-plan-degraded"] == "planner"
+    assert result.json() == [{"story_id": "STORY-006", "llm": True}]
+    assert "x-plan-degraded" not in result.headers
+
+
+@pytest.mark.asyncio
+async def test_job_api_queues_the_story_and_returns_the_plan(tmp_path, monkeypatch):
+    """
+    POST /jobs responde de inmediato con el identificador; el long-poll de /jobs/{id}
+    espera a que un worker termine y /jobs/{id}/result devuelve el plan.
+    """
+    queue = main_module.create_job_queue(str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(main_module, "job_queue", queue)
+    await queue.start()
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            submitted = await client.post("/jobs", json={"story_data": STORY_DATA_INPUT})
+            job_id = submitted.json()["id"]
+            status = await client.get(f"/jobs/{job_id}", params={"wait": 5})
+            result = await client.get(f"/jobs/{job_id}/result")
+            missing = await client.get("/jobs/desconocido")
+            metrics = await client.get("/metrics")
+    finally:
+        await queue.stop()
+        queue.store.close()
+
+    assert submitted.status_code == 202
+    assert submitted.headers["location"] == f"/jobs/{job_id}"
+    assert status.json()["status"] == "done"
+    assert result.json() == mock_llm_plan_generator.agenerate_plan.return_value
+    assert missing.status_code == 404
+    assert 'digital_twin_job_queue_depth{status="done"} 1' in metrics.text
+    assert "digital_twin_job_wait_seconds_count" in metrics.text
+
+
+@pytest.mark.asyncio
+async def test_similar_story_reuses_research_and_seeds_the_planner(tmp_path, monkeypatch):
+    """
+    Tras procesar una historia, otra casi idéntica reutiliza su investigación (sin buscar
+    en la web) y el LLM recibe el plan anterior como referencia.
+    """
+    from similarity import StoryIndex
+    import numpy as np
+
+    index = StoryIndex(str(tmp_path / "stories.sqlite"))
+    monkeypatch.setattr(main_module, "story_index", index)
+    # Vector ficticio: sólo depende del título, así las dos historias son idénticas para el índice.
+    monkeypatch.setattr(mock_prediction_service.story_vectors, "side_effect",
+                        lambda stories: (np.array([[1.0, 0.0]], dtype=np.float32), "modelo"), raising=False)
+    mock_research_service.conduct_research.reset_mock()
+    mock_llm_plan_generator.agenerate_plan.reset_mock()
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            first = await client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT})
+            # El índice se escribe en segundo plano: se espera a que termine antes de la segunda.
+            await main_module.wait_for_index_writes()
+            second = await client.post("/generate_plan/", json={"story_data": dict(STORY_DATA_INPUT, id="STORY-106")})
+            await main_module.wait_for_index_writes()
+    finally:
+        index.close()
+
+    assert first.status_code == second.status_code == 200
+    mock_research_service.conduct_research.assert_called_once()
+    first_call, second_call = mock_llm_plan_generator.agenerate_plan.call_args_list
+    assert first_call.kwargs["similar_plans"] == []
+    findings = second_call.args[2]
+    assert findings["reused_from"] == "STORY-006"
+    assert findings["summary"] == mock_research_service.conduct_research.return_value["summary"]
+    assert second_call.kwargs["similar_plans"] == [{
+        "title": STORY_DATA_INPUT["title"], "similarity": 1.0,
+        "technical_plan": mock_llm_plan_generator.agenerate_plan.return_value,
+    }]
+
+
+@pytest.mark.asyncio
+async def test_stream_progress_does_not_expose_similar_stories(tmp_path, monkeypatch):
+    from similarity import StoryIndex
+    import numpy as np
+
+    index = StoryIndex(str(tmp_path / "stories.sqlite"))
+    monkeypatch.setattr(main_module, "story_index", index)
+    monkeypatch.setattr(mock_prediction_service.story_vectors, "side_effect",
+                        lambda stories: (np.array([[1.0, 0.0]], dtype=np.float32), "modelo"), raising=False)
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            await client.post("/generate_plan/", json={"story_data": STORY_DATA_INPUT})
+            await main_module.wait_for_index_writes()
+            response = await client.post("/generate_plan/stream", json={"story_data": dict(STORY_DATA_INPUT, id="STORY-106")})
+            await main_module.wait_for_index_writes()
+    finally:
+        index.close()
+
+    research_done = dict(parse_sse(response.text))["research_done"]
+    # La investigación reutilizada se envía; las historias similares (datos de otras historias), no.
+    assert set(research_done) == {"research_findings"}
+    assert research_done["research_findings"]["reused_from"] == "STORY-006"
+
+
+@pytest.mark.asyncio
+async def test_slow_index_write_does_not_delay_the_response(tmp_path, monkeypatch):
+    """Guardar la historia en el índice no cuenta contra el plazo de la solicitud."""
+    from similarity import StoryIndex
+    import numpy as np
+
+    index = StoryIndex(str(tmp_path / "stories.sqlite"))
+    monkeypatch.setattr(main_module, "story_index", index)
+    monkeypatch.setattr(mock_prediction_service.story_vectors, "side_effect",
+                        lambda stories: (np.array([[1.0, 0.0]], dtype=np.float32), "modelo"), raising=False)
+    remember_story = main_module.remember_story
+
+    async def slow_remember_story(*args):
+        await asyncio.sleep(1.0)
+        await remember_story(*args)
+
+    monkeypatch.setattr(main_module, "remember_story", slow_remember_story)
+    # Plazo corto sin degradar el planificador: la escritura (1 s) lo supera con creces.
+    monkeypatch.setattr(main_module, "PLANNER_MIN_SECONDS", 0)
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            started = time.monotonic()
+            response = await client.post("/generate_plan/", json={"story_data": dict(STORY_DATA_INPUT, id="STORY-206"),
+                                                                  "timeout_seconds": 0.5})
+            elapsed = time.monotonic() - started
+            streamed = await client.post("/generate_plan/stream", json={"story_data": dict(STORY_DATA_INPUT, id="STORY-207"),
+                                                                       "timeout_seconds": 0.5})
+            stream_elapsed = time.monotonic() - started - elapsed
+            await main_module.wait_for_index_writes()
+        indexed = index.search("modelo", np.array([1.0, 0.0], dtype=np.float32), k=5)
+    finally:
+        index.close()
+
+    assert response.status_code == 200
+    assert "X-Plan-Degraded" not in response.headers
+    assert elapsed < 0.5 and stream_elapsed < 0.5
+    assert "plan" in dict(parse_sse(streamed.text))
+    # La escritura termina igualmente: las dos historias quedan en el índice.
+    assert sorted(match["story_id"] for match in indexed) == ["STORY-206", "STORY-207"]
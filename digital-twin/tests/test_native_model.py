@@ -0,0 +1,126 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from config import extract_features, EXTRACTED_FEATURES
+from native_model import NativeEffortModel, export_pipeline, publish_artifact
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), '..', 'model', 'stories_dataset.csv')
+
+# --- Fixtures ---
+# Pipeline con la misma estructura que `effort_model.joblib`, más pequeño para que el test sea rápido.
+
+@pytest.fixture(scope="module")
+def dataset():
+    df = extract_features(pd.read_csv(DATASET_PATH))
+    df['full_text_lemmatized'] = df['full_text'].str.lower()
+    return df
+
+
+@pytest.fixture(scope="module")
+def pipeline(dataset):
+    pipeline = Pipeline(steps=[
+        ('preprocessor', ColumnTransformer(transformers=[
+            ('text', TfidfVectorizer(max_features=200, sublinear_tf=True), 'full_text_lemmatized'),
+            ('numeric', StandardScaler(), EXTRACTED_FEATURES)
+        ])),
+        ('model', MultiOutputRegressor(GradientBoostingRegressor(n_estimators=30, max_depth=5, random_state=42)))
+    ])
+    pipeline.fit(dataset[EXTRACTED_FEATURES + ['full_text_lemmatized']], dataset[['effort', 'time']])
+    return pipeline
+
+# --- Tests ---
+
+def test_native_model_matches_sklearn_pipeline(pipeline, dataset, tmp_path):
+    export_pipeline(pipeline, str(tmp_path / "native"))
+    native = NativeEffortModel.load(str(tmp_path / "native"))
+
+    X = dataset[EXTRACTED_FEATURES + ['full_text_lemmatized']]
+    np.testing.assert_allclose(native.predict(X), pipeline.predict(X), rtol=1e-9, atol=1e-9)
+
+
+def test_native_model_handles_unseen_and_empty_text(pipeline, dataset, tmp_path):
+    export_pipeline(pipeline, str(tmp_path / "native"))
+    native = NativeEffortModel.load(str(tmp_path / "native"))
+
+    # Textos vacíos o sin ningún término del vocabulario producen un vector TF-IDF nulo.
+    X = dataset[EXTRACTED_FEATURES + ['full_text_lemmatized']].head(3).copy()
+    X['full_text_lemmatized'] = ["", "zzzz qqqq", "Exportar REPORTES en pdf"]
+    np.testing.assert_allclose(native.predict(X), pipeline.predict(X), rtol=1e-9, atol=1e-9)
+
+
+def test_prediction_service_loads_native_artifact(pipeline, tmp_path, monkeypatch):
+    spacy = pytest.importorskip("spacy")
+    import prediction
+    monkeypatch.setattr(prediction.spacy, "load", lambda name, **kwargs: spacy.blank("es"))
+    export_pipeline(pipeline, str(tmp_path / "native"))
+
+    service = prediction.PredictionService(model_path=str(tmp_path / "native"), cache_path=None)
+    assert isinstance(service.pipeline, NativeEffortModel)
+    effort, time = service.predict({"title": "Exportar reportes", "gherkin": "Dado que...\nCuando...\nEntonces..."})
+    assert isinstance(effort, float) and isinstance(time, float)
+
+
+def test_export_rejects_unsupported_vectorizer(dataset, tmp_path):
+    bigrams = Pipeline(steps=[
+        ('preprocessor', ColumnTransformer(transformers=[
+            ('text', TfidfVectorizer(ngram_range=(1, 2)), 'full_text_lemmatized'),
+            ('numeric', StandardScaler(), EXTRACTED_FEATURES)
+        ])),
+        ('model', MultiOutputRegressor(GradientBoostingRegressor(n_estimators=2)))
+    ])
+    bigrams.fit(dataset[EXTRACTED_FEATURES + ['full_text_lemmatized']], dataset[['effort', 'time']])
+    with pytest.raises(ValueError):
+        export_pipeline(bigrams, str(tmp_path / "native"))
+
+
+def test_native_model_memory_maps_its_arrays(pipeline, dataset, tmp_path):
+    export_pipeline(pipeline, str(tmp_path / "native"))
+    mapped = NativeEffortModel.load(str(tmp_path / "native"), mmap_mode='r')
+    in_memory = NativeEffortModel.load(str(tmp_path / "native"), mmap_mode=None)
+
+    assert isinstance(mapped.tree_threshold, np.memmap)
+    assert isinstance(mapped.vocab_terms, np.memmap)
+    X = dataset[EXTRACTED_FEATURES + ['full_text_lemmatized']].head(20)
+    np.testing.assert_array_equal(mapped.predict(X), in_memory.predict(X))
+
+
+def test_prediction_service_hot_reloads_published_artifact(pipeline, dataset, tmp_path, monkeypatch):
+    spacy = pytest.importorskip("spacy")
+    import prediction
+    monkeypatch.setattr(prediction.spacy, "load", lambda name, **kwargs: spacy.blank("es"))
+    story = {"title": "Exportar reportes", "gherkin": "Dado que...\nCuando...\nEntonces..."}
+
+    # v2: otro modelo con los mismos datos (menos árboles), publicado sobre el mismo enlace.
+    smaller = Pipeline(steps=[
+        ('preprocessor', clone(pipeline.named_steps['preprocessor'])),
+        ('model', MultiOutputRegressor(GradientBoostingRegressor(n_estimators=3, random_state=0)))
+    ])
+    smaller.fit(dataset[EXTRACTED_FEATURES + ['full_text_lemmatized']], dataset[['effort', 'time']])
+    export_pipeline(pipeline, str(tmp_path / "v1"))
+    export_pipeline(smaller, str(tmp_path / "v2"))
+
+    publish_artifact(str(tmp_path / "v1"), str(tmp_path / "current"))
+    service = prediction.PredictionService(model_path=str(tmp_path / "current"), cache_path=None)
+    first = service.predict(story)
+    assert service.reload_if_changed() is False
+
+    publish_artifact(str(tmp_path / "v2"), str(tmp_path / "current"))
+    assert os.readlink(tmp_path / "current") == "v2"
+    assert service.reload_if_changed() is True
+    # La nueva huella invalida las predicciones cacheadas con el modelo anterior.
+    assert service.predict(story) != first
+    assert service.reload_if_changed() is False
@@ -0,0 +1,146 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+spacy = pytest.importorskip("spacy")
+joblib = pytest.importorskip("joblib")
+pd = pytest.importorskip("pandas")
+import numpy as np
+
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from config import extract_features, NUMERICAL_FEATURES
+import prediction
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), '..', 'model', 'stories_dataset.csv')
+
+# --- Fixtures ---
+# Se entrena un pipeline pequeño con la misma estructura que `effort_model.joblib`
+# y se sustituye el modelo de spaCy por uno en blanco para no depender de descargas.
+
+@pytest.fixture(scope="module")
+def stories():
+    return pd.read_csv(DATASET_PATH).head(40)
+
+
+@pytest.fixture
+def service(stories, tmp_path, monkeypatch):
+    monkeypatch.setattr(prediction.spacy, "load", lambda name, **kwargs: spacy.blank("es"))
+
+    df = extract_features(stories)
+    df['full_text_lemmatized'] = df['full_text'].str.lower()
+    pipeline = Pipeline(steps=[
+        ('preprocessor', ColumnTransformer(transformers=[
+            ('text', TfidfVectorizer(max_features=50), 'full_text_lemmatized'),
+            ('numeric', StandardScaler(), NUMERICAL_FEATURES)
+        ])),
+        ('model', MultiOutputRegressor(GradientBoostingRegressor(n_estimators=10, random_state=42)))
+    ])
+    pipeline.fit(df.reindex(columns=NUMERICAL_FEATURES + ['full_text_lemmatized'], fill_value=0), df[['effort', 'time']])
+
+    model_path = tmp_path / "effort_model.joblib"
+    joblib.dump(pipeline, model_path)
+    return prediction.PredictionService(model_path=str(model_path))
+
+class ConstantModel:
+    """Modelo trivial serializable: siempre predice el mismo (effort, time)."""
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, X):
+        return [self.value] * len(X)
+
+# --- Tests ---
+
+def test_predict_batch_scores_all_stories_in_one_model_call(service, stories, monkeypatch):
+    calls = []
+    original_predict = service.pipeline.predict
+    monkeypatch.setattr(service.pipeline, "predict", lambda X: calls.append(len(X)) or original_predict(X))
+
+    records = stories[['id', 'title', 'gherkin']].to_dict('records')
+    estimates = service.predict_batch(records)
+
+    assert calls == [len(records)]
+    assert len(estimates) == len(records)
+    assert all(isinstance(value, float) for estimate in estimates for value in estimate)
+
+
+def test_predict_is_a_wrapper_over_predict_batch(service, stories):
+    records = stories[['id', 'title', 'gherkin']].head(3).to_dict('records')
+    batch = service.predict_batch(records)
+
+    assert [service.predict(record) for record in records] == pytest.approx(batch)
+
+
+def test_lemmatize_texts_matches_single_text_lemmatization(service):
+    texts = ["El usuario exporta el reporte.", "Given el administrador, When hace clic."]
+    assert service.lemmatize_texts(texts) == [service.lemmatize_text(text) for text in texts]
+
+
+def test_predictions_are_cached_by_model_and_story_content(service, stories, monkeypatch):
+    record = stories[['id', 'title', 'gherkin']].iloc[0].to_dict()
+    first = service.predict(record)
+
+    monkeypatch.setattr(service.pipeline, "predict", lambda X: pytest.fail("cache miss"))
+    # Cambiar campos que no alimentan al modelo sigue acertando en la caché.
+    assert service.predict(dict(record, id="OTRO", keywords=["react"])) == first
+    assert service.cache_stats()["predictions"]["hits"] == 1
+
+
+def test_stories_sharing_a_prediction_key_get_the_same_prediction(service, stories):
+    story = stories[['title', 'gherkin']].iloc[3].to_dict()
+    recased = {"title": story["title"].upper(), "gherkin": story["gherkin"].swapcase()}
+    respaced = dict(story, gherkin="  " + story["gherkin"].replace(" ", "   "))
+    key = service._prediction_key(story, "model")
+
+    # Sólo el cambio de mayúsculas comparte clave: los espacios cambian las características.
+    assert service._prediction_key(recased, "model") == key
+    assert service._prediction_key(respaced, "model") != key
+    assert service._prediction_key(story, "otro-modelo") != key
+    uncached = service._predict_uncached([story, recased], service.pipeline)
+    assert uncached[0] == uncached[1]
+    assert service.predict(story) == service.predict(recased) == uncached[1]
+    assert service.cache_stats()["predictions"]["hits"] == 1
+
+
+def test_new_model_file_invalidates_persisted_predictions(stories, tmp_path, monkeypatch):
+    monkeypatch.setattr(prediction.spacy, "load", lambda name, **kwargs: spacy.blank("es"))
+    record = stories[['id', 'title', 'gherkin']].iloc[0].to_dict()
+    cache_path = str(tmp_path / "prediction.sqlite")
+
+    for value in ((1.0, 2.0), (3.0, 4.0)):
+        joblib.dump(ConstantModel(value), tmp_path / "model.joblib")
+        svc = prediction.PredictionService(model_path=str(tmp_path / "model.joblib"), cache_path=cache_path)
+        assert svc.predict(record) == value
+        # Un segundo servicio con el mismo fichero reutiliza la entrada persistida.
+        assert prediction.PredictionService(model_path=str(tmp_path / "model.joblib"), cache_path=cache_path).predict(record) == value
+
+
+def test_missing_spacy_model_fails_fast_without_downloading(tmp_path, monkeypatch):
+    def missing_model(name, **kwargs):
+        raise OSError(f"[E050] Can't find model '{name}'")
+    monkeypatch.setattr(prediction.spacy, "load", missing_model)
+    monkeypatch.setattr(os, "system", lambda command: pytest.fail(f"unexpected command: {command}"))
+    joblib.dump(ConstantModel((1.0, 2.0)), tmp_path / "model.joblib")
+
+    with pytest.raises(RuntimeError, match="python -m spacy download"):
+        prediction.PredictionService(model_path=str(tmp_path / "model.joblib"), cache_path=None)
+
+
+def test_story_vectors_are_normalized_and_match_similar_stories(service, stories, monkeypatch):
+    # spaCy en blanco no lematiza: se usa el mismo texto en minúsculas con el que se ajustó el TF-IDF.
+    monkeypatch.setattr(service, "lemmatize_texts", lambda texts: [text.lower() for text in texts])
+    records = stories[['id', 'title', 'gherkin']].head(3).to_dict('records')
+    vectors, fingerprint = service.story_vectors(records + [dict(records[0], id="COPIA")])
+
+    assert fingerprint == service.model_fingerprint
+    assert vectors.shape[0] == 4
+    assert np.linalg.norm(vectors, axis=1) == pytest.approx(np.ones(4), abs=1e-5)
+    # La misma historia con otro id da el mismo vector (similitud coseno 1).
+    assert float(vectors[0] @ vectors[3]) == pytest.approx(1.0, abs=1e-5)
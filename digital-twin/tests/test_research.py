@@ -0,0 +1,206 @@
+import asyncio
+import time
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pytest.importorskip("aiohttp")
+
+import research
+from benchmarks.stubs import StubServers
+from scheduler import RequestScheduler
+
+STORIES = [
+    ("Exportar reporte de ventas a PDF", ["react", "pdf", "exportar"]),
+    ("Login con JWT", ["jwt", "nestjs", "token"]),
+    ("Subir avatar a S3", ["s3", "avatar", "imagen"]),
+]
+NO_CONTENT = "No se pudo encontrar contenido relevante en la web."
+
+class FakeBrowserPool:
+    """Sustituto del navegador: devuelve `html`, falla o se queda colgado según `mode`."""
+    def __init__(self, mode: str = "render", html: str = ""):
+        self.mode = mode
+        self.html = html
+        self.urls = []
+
+    async def fetch_html(self, url: str) -> str:
+        self.urls.append(url)
+        if self.mode == "fail":
+            raise RuntimeError("Chromium no disponible")
+        if self.mode == "hang":
+            await asyncio.sleep(3600)
+        return self.html
+
+    async def close(self) -> None:
+        pass
+
+
+def new_service(monkeypatch, stubs, browser_pool, max_concurrency=5):
+    monkeypatch.setattr(research, "GOOGLE_API_KEY", "test")
+    monkeypatch.setattr(research, "GOOGLE_CX", "test")
+    # Sin límites de ritmo: los tests miden la concurrencia, no el planificador.
+    service = research.ResearchService(
+        tech_stack_file="missing.json", max_concurrency=max_concurrency, cache_path=None,
+        search_url=stubs.search_url, scheduler=RequestScheduler(search_rate=0, host_rate=0)
+    )
+    service.browser_pool = browser_pool
+    return service
+
+def record_pages(service):
+    """Registra, por historia, el texto de cada página que llega a su resumen."""
+    fed = []
+    new_summarizer = service._new_summarizer
+
+    def recording(keywords):
+        summarizer = new_summarizer(keywords)
+        pages = []
+        fed.append(pages)
+        add_page = summarizer.add_page
+
+        def record(text, *args):
+            pages.append(text)
+            return add_page(text, *args)
+
+        summarizer.add_page = record
+        return summarizer
+
+    service._new_summarizer = recording
+    return fed
+
+def record_readers(service):
+    """Guarda qué páginas lee cada historia (URL → [(historia, orden)])."""
+    readers = {}
+    fetch_and_summarize = service._fetch_and_summarize
+
+    async def capture(urls, story_readers, summarizers, deadline=None):
+        readers.update(story_readers)
+        return await fetch_and_summarize(urls, story_readers, summarizers, deadline)
+
+    service._fetch_and_summarize = capture
+    return readers
+
+# --- Tests de la investigación contra servidores locales (sin red ni navegador) ---
+
+@pytest.mark.asyncio
+async def test_batch_downloads_pages_concurrently_within_the_limit(monkeypatch):
+    async with StubServers(page_latency=0.2, js_ratio=0) as stubs:
+        service = new_service(monkeypatch, stubs, FakeBrowserPool(), max_concurrency=3)
+        active = peak = 0
+        fetch_static_html = service._fetch_static_html
+
+        async def tracking(url):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            try:
+                return await fetch_static_html(url)
+            finally:
+                active -= 1
+
+        service._fetch_static_html = tracking
+        readers = record_readers(service)
+        started = time.perf_counter()
+        findings = await service.conduct_research_batch(STORIES)
+        elapsed = time.perf_counter() - started
+        await service.close()
+
+    # Las descargas se solapan hasta el límite del servicio y cada URL se pide una sola vez.
+    assert len(readers) > 3
+    assert peak == 3
+    assert stubs.requests["static"] == len(readers)
+    assert elapsed < 0.2 * len(readers) / 2
+    assert all(finding["summary"] != NO_CONTENT and "partial" not in finding for finding in findings)
+
+
+@pytest.mark.asyncio
+async def test_deadline_returns_partial_results_from_pages_already_read(monkeypatch):
+    async with StubServers(js_ratio=0.5) as stubs:
+        browser = FakeBrowserPool(mode="hang")
+        service = new_service(monkeypatch, stubs, browser)
+        started = time.monotonic()
+        findings = await service.conduct_research_batch(STORIES, deadline=started + 1.0)
+        elapsed = time.monotonic() - started
+        await service.close()
+
+    # Las páginas que necesitan el navegador no llegan a tiempo; las estáticas sí se resumen.
+    assert browser.urls
+    assert elapsed < 2.0
+    assert all(finding["partial"] for finding in findings)
+    assert any(finding["summary"] != NO_CONTENT for finding in findings)
+
+
+@pytest.mark.asyncio
+async def test_failing_urls_are_left_out_of_the_summary(monkeypatch):
+    async with StubServers(js_ratio=0.5) as stubs:
+        browser = FakeBrowserPool(mode="fail")
+        service = new_service(monkeypatch, stubs, browser)
+        fed = record_pages(service)
+        readers = record_readers(service)
+        findings = await service.conduct_research_batch(STORIES)
+        await service.close()
+
+    failed = {url for url in readers if url.startswith(stubs.js_url)}
+    assert failed and set(browser.urls) == failed
+    # Cada historia resume exactamente sus páginas estáticas; las fallidas no aportan nada.
+    for story_index, pages in enumerate(fed):
+        expected = [url for url, story_pages in readers.items()
+                    if url not in failed and any(story == story_index for story, _ in story_pages)]
+        assert len(pages) == len(expected)
+        assert all(page.startswith("/docs/") for page in pages)
+    assert all("partial" not in finding for finding in findings)
+    assert [finding["summary"] == NO_CONTENT for finding in findings] == [not pages for pages in fed]
+
+
+@pytest.mark.asyncio
+async def test_needs_javascript_detects_shells_and_thin_pages(monkeypatch):
+    from benchmarks.stubs import docs_page, js_shell_page
+    async with StubServers() as stubs:
+        service = new_service(monkeypatch, stubs, FakeBrowserPool())
+        await service.close()
+
+    html = docs_page("/docs/1")
+    text = research.extract_text_from_html(html)
+    assert not service._needs_javascript(html, text)
+    assert service._needs_javascript(js_shell_page("/docs/1"), text)
+    assert service._needs_javascript("<p>Hola</p>", "Hola")
+
+
+@pytest.mark.asyncio
+async def test_static_pages_skip_the_browser_and_only_js_shells_use_it(monkeypatch):
+    from benchmarks.stubs import docs_page
+    async with StubServers() as stubs:
+        browser = FakeBrowserPool(html=docs_page("/renderizada"))
+        service = new_service(monkeypatch, stubs, browser)
+        static_text = await service._get_content_from_url(f"{stubs.static_url}/docs/7")
+        rendered_text = await service._get_content_from_url(f"{stubs.js_url}/docs/7")
+        missing = await service._get_content_from_url(f"{stubs.static_url}/no-existe")
+        await service.close()
+
+    assert static_text.startswith("/docs/7 Guía")
+    assert rendered_text.startswith("/renderizada Guía")
+    # Un 404 no es una página que necesite JavaScript: no se abre el navegador.
+    assert missing is None
+    assert browser.urls == [f"{stubs.js_url}/docs/7"]
+
+
+@pytest.mark.asyncio
+async def test_research_cache_is_read_and_written_off_the_event_loop(monkeypatch, tmp_path):
+    import threading
+    async with StubServers(js_ratio=0) as stubs:
+        service = new_service(monkeypatch, stubs, FakeBrowserPool())
+        service.cache = research.DiskCache(str(tmp_path / "r.sqlite"))
+        threads = set()
+        for name in ("get", "set"):
+            method = getattr(service.cache, name)
+
+            def recording(*args, method=method, **kwargs):
+                threads.add(threading.current_thread())
+                return method(*args, **kwargs)
+
+            monkeypatch.setattr(service.cache, name, recording)
+        await service.conduct_research_batch(STORIES[:1])
+        await service.close()
+
+    assert threads and threading.main_thread() not in threads
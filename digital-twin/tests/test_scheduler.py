@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scheduler import QuotaExhausted, RequestScheduler, SingleFlight, TokenBucket
+
+# --- Tests del planificador de búsquedas y descargas ---
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_paces_requests_after_the_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=2, clock=clock)
+
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    # Una espera mayor que el máximo no reserva el token.
+    assert bucket.reserve(max_wait=1.0) is None
+    clock.now = 10.0
+    assert bucket.reserve() == 0.0
+    assert TokenBucket(rate=0, capacity=1).reserve(max_wait=0) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_one_call_between_concurrent_callers():
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["https://a.dev"]
+
+    flight = SingleFlight()
+    results = await asyncio.gather(*(flight.do("react pdf", fetch) for _ in range(5)))
+
+    assert calls == 1
+    assert [result for result, _ in results] == [["https://a.dev"]] * 5
+    assert sum(shared for _, shared in results) == 4
+    # Terminada la llamada, la siguiente vuelve a ejecutarse.
+    await flight.do("react pdf", fetch)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_shared_fetch():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "texto"
+
+    first = asyncio.create_task(flight.do("https://a.dev", fetch))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(flight.do("https://a.dev", fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == ("texto", True)
+
+
+@pytest.mark.asyncio
+async def test_shared_fetch_is_cancelled_when_every_caller_goes_away():
+    flight = SingleFlight()
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def fetch():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    callers = [asyncio.create_task(flight.do("https://lenta.dev", fetch)) for _ in range(2)]
+    await started.wait()
+    callers[0].cancel()
+    await asyncio.sleep(0)
+    assert not cancelled.is_set()
+    callers[1].cancel()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+    # La clave queda libre: la siguiente llamada lanza una tarea nueva.
+    async def fast():
+        return "texto"
+
+    assert await flight.do("https://lenta.dev", fast) == ("texto", False)
+
+
+@pytest.mark.asyncio
+async def test_search_degrades_when_the_daily_quota_or_the_api_runs_out():
+    scheduler = RequestScheduler(search_rate=0, daily_quota=2, host_rate=0, max_wait=0)
+
+    async def fetch():
+        return ["https://a.dev"]
+
+    assert await scheduler.search("key", "q1", fetch) == ["https://a.dev"]
+    assert await scheduler.search("key", "q2", fetch) == ["https://a.dev"]
+    assert scheduler.quota_remaining("key") == 0
+    with pytest.raises(QuotaExhausted):
+        await scheduler.search("key", "q3", fetch)
+
+    # Otra API key tiene su propia cuota, salvo que la API indique que está agotada (429).
+    assert await scheduler.search("otra", "q1", fetch) == ["https://a.dev"]
+    scheduler.mark_quota_exhausted("otra", retry_after=60)
+    with pytest.raises(QuotaExhausted):
+        await scheduler.search("otra", "q2", fetch)
+
+
+@pytest.mark.asyncio
+async def test_page_fetches_are_rate_limited_per_host():
+    scheduler = RequestScheduler(search_rate=0, host_rate=1.0, host_burst=1, max_wait=0)
+
+    async def fetch():
+        return "texto"
+
+    assert await scheduler.fetch_page("https://docs.a.dev/1", fetch) == "texto"
+    # El mismo host no tiene tokens y no se puede esperar; otro host sí.
+    with pytest.raises(QuotaExhausted):
+        await scheduler.fetch_page("https://docs.a.dev/2", fetch)
+    assert await scheduler.fetch_page("https://docs.b.dev/1", fetch) == "texto"
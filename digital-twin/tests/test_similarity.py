@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from similarity import StoryIndex
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def entry(title):
+    return {"story_id": title, "title": title, "research_findings": {"summary": title}, "technical_plan": [{"t": title}]}
+
+# --- Tests del índice de historias similares ---
+
+def test_search_returns_top_k_by_cosine_similarity(tmp_path):
+    index = StoryIndex(str(tmp_path / "stories.sqlite"))
+    index.add("export", "m1", unit(1, 0, 0), entry("Exportar PDF"))
+    index.add("login", "m1", unit(0, 1, 0), entry("Login"))
+    index.add("export-csv", "m1", unit(1, 0.2, 0), entry("Exportar CSV"))
+
+    matches = index.search("m1", unit(1, 0.1, 0), k=2)
+    assert [match["key"] for match in matches] == ["export-csv", "export"]
+    assert matches[0]["score"] > matches[1]["score"] > 0.9
+    assert matches[0]["technical_plan"] == [{"t": "Exportar CSV"}]
+    # El umbral descarta las historias poco parecidas aunque quepan en el top-k.
+    assert [match["key"] for match in index.search("m1", unit(0, 1, 0), k=3, min_score=0.5)] == ["login"]
+
+
+def test_inserts_are_incremental_and_replace_the_same_story(tmp_path):
+    index = StoryIndex(str(tmp_path / "stories.sqlite"))
+    for i in range(40):
+        index.add(f"s{i}", "m1", unit(1, i, 0), entry(f"Historia {i}"))
+    index.add("s0", "m1", unit(0, 0, 1), entry("Reescrita"))
+
+    assert len(index) == 40
+    assert index.search("m1", unit(0, 0, 1), k=1)[0]["title"] == "Reescrita"
+
+
+def test_index_persists_and_sees_rows_from_other_processes(tmp_path):
+    path = str(tmp_path / "stories.sqlite")
+    first = StoryIndex(path)
+    first.add("export", "m1", unit(1, 0), entry("Exportar PDF"))
+    # Otra instancia (otro worker) sobre el mismo fichero carga lo persistido...
+    second = StoryIndex(path)
+    assert second.search("m1", unit(1, 0), k=1)[0]["key"] == "export"
+    # ...y cada búsqueda incorpora lo que el resto haya insertado después.
+    second.add("login", "m1", unit(0, 1), entry("Login"))
+    assert first.search("m1", unit(0, 1), k=1)[0]["key"] == "login"
+
+
+def test_deletions_by_other_processes_are_reflected(tmp_path):
+    path = str(tmp_path / "stories.sqlite")
+    first = StoryIndex(path, max_entries=10)
+    second = StoryIndex(path)
+    for i in range(10):
+        first.add(f"s{i}", "m1", unit(1, i), entry(f"Historia {i}"))
+    assert len(second.search("m1", unit(1, 0), k=20)) == 10
+
+    # `first` desaloja las más antiguas; `second` ya las tenía en memoria.
+    first.add("s10", "m1", unit(1, 10), entry("Historia 10"))
+    keys = {match["key"] for match in second.search("m1", unit(1, 0), k=20)}
+    assert len(second) == len(keys) == 9
+    assert "s0" not in keys and "s10" in keys
+
+
+def test_vectors_of_another_model_are_not_compared(tmp_path):
+    index = StoryIndex(str(tmp_path / "stories.sqlite"))
+    index.add("export", "m1", unit(1, 0), entry("Exportar PDF"))
+
+    assert index.search("m2", unit(1, 0, 0), k=3) == []
+    index.add("export", "m2", unit(1, 0, 0), entry("Exportar PDF"))
+    assert index.search("m2", unit(1, 0, 0), k=3)[0]["score"] == pytest.approx(1.0)
+
+
+def test_oldest_stories_are_evicted_beyond_max_entries(tmp_path):
+    index = StoryIndex(str(tmp_path / "stories.sqlite"), max_entries=10)
+    for i in range(11):
+        index.add(f"s{i}", "m1", unit(1, i), entry(f"Historia {i}"))
+
+    keys = {match["key"] for match in index.search("m1", unit(1, 5), k=20)}
+    assert len(index) == len(keys) == 9
+    assert "s0" not in keys and "s10" in keys
@@ -0,0 +1,64 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from summarizer import NO_RELEVANT_SENTENCES, StreamingSummarizer, cap_page_text, truncate_utf8
+
+# --- Tests del resumen incremental de la investigación ---
+
+def test_keeps_only_the_best_sentences_across_pages():
+    summarizer = StreamingSummarizer(["react", "pdf"], max_sentences=2)
+    summarizer.add_page("React renders the report view. The sky is blue today. Nothing relevant here at all.", 0)
+    summarizer.add_page("React builds the PDF export from the report. Plain filler sentence without terms.", 1)
+    summarizer.add_page("El servicio genera el PDF en segundo plano.", 2)
+
+    summary = summarizer.summary()
+
+    # La frase con las dos keywords va primero; en empate gana la página anterior.
+    assert summary == "React builds the PDF export from the report. React renders the report view."
+    assert len(summarizer._heap) == 2
+
+
+def test_score_saturates_repetitions_and_penalizes_long_sentences():
+    summarizer = StreamingSummarizer(["jwt"])
+    short = summarizer._score("Valida el JWT en cada petición.")
+    repeated = summarizer._score("JWT JWT JWT JWT JWT JWT JWT JWT JWT JWT validado.")
+    long = summarizer._score("Valida el JWT " + "y además otras muchas cosas " * 20 + "al final.")
+
+    assert repeated < 10 * short
+    assert long < short
+    assert summarizer._score("Matching is case insensitive: jwt.") > 0
+
+
+def test_memory_is_bounded_by_heap_size_and_page_cap():
+    summarizer = StreamingSummarizer(["mongodb"], max_sentences=3, max_page_bytes=1000)
+    page = "MongoDB stores each sales record in a collection. " * 10_000
+    summarizer.add_page(page)
+    summarizer.add_page("Una frase sobre MongoDB que sólo aparece al final de la página. " + page)
+
+    # Las frases repetidas no ocupan varias posiciones del resumen.
+    assert summarizer.summary() == "MongoDB stores each sales record in a collection. Una frase sobre MongoDB que sólo aparece al final de la página."
+    assert len(summarizer._heap) == 2
+
+
+def test_without_matches_or_keywords_returns_the_fallback_message():
+    assert StreamingSummarizer([]).summary() == NO_RELEVANT_SENTENCES
+    summarizer = StreamingSummarizer(["kafka"])
+    summarizer.add_page("Esta página no habla del tema buscado.")
+    assert summarizer.summary() == NO_RELEVANT_SENTENCES
+
+
+def test_truncate_utf8_never_splits_a_character():
+    text = "notificación " * 100
+    truncated = truncate_utf8(text, 50)
+
+    assert len(truncated.encode("utf-8")) <= 50
+    assert text.startswith(truncated)
+    assert truncate_utf8(text, 0) == text
+
+
+def test_cap_page_text_drops_the_cut_sentence():
+    text = "Primera frase completa. Segunda frase que no cabe entera en el tope."
+    assert cap_page_text(text, 40) == "Primera frase completa."
+    assert cap_page_text(text, 1000) == text
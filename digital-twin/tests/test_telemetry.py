@@ -0,0 +1,64 @@
+import asyncio
+import json
+import logging
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from telemetry import MetricsRegistry, REGISTRY, SPAN_SECONDS, request_id_var, span
+
+# --- Tests de la instrumentación (métricas y spans) ---
+
+def test_registry_renders_prometheus_text_format():
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "Contador de prueba.", ["kind"])
+    histogram = registry.histogram("demo_seconds", "Histograma de prueba.", ["stage"], buckets=(0.1, 1.0))
+    counter.inc(kind="a")
+    counter.inc(2, kind="a")
+    histogram.observe(0.05, stage="x")
+    histogram.observe(0.5, stage="x")
+    histogram.observe(5.0, stage="x")
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE demo_total counter" in lines
+    assert 'demo_total{kind="a"} 3' in lines
+    assert "# TYPE demo_seconds histogram" in lines
+    # Los buckets son acumulados y +Inf coincide con el número de observaciones.
+    assert 'demo_seconds_bucket{stage="x",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="x",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{stage="x",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{stage="x"} 3' in lines
+    assert 'demo_seconds_sum{stage="x"} 5.55' in lines
+
+
+def test_span_records_duration_status_and_request_id(caplog):
+    REGISTRY.clear()
+    token = request_id_var.set("req-42")
+    try:
+        with caplog.at_level(logging.INFO, logger="telemetry"):
+            with span("demo", story="STORY-1") as attributes:
+                attributes["cached"] = True
+            with pytest.raises(ValueError):
+                with span("demo"):
+                    raise ValueError("fallo")
+    finally:
+        request_id_var.reset(token)
+
+    assert SPAN_SECONDS.count(span="demo", status="ok") == 1
+    assert SPAN_SECONDS.count(span="demo", status="error") == 1
+    record = json.loads(caplog.records[0].getMessage())
+    assert record["request_id"] == "req-42"
+    assert record["story"] == "STORY-1" and record["cached"] is True
+
+
+@pytest.mark.asyncio
+async def test_request_id_is_isolated_between_concurrent_tasks():
+    async def handle(request_id):
+        request_id_var.set(request_id)
+        await asyncio.sleep(0.01)
+        return request_id_var.get()
+
+    assert await asyncio.gather(handle("a"), handle("b")) == ["a", "b"]
+    assert request_id_var.get() is None
@@ -0,0 +1,85 @@
+import json
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pd = pytest.importorskip("pandas")
+spacy = pytest.importorskip("spacy")
+pytest.importorskip("sklearn")
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import train
+from native_model import NativeEffortModel
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), '..', 'model', 'stories_dataset.csv')
+SMALL_GRID = {'model__estimator__n_estimators': [5, 10], 'model__estimator__max_depth': [2]}
+
+# --- Fixtures ---
+# spaCy en blanco no lematiza: se añade un componente que usa la forma en minúsculas como lema.
+
+@spacy.Language.component("identity_lemma")
+def identity_lemma(doc):
+    for token in doc:
+        token.lemma_ = token.lower_
+    return doc
+
+
+@pytest.fixture
+def lemmatizer_calls(monkeypatch):
+    calls = []
+
+    def fake_load():
+        calls.append(1)
+        nlp = spacy.blank("es")
+        nlp.add_pipe("identity_lemma")
+        return nlp
+
+    monkeypatch.setattr(train, "load_spacy_model", fake_load)
+    return calls
+
+
+@pytest.fixture
+def dataset_path(tmp_path):
+    path = tmp_path / "stories.csv"
+    pd.read_csv(DATASET_PATH).head(60).to_csv(path, index=False)
+    return str(path)
+
+# --- Tests ---
+
+def test_train_writes_versioned_model_metrics_and_native_artifact(dataset_path, lemmatizer_calls, tmp_path):
+    report = train.train(dataset_path=dataset_path, output_dir=str(tmp_path / "out"), cache_dir=str(tmp_path / "cache"),
+                         version="v1", param_grid=SMALL_GRID, folds=2, n_jobs=1, export_native=True,
+                         publish=str(tmp_path / "current"))
+
+    with open(tmp_path / "out" / "effort_model-v1.metrics.json") as f:
+        metrics = json.load(f)
+    assert metrics["dataset"]["rows"] == 60
+    assert metrics["candidates"] == 2
+    assert set(metrics["metrics"]["best_params"]) == set(SMALL_GRID)
+    assert metrics["metrics"]["cv_mae"] > 0
+    assert report["artifacts"]["joblib"].endswith("effort_model-v1.joblib")
+
+    # El artefacto publicado es el nativo y reproduce las predicciones del pipeline.
+    assert os.path.realpath(tmp_path / "current") == os.path.realpath(report["artifacts"]["native"])
+    assert NativeEffortModel.load(str(tmp_path / "current")).meta["numeric_columns"] == train.EXTRACTED_FEATURES
+
+
+def test_train_reuses_cached_corpus_and_fold_preprocessing(dataset_path, lemmatizer_calls, tmp_path, monkeypatch):
+    fits = []
+    original_fit_transform = TfidfVectorizer.fit_transform
+    monkeypatch.setattr(TfidfVectorizer, "fit_transform",
+                        lambda self, *args, **kwargs: fits.append(1) or original_fit_transform(self, *args, **kwargs))
+    options = dict(dataset_path=dataset_path, output_dir=str(tmp_path / "out"), cache_dir=str(tmp_path / "cache"),
+                   param_grid=SMALL_GRID, folds=2, n_jobs=1)
+
+    train.train(version="v1", **options)
+    # Un ajuste del preprocesador por fold (compartido por los 2 candidatos) más el reajuste final.
+    assert len(fits) == 2 + 1
+    assert len(lemmatizer_calls) == 1
+
+    train.train(version="v2", **options)
+    # Mismo dataset: no se vuelve a lematizar ni a ajustar el preprocesador.
+    assert len(lemmatizer_calls) == 1
+    assert len(fits) == 2 + 1
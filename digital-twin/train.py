@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import joblib
+import pandas as pd
+import sklearn
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import GridSearchCV, KFold
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from config import extract_features, EXTRACTED_FEATURES
+from prediction import SPACY_MODEL, file_fingerprint, lemmatize_docs, load_spacy_model
+
+# Reemplaza a model/notebook_grb.ipynb: mismo preprocesado, misma cuadrícula y mismo KFold.
+DATASET_PATH = 'model/stories_dataset.csv'
+TARGETS = ['effort', 'time']
+TEXT_COLUMN = 'full_text_lemmatized'
+
+PARAM_GRID = {
+    'model__estimator__n_estimators': [100, 150, 200],
+    'model__estimator__learning_rate': [0.05, 0.1],
+    'model__estimator__max_depth': [3, 4, 5]
+}
+
+def load_dataset(dataset_path: str) -> pd.DataFrame:
+    df = pd.read_csv(dataset_path)
+    missing = [col for col in ['id', 'title', 'gherkin'] + TARGETS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Columnas esenciales faltantes: {missing}")
+    if (df[TARGETS] < 0).any().any():
+        raise ValueError("Valores negativos encontrados en 'effort' o 'time'")
+    return df
+
+def _prepare_dataset(dataset_path: str, dataset_hash: str, spacy_model: str) -> pd.DataFrame:
+    # `dataset_hash` y `spacy_model` sólo forman parte de la clave de la caché de joblib.Memory:
+    # si cambia el CSV o el modelo de spaCy, el corpus se vuelve a lematizar.
+    df = extract_features(load_dataset(dataset_path))
+    df[TEXT_COLUMN] = lemmatize_docs(load_spacy_model(), df['full_text'].tolist())
+    return df
+
+def prepare_dataset(dataset_path: str, memory: joblib.Memory) -> tuple[pd.DataFrame, str]:
+    """Características y corpus lematizado del dataset, cacheados en disco por el hash del fichero."""
+    dataset_hash = file_fingerprint(dataset_path)
+    spacy_model = f"{SPACY_MODEL}-{_spacy_model_version()}"
+    cached = memory.cache(_prepare_dataset, ignore=['dataset_path'])
+    return cached(dataset_path, dataset_hash, spacy_model), dataset_hash
+
+def _spacy_model_version() -> str | None:
+    import spacy
+    return spacy.util.get_package_version(SPACY_MODEL)
+
+def build_pipeline(memory: joblib.Memory | None = None, include_numeric: bool = True) -> Pipeline:
+    transformers = [('text', TfidfVectorizer(max_features=500), TEXT_COLUMN)]
+    if include_numeric:
+        transformers.append(('numeric', StandardScaler(), EXTRACTED_FEATURES))
+    # Con `memory`, el preprocesador ajustado en cada fold se reutiliza entre todos los
+    # candidatos de la cuadrícula: sólo cambian los hiperparámetros del modelo.
+    return Pipeline(steps=[
+        ('preprocessor', ColumnTransformer(transformers=transformers, remainder='drop')),
+        ('model', MultiOutputRegressor(estimator=GradientBoostingRegressor(random_state=42)))
+    ], memory=memory)
+
+def train(dataset_path: str = DATASET_PATH, output_dir: str = 'model', cache_dir: str = '.cache/train',
+          version: str | None = None, param_grid: dict | None = None, folds: int = 10, n_jobs: int = -1,
+          baseline: bool = False, export_native: bool = False, publish: str | None = None) -> dict:
+    """
+    Entrena el modelo de esfuerzo con búsqueda de hiperparámetros y escribe
+    `effort_model-<versión>.joblib` (y opcionalmente el artefacto nativo) junto a sus métricas.
+    """
+    timings = {}
+    memory = joblib.Memory(cache_dir, verbose=0)
+
+    start = time.perf_counter()
+    df, dataset_hash = prepare_dataset(dataset_path, memory)
+    timings['prepare_seconds'] = time.perf_counter() - start
+
+    X = df[EXTRACTED_FEATURES + [TEXT_COLUMN]]
+    y = df[TARGETS]
+    cv = KFold(n_splits=folds, shuffle=True, random_state=42)
+    param_grid = param_grid or PARAM_GRID
+
+    metrics = {}
+    if baseline:
+        start = time.perf_counter()
+        search = GridSearchCV(build_pipeline(memory, include_numeric=False), param_grid, cv=cv,
+                              scoring='neg_mean_absolute_error', n_jobs=n_jobs)
+        search.fit(X, y)
+        metrics['baseline_cv_mae'] = -search.best_score_
+        timings['baseline_search_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    search = GridSearchCV(build_pipeline(memory), param_grid, cv=cv, scoring='neg_mean_absolute_error', n_jobs=n_jobs)
+    search.fit(X, y)
+    timings['search_seconds'] = time.perf_counter() - start
+
+    # El modelo final no se guarda con la caché de la búsqueda: debe poder cargarse en otra máquina.
+    best_model = search.best_estimator_.set_params(memory=None)
+    train_predictions = best_model.predict(X)
+    metrics.update({
+        'cv_mae': -search.best_score_,
+        'cv_mae_std': float(search.cv_results_['std_test_score'][search.best_index_]),
+        'best_params': search.best_params_,
+        'train_mae': {target: mean_absolute_error(y[target], train_predictions[:, i]) for i, target in enumerate(TARGETS)},
+        'train_r2': {target: r2_score(y[target], train_predictions[:, i]) for i, target in enumerate(TARGETS)},
+    })
+
+    version = version or f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{dataset_hash[:8]}"
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, f"effort_model-{version}.joblib")
+    joblib.dump(best_model, model_path)
+    artifacts = {'joblib': model_path}
+    if export_native:
+        from native_model import export_pipeline
+        artifacts['native'] = os.path.join(output_dir, f"effort_model-{version}.native")
+        export_pipeline(best_model, artifacts['native'])
+    if publish:
+        from native_model import publish_artifact
+        publish_artifact(artifacts.get('native', model_path), publish)
+
+    report = {
+        'version': version,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'dataset': {'path': dataset_path, 'sha256': dataset_hash, 'rows': len(df)},
+        'features': EXTRACTED_FEATURES,
+        'folds': folds,
+        'candidates': len(search.cv_results_['params']),
+        'metrics': metrics,
+        'timings': timings,
+        'artifacts': artifacts,
+        'versions': {'sklearn': sklearn.__version__, 'spacy_model': _spacy_model_version()},
+    }
+    with open(os.path.join(output_dir, f"effort_model-{version}.metrics.json"), 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Entrena el modelo de esfuerzo a partir del dataset de historias.")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--output-dir', default='model')
+    parser.add_argument('--cache-dir', default='.cache/train',
+                        help="Caché de corpus lematizado, características y preprocesadores ajustados.")
+    parser.add_argument('--version', help="Sufijo de los artefactos (por defecto, fecha UTC y hash del dataset).")
+    parser.add_argument('--folds', type=int, default=10)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--baseline', action='store_true', help="Evalúa también el modelo sólo con texto.")
+    parser.add_argument('--export-native', action='store_true', help="Exporta además el artefacto nativo (native_model.py).")
+    parser.add_argument('--publish', metavar='LINK', help="Symlink que se apunta atómicamente al nuevo modelo.")
+    args = parser.parse_args()
+
+    report = train(dataset_path=args.dataset, output_dir=args.output_dir, cache_dir=args.cache_dir,
+                   version=args.version, folds=args.folds, n_jobs=args.n_jobs, baseline=args.baseline,
+                   export_native=args.export_native, publish=args.publish)
+    print(json.dumps({key: report[key] for key in ('version', 'metrics', 'timings', 'artifacts')}, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()